@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class BloodConfig(AppConfig):
     name = 'blood'
+
+    def ready(self):
+        # Invalidate the cached admin dashboard on changes
+        from . import signals  # noqa: F401
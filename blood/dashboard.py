@@ -0,0 +1,80 @@
+"""
+Admin dashboard and blood stock figures
+Stock for every blood group comes from one query and the dashboard counts from
+another - a UNION ALL of one conditional aggregate per table, which returns a
+row even for an empty table. The dashboard reads them from a short-lived
+snapshot cached under the blood bank version counter, which stock, request,
+donation, donor, certificate, camp and sponsor changes bump
+"""
+
+import logging
+from django.conf import settings
+from django.db.models import Count, Q, Value
+from donor import models as dmodels
+from emergency.snapshot_cache import cached_snapshot
+from emergency.versions import BLOOD_BANK, get_versions
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# Template context names of each blood group's stock
+STOCK_KEYS = {
+    'A+': 'A1', 'A-': 'A2',
+    'B+': 'B1', 'B-': 'B2',
+    'AB+': 'AB1', 'AB-': 'AB2',
+    'O+': 'O1', 'O-': 'O2',
+}
+
+
+def stock_by_group():
+    """{'A1': {'unit': n}, ...} for every blood group, 0 units where no stock row exists"""
+    stock = {key: {'unit': 0} for key in STOCK_KEYS.values()}
+    for bloodgroup, unit in models.Stock.objects.values_list('bloodgroup', 'unit'):
+        if bloodgroup in STOCK_KEYS:
+            stock[STOCK_KEYS[bloodgroup]] = {'unit': unit}
+    return stock
+
+
+def _counts(name, queryset, matching=None):
+    return queryset.order_by().values(table=Value(name)).annotate(
+        total=Count('pk'), matching=Count('pk', filter=matching)
+    ).values_list('table', 'total', 'matching')
+
+
+def dashboard_counts():
+    """{table: (total, matching)} for the dashboard's counters, in one query"""
+    rows = _counts('donors', dmodels.Donor.objects.all()).union(
+        _counts('requests', models.BloodRequest.objects.all(), Q(status='Approved')),
+        _counts('certificates', models.Certificate.objects.all()),
+        _counts('camps', models.BloodCamp.objects.all(), Q(status='PLANNED')),
+        _counts('sponsors', models.Sponsor.objects.all(), Q(is_active=True)),
+        all=True,
+    )
+    return {table: (total, matching) for table, total, matching in rows}
+
+
+def build_dashboard():
+    stock = stock_by_group()
+    counts = dashboard_counts()
+    return {
+        **stock,
+        'totaldonors': counts['donors'][0],
+        'totalbloodunit': sum(group['unit'] for group in stock.values()),
+        'totalrequest': counts['requests'][0],
+        'totalapprovedrequest': counts['requests'][1],
+        'total_certificates': counts['certificates'][0],
+        'blood_camps_count': counts['camps'][1],
+        'sponsors_count': counts['sponsors'][1],
+    }
+
+
+def get_dashboard():
+    """The dashboard figures, rebuilt after a change or ADMIN_DASHBOARD_CACHE_SECONDS"""
+    try:
+        version, = get_versions(BLOOD_BANK)
+    except Exception as e:
+        logger.warning(f"Version counters unavailable, building the admin dashboard uncached: {e}")
+        return build_dashboard()
+    return cached_snapshot(
+        f"admin-dashboard:{version}", build_dashboard, getattr(settings, 'ADMIN_DASHBOARD_CACHE_SECONDS', 30)
+    )
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.16 on 2026-10-19 09:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0006_bloodrequest_latitude_bloodrequest_location_address_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(fields=['status', 'id'], name='blood_request_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(fields=['request_by_donor', 'id'], name='blood_request_donor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(fields=['request_by_patient', 'id'], name='blood_request_patient_idx'),
+        ),
+    ]
@@ -51,6 +51,14 @@ class BloodRequest(models.Model):
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     location_address = models.TextField(null=True, blank=True)
     
+    class Meta:
+        # Keyset-paginated lists: each filter walks its index in id order
+        indexes = [
+            models.Index(fields=['status', 'id'], name='blood_request_status_idx'),
+            models.Index(fields=['request_by_donor', 'id'], name='blood_request_donor_idx'),
+            models.Index(fields=['request_by_patient', 'id'], name='blood_request_patient_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.bloodgroup} - {self.unit} bags"
     
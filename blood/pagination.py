@@ -0,0 +1,144 @@
+"""
+Keyset (cursor) pagination for list views and list APIs
+Each page is read as "rows after the last one seen, in index order, LIMIT n+1",
+so it is an index range scan and page 1000 costs the same as page 1 - unlike
+OFFSET, which reads and discards every earlier row. Cursors are opaque tokens
+holding the ordering values of the row at the page boundary; the ordering must
+end in a unique field (normally id) so it is total and stable
+"""
+
+import base64
+import binascii
+import json
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import QueryDict
+
+
+def encode_cursor(values, direction='next'):
+    payload = json.dumps([direction, list(values)], cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(direction, values) for a cursor token, or None if it is missing or malformed"""
+    if not token:
+        return None
+    try:
+        direction, values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if direction not in ('next', 'previous') or not isinstance(values, list):
+        return None
+    return direction, values
+
+
+class KeysetPage:
+    """One page of rows plus the cursors to its neighbours"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, path='', query=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.path = path
+        self.query = query  # The request's other parameters (a QueryDict), kept in page links
+
+    def _link(self, cursor=None):
+        query = self.query.copy() if self.query is not None else QueryDict(mutable=True)
+        query.pop('cursor', None)
+        if cursor:
+            query['cursor'] = cursor
+        return f"{self.path}?{query.urlencode()}"
+
+    @property
+    def first_url(self):
+        return self._link()
+
+    @property
+    def next_url(self):
+        return self._link(self.next_cursor)
+
+    @property
+    def previous_url(self):
+        return self._link(self.previous_cursor)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def _parse_ordering(ordering):
+    return [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+
+def _after(fields, values):
+    """Q for rows strictly after values in the given (field, descending) order"""
+    condition = Q()
+    for i, (field, descending) in enumerate(fields):
+        step = Q(**{f"{field}__{'lt' if descending else 'gt'}": values[i]})
+        for j, (prior_field, _) in enumerate(fields[:i]):
+            step &= Q(**{prior_field: values[j]})
+        condition |= step
+    return condition
+
+
+def _row_values(row, fields):
+    if isinstance(row, dict):
+        return [row[field] for field, _ in fields]
+    return [getattr(row, field) for field, _ in fields]
+
+
+def keyset_paginate(queryset, ordering, cursor=None, per_page=None):
+    """
+    Fetch the page of queryset selected by a cursor token (the first page without one)
+    ordering is a sequence like ('-id',) or ('bloodgroup', 'id') ending in a unique field
+    """
+    per_page = per_page or getattr(settings, 'LIST_PAGE_SIZE', 50)
+    fields = _parse_ordering(ordering)
+    decoded = decode_cursor(cursor)
+    if decoded and len(decoded[1]) != len(fields):
+        decoded = None
+
+    if decoded and decoded[0] == 'previous':
+        # Walk backwards from the boundary, then restore display order
+        reversed_fields = [(field, not descending) for field, descending in fields]
+        rows = list(queryset.filter(_after(reversed_fields, decoded[1])).order_by(
+            *[f"{'-' if descending else ''}{field}" for field, descending in reversed_fields]
+        )[:per_page + 1])
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+    else:
+        if decoded:
+            queryset = queryset.filter(_after(fields, decoded[1]))
+        rows = list(queryset.order_by(*ordering)[:per_page + 1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_previous = decoded is not None
+
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(_row_values(rows[-1], fields)) if rows and has_next else None,
+        previous_cursor=encode_cursor(_row_values(rows[0], fields), 'previous') if rows and has_previous else None,
+    )
+
+
+def paginate_request(request, queryset, ordering, per_page=None):
+    """keyset_paginate with the cursor taken from the request's ?cursor= parameter"""
+    page = keyset_paginate(queryset, ordering, request.GET.get('cursor'), per_page)
+    page.path, page.query = request.path, request.GET
+    return page
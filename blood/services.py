@@ -1,8 +1,7 @@
 import math
-from django.conf import settings
-from django.core.mail import send_mail
+from emergency.outbox import stage_notification
 from django.template.loader import render_to_string
-from .models import Hospital, HospitalBloodStock
+from .models import Hospital
 import logging
 
 logger = logging.getLogger(__name__)
@@ -60,36 +59,13 @@ class SMSService:
     @staticmethod
     def send_sms(phone_number, message):
         """
-        Send SMS using Twilio (requires twilio package)
+        Stage an SMS in the notification outbox; it is sent once the transaction commits
         """
         try:
-            # Import twilio only when needed to avoid dependency issues
-            from twilio.rest import Client
-            
-            account_sid = settings.TWILIO_ACCOUNT_SID
-            auth_token = settings.TWILIO_AUTH_TOKEN
-            from_phone = settings.TWILIO_PHONE_NUMBER
-            
-            if not account_sid or not auth_token or not from_phone:
-                logger.warning("Twilio credentials not configured")
-                return False
-            
-            client = Client(account_sid, auth_token)
-            
-            message = client.messages.create(
-                body=message,
-                from_=from_phone,
-                to=phone_number
-            )
-            
-            logger.info(f"SMS sent successfully to {phone_number}: {message.sid}")
+            stage_notification(None, 'sms', 'SMS', phone_number, message)
             return True
-            
-        except ImportError:
-            logger.error("Twilio package not installed. Please install: pip install twilio")
-            return False
         except Exception as e:
-            logger.error(f"Failed to send SMS to {phone_number}: {str(e)}")
+            logger.error(f"Failed to queue SMS to {phone_number}: {str(e)}")
             return False
 
 class NotificationService:
@@ -138,14 +114,8 @@ Best regards,
 Blood Bank Management System
             """.strip()
             
-            send_mail(
-                subject=subject,
-                message=plain_message,
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
+            # Staged in the notification outbox and sent once the transaction commits
+            stage_notification(None, 'email', 'EMAIL', user.email, plain_message, subject=subject, html_message=html_message)
             
             # SMS notification if user has mobile number
             mobile_number = None
@@ -0,0 +1,22 @@
+"""
+Model signal handlers for the blood app
+"""
+
+from django.db.models.signals import post_delete, post_save
+from donor import models as dmodels
+from emergency.versions import BLOOD_BANK, bump_version
+from . import models
+
+DASHBOARD_MODELS = [
+    models.Stock, models.BloodRequest, dmodels.BloodDonate, dmodels.Donor,
+    models.Certificate, models.BloodCamp, models.Sponsor,
+]
+
+
+def blood_bank_changed(sender, **kwargs):
+    bump_version(BLOOD_BANK)
+
+
+for model in DASHBOARD_MODELS:
+    post_save.connect(blood_bank_changed, sender=model)
+    post_delete.connect(blood_bank_changed, sender=model)
@@ -0,0 +1,60 @@
+"""
+Tests for the admin dashboard snapshot
+"""
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from .dashboard import get_dashboard, stock_by_group
+from .models import BloodCamp, BloodRequest, Sponsor, Stock
+
+
+class AdminDashboardTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        for bloodgroup, unit in [('A+', 4), ('O-', 2), ('B+', 0)]:
+            Stock.objects.create(bloodgroup=bloodgroup, unit=unit)
+        BloodRequest.objects.create(bloodgroup='A+', unit=1, status='Approved')
+        BloodRequest.objects.create(bloodgroup='O-', unit=1)
+        Sponsor.objects.create(name='Active', is_active=True)
+        Sponsor.objects.create(name='Former', is_active=False)
+
+    def test_dashboard_is_built_in_two_queries_and_then_cached(self):
+        with self.assertNumQueries(2):
+            dashboard = get_dashboard()
+        self.assertEqual(dashboard['A1'], {'unit': 4})
+        self.assertEqual(dashboard['AB2'], {'unit': 0})  # No stock row yet
+        self.assertEqual(dashboard['totalbloodunit'], 6)
+        self.assertEqual((dashboard['totalrequest'], dashboard['totalapprovedrequest']), (2, 1))
+        self.assertEqual(dashboard['sponsors_count'], 1)
+        self.assertEqual((dashboard['totaldonors'], dashboard['blood_camps_count']), (0, 0))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dashboard(), dashboard)
+
+    def test_changes_rebuild_the_dashboard(self):
+        get_dashboard()
+        with self.captureOnCommitCallbacks(execute=True):
+            stock = Stock.objects.get(bloodgroup='O-')
+            stock.unit = 10
+            stock.save()
+        self.assertEqual(get_dashboard()['O2'], {'unit': 10})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BloodCamp.objects.create(
+                name='Camp', description='Camp', organizer='NSS', venue='Hall', address='Parel',
+                city='Mumbai', state='MH', start_date='2026-11-01', end_date='2026-11-01',
+                start_time='09:00', end_time='17:00',
+            )
+        self.assertEqual(get_dashboard()['blood_camps_count'], 1)
+
+    def test_stock_pages_read_stock_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(stock_by_group()['O2'], {'unit': 2})
+
+        self.client.force_login(User.objects.create_user('admin', password='pw'))
+        response = self.client.get(reverse('admin-dashboard'))
+        self.assertContains(response, '<h4>6</h4>')
+        response = self.client.get(reverse('admin-blood'))
+        self.assertEqual(response.context['A1'], {'unit': 4})
@@ -0,0 +1,86 @@
+"""
+Tests for keyset pagination of the list views
+"""
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from .models import BloodRequest, Stock
+from .pagination import decode_cursor, keyset_paginate
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        for i in range(7):
+            BloodRequest.objects.create(bloodgroup='O+', unit=i + 1, status='Pending' if i % 2 else 'Approved')
+        self.ids = list(BloodRequest.objects.order_by('-id').values_list('id', flat=True))
+
+    def test_pages_walk_forward_and_back(self):
+        queryset = BloodRequest.objects.all()
+        first = keyset_paginate(queryset, ('-id',), per_page=3)
+        self.assertEqual([r.id for r in first], self.ids[:3])
+        self.assertFalse(first.has_previous)
+
+        second = keyset_paginate(queryset, ('-id',), first.next_cursor, per_page=3)
+        third = keyset_paginate(queryset, ('-id',), second.next_cursor, per_page=3)
+        self.assertEqual([r.id for r in second], self.ids[3:6])
+        self.assertEqual([r.id for r in third], self.ids[6:])
+        self.assertFalse(third.has_next)
+
+        back = keyset_paginate(queryset, ('-id',), third.previous_cursor, per_page=3)
+        self.assertEqual([r.id for r in back], self.ids[3:6])
+        self.assertTrue(back.has_next)
+        back = keyset_paginate(queryset, ('-id',), back.previous_cursor, per_page=3)
+        self.assertEqual([r.id for r in back], self.ids[:3])
+        self.assertFalse(back.has_previous)
+
+    def test_new_rows_do_not_shift_later_pages(self):
+        first = keyset_paginate(BloodRequest.objects.all(), ('-id',), per_page=3)
+        BloodRequest.objects.create(bloodgroup='A+', unit=1)
+        second = keyset_paginate(BloodRequest.objects.all(), ('-id',), first.next_cursor, per_page=3)
+        self.assertEqual([r.id for r in second], self.ids[3:6])
+
+    def test_multi_column_ordering(self):
+        page = keyset_paginate(BloodRequest.objects.all(), ('status', '-id'), per_page=4)
+        rest = keyset_paginate(BloodRequest.objects.all(), ('status', '-id'), page.next_cursor, per_page=4)
+        expected = list(BloodRequest.objects.order_by('status', '-id').values_list('id', flat=True))
+        self.assertEqual([r.id for r in page] + [r.id for r in rest], expected)
+
+    def test_malformed_cursor_starts_from_the_first_page(self):
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        page = keyset_paginate(BloodRequest.objects.all(), ('-id',), 'not-a-cursor', per_page=3)
+        self.assertEqual([r.id for r in page], self.ids[:3])
+
+    @override_settings(LIST_PAGE_SIZE=2)
+    def test_admin_request_view_is_paginated(self):
+        admin = User.objects.create_user('admin', password='pw', is_staff=True)
+        self.client.force_login(admin)
+        pending = list(BloodRequest.objects.filter(status='Pending').order_by('-id').values_list('id', flat=True))
+
+        response = self.client.get(reverse('admin-request'))
+        page = response.context['requests']
+        self.assertEqual([r.id for r in page], pending[:2])
+        self.assertContains(response, f'?cursor={page.next_cursor}')
+
+        response = self.client.get(reverse('admin-request'), {'cursor': page.next_cursor})
+        self.assertEqual([r.id for r in response.context['requests']], pending[2:])
+
+    @override_settings(LIST_PAGE_SIZE=2)
+    def test_page_links_keep_the_path_and_other_parameters(self):
+        self.client.force_login(User.objects.create_user('admin', password='pw', is_staff=True))
+        response = self.client.get(reverse('admin-request'), {'q': 'O+'})
+        page = response.context['requests']
+        self.assertEqual(page.next_url, f"/admin-request?q=O%2B&cursor={page.next_cursor}")
+        self.assertEqual(
+            keyset_paginate(BloodRequest.objects.all(), ('-id',), page.next_cursor, per_page=2).first_url, '?'
+        )
+
+    def test_approving_redirects_instead_of_rendering_the_list(self):
+        Stock.objects.create(bloodgroup='O+', unit=10)
+        request = BloodRequest.objects.filter(status='Pending').first()
+        self.client.force_login(User.objects.create_user('admin', password='pw', is_staff=True))
+
+        response = self.client.get(reverse('update-approve-status', args=[request.pk]), follow=True)
+        self.assertRedirects(response, reverse('admin-request'))
+        self.assertContains(response, f'{request.unit} bags of O+ blood allocated')
+        self.assertEqual(Stock.objects.get(bloodgroup='O+').unit, 10 - request.unit)
@@ -1,6 +1,6 @@
 from django.shortcuts import render,redirect,reverse
 from . import forms,models
-from django.db.models import Sum,Q
+from django.db.models import Q
 from django.contrib.auth.models import Group
 from django.http import HttpResponseRedirect, HttpResponse
 from django.contrib.auth.decorators import login_required,user_passes_test
@@ -15,6 +15,9 @@ from patient import forms as pforms
 from django.template.loader import render_to_string
 from django.contrib import messages
 from io import BytesIO
+from .pagination import paginate_request
+from .dashboard import get_dashboard, stock_by_group
+from emergency.page_cache import cache_anonymous_page
 
 # Optional imports for PDF generation
 try:
@@ -40,6 +43,7 @@ def privacy_view(request):
     """View function for Privacy Policy page"""
     return render(request, 'blood/privacy.html')
 
+@cache_anonymous_page('home')
 def home_view(request):
     x=models.Stock.objects.all()
     if len(x)==0:
@@ -105,46 +109,17 @@ def afterlogin_view(request):
 
 @login_required(login_url='adminlogin')
 def admin_dashboard_view(request):
-    totalunit=models.Stock.objects.aggregate(Sum('unit'))
-    
     # Get recent certificates for notifications
     recent_certificates = models.Certificate.objects.filter(
         issued_date__gte=date.today() - timedelta(days=7)
     ).order_by('-issued_date')[:5]
     
-    dict={
-        'A1':models.Stock.objects.get(bloodgroup="A+"),
-        'A2':models.Stock.objects.get(bloodgroup="A-"),
-        'B1':models.Stock.objects.get(bloodgroup="B+"),
-        'B2':models.Stock.objects.get(bloodgroup="B-"),
-        'AB1':models.Stock.objects.get(bloodgroup="AB+"),
-        'AB2':models.Stock.objects.get(bloodgroup="AB-"),
-        'O1':models.Stock.objects.get(bloodgroup="O+"),
-        'O2':models.Stock.objects.get(bloodgroup="O-"),
-        'totaldonors':dmodels.Donor.objects.all().count(),
-        'totalbloodunit':totalunit['unit__sum'],
-        'totalrequest':models.BloodRequest.objects.all().count(),
-        'totalapprovedrequest':models.BloodRequest.objects.all().filter(status='Approved').count(),
-        'recent_certificates': recent_certificates,
-        'total_certificates': models.Certificate.objects.count(),
-        'blood_camps_count': models.BloodCamp.objects.filter(status='PLANNED').count(),
-        'sponsors_count': models.Sponsor.objects.filter(is_active=True).count(),
-    }
+    # Stock and counts come from a cached snapshot (two queries when rebuilt)
+    dict={**get_dashboard(),'recent_certificates':recent_certificates}
     return render(request,'blood/admin_dashboard.html',context=dict)
 
 @login_required(login_url='adminlogin')
 def admin_blood_view(request):
-    dict={
-        'bloodForm':forms.BloodForm(),
-        'A1':models.Stock.objects.get(bloodgroup="A+"),
-        'A2':models.Stock.objects.get(bloodgroup="A-"),
-        'B1':models.Stock.objects.get(bloodgroup="B+"),
-        'B2':models.Stock.objects.get(bloodgroup="B-"),
-        'AB1':models.Stock.objects.get(bloodgroup="AB+"),
-        'AB2':models.Stock.objects.get(bloodgroup="AB-"),
-        'O1':models.Stock.objects.get(bloodgroup="O+"),
-        'O2':models.Stock.objects.get(bloodgroup="O-"),
-    }
     if request.method=='POST':
         bloodForm=forms.BloodForm(request.POST)
         if bloodForm.is_valid() :        
@@ -153,12 +128,14 @@ def admin_blood_view(request):
             stock.unit=bloodForm.cleaned_data['unit']
             stock.save()
         return HttpResponseRedirect('admin-blood')
+    # Read live rather than from the dashboard snapshot, since this page edits it
+    dict={'bloodForm':forms.BloodForm(), **stock_by_group()}
     return render(request,'blood/admin_blood.html',context=dict)
 
 
 @login_required(login_url='adminlogin')
 def admin_donor_view(request):
-    donors=dmodels.Donor.objects.all()
+    donors=paginate_request(request,dmodels.Donor.objects.select_related('user'),('id',))
     return render(request,'blood/admin_donor.html',{'donors':donors})
 
 @login_required(login_url='adminlogin')
@@ -195,7 +172,7 @@ def delete_donor_view(request,pk):
 
 @login_required(login_url='adminlogin')
 def admin_patient_view(request):
-    patients=pmodels.Patient.objects.all()
+    patients=paginate_request(request,pmodels.Patient.objects.select_related('user'),('id',))
     return render(request,'blood/admin_patient.html',{'patients':patients})
 
 
@@ -233,23 +210,22 @@ def delete_patient_view(request,pk):
 
 @login_required(login_url='adminlogin')
 def admin_request_view(request):
-    requests=models.BloodRequest.objects.all().filter(status='Pending')
+    requests=paginate_request(request,models.BloodRequest.objects.filter(status='Pending'),('-id',))
     return render(request,'blood/admin_request.html',{'requests':requests})
 
 @login_required(login_url='adminlogin')
 def admin_request_history_view(request):
-    requests=models.BloodRequest.objects.all().exclude(status='Pending')
+    requests=paginate_request(request,models.BloodRequest.objects.exclude(status='Pending'),('-id',))
     return render(request,'blood/admin_request_history.html',{'requests':requests})
 
 @login_required(login_url='adminlogin')
 def admin_donation_view(request):
-    donations=dmodels.BloodDonate.objects.all()
+    donations=paginate_request(request,dmodels.BloodDonate.objects.select_related('donor__user'),('-id',))
     return render(request,'blood/admin_donation.html',{'donations':donations})
 
 @login_required(login_url='adminlogin')
 def update_approve_status_view(request,pk):
     req=models.BloodRequest.objects.get(id=pk)
-    message=None
     bloodgroup=req.bloodgroup
     unit=req.unit  # Now in bags
     stock=models.Stock.objects.get(bloodgroup=bloodgroup)
@@ -259,11 +235,10 @@ def update_approve_status_view(request,pk):
         req.status="Approved"
         messages.success(request, f'Blood request approved! {unit} bags of {bloodgroup} blood allocated.')
     else:
-        message="Stock Does Not Have Enough Blood To Approve This Request, Only "+str(stock.unit)+" Bags Available"
+        messages.error(request, "Stock Does Not Have Enough Blood To Approve This Request, Only "+str(stock.unit)+" Bags Available")
     req.save()
-
-    requests=models.BloodRequest.objects.all().filter(status='Pending')
-    return render(request,'blood/admin_request.html',{'requests':requests,'message':message})
+    # Redirect so reloading or paging the list can't approve the request again
+    return HttpResponseRedirect('/admin-request')
 
 @login_required(login_url='adminlogin')
 def update_reject_status_view(request,pk):
@@ -13,4 +13,19 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bloodbankmanagement.settings')
 
-application = get_asgi_application()
+# Initialise Django before importing consumers, which touch the ORM
+django_asgi_app = get_asgi_application()
+
+from emergency.jobs import start_local_timer  # noqa: E402
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+from emergency.routing import websocket_urlpatterns  # noqa: E402
+
+application = ProtocolTypeRouter({
+    'http': django_asgi_app,
+    'websocket': AllowedHostsOriginValidator(URLRouter(websocket_urlpatterns)),
+})
+
+# Run delayed and retried jobs in this process when no job worker is deployed
+start_local_timer()
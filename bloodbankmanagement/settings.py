@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
+import logging
 import os
+import tempfile
 from pathlib import Path
 
 # Load environment variables from .env file
@@ -59,6 +61,7 @@ ALLOWED_HOSTS = [
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',  # ASGI runserver so WebSocket push works in development
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -76,6 +79,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # For serving static files in production
+    'emergency.compression.CompressionMiddleware',  # gzip, or brotli for JSON APIs when installed
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -95,13 +99,20 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATE_DIR,],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compiled templates are kept per process instead of re-parsed on
+            # every render (the multi-thousand-line public pages especially)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -240,12 +251,36 @@ CSRF_COOKIE_AGE = 86400
 
 # Blood Bank Specific Settings
 BLOOD_BAG_TO_ML_RATIO = 350  # 1 bag = 350ml by default
+LIST_PAGE_SIZE = 50  # rows per page on keyset-paginated list views
 
 # Twilio SMS Configuration
 TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID', '')
 TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN', '')
 TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER', '')
 
+# Shared Twilio client (emergency/twilio_client.py) - pooled keep-alive HTTPS session
+TWILIO_HTTP_POOL_SIZE = 10
+TWILIO_HTTP_MAX_RETRIES = 1
+TWILIO_CONNECT_TIMEOUT = 3.05  # seconds
+TWILIO_READ_TIMEOUT = 10  # seconds
+TWILIO_WARM_ON_START = os.environ.get('TWILIO_WARM_ON_START', 'True').lower() == 'true'
+
+# SMS provider routing - providers are tried healthiest first, failing over on error
+SMS_PROVIDERS = [name.strip() for name in os.environ.get('SMS_PROVIDERS', 'twilio,fast2sms,msg91').split(',') if name.strip()]
+FAST2SMS_API_KEY = os.environ.get('FAST2SMS_API_KEY', '')
+FAST2SMS_API_URL = os.environ.get('FAST2SMS_API_URL', 'https://www.fast2sms.com/dev/bulkV2')
+MSG91_AUTH_KEY = os.environ.get('MSG91_AUTH_KEY', '')
+MSG91_API_URL = os.environ.get('MSG91_API_URL', 'https://api.msg91.com/api/sendhttp.php')
+MSG91_SENDER_ID = os.environ.get('MSG91_SENDER_ID', 'MSGIND')
+SMS_HTTP_CONNECT_TIMEOUT = 3.05  # seconds
+SMS_HTTP_READ_TIMEOUT = 10  # seconds
+SMS_PROVIDER_HEALTH_WINDOW = 50  # recent sends scored per provider
+SMS_PROVIDER_HEALTH_TTL = 300  # seconds before old samples stop counting
+SMS_CIRCUIT_FAILURE_THRESHOLD = 3  # consecutive failures before a provider is skipped
+SMS_CIRCUIT_RESET_TIMEOUT = 300  # seconds before a half-open probe is allowed
+SMS_STATUS_BATCH_SIZE = 200  # delivery callbacks applied per bulk update
+SMS_STATUS_BATCH_LINGER = 1.0  # seconds callbacks wait to be applied together
+
 # Emergency System Configuration
 EMERGENCY_NOTIFICATION_PHONE = os.environ.get('EMERGENCY_NOTIFICATION_PHONE', '')
 SIMULATE_SMS = os.environ.get('SIMULATE_SMS', 'True').lower() == 'true'
@@ -297,6 +332,11 @@ EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', 'your-app-password')
 # For production, configure these in Vercel environment variables
 EMAIL_RECEIVING_USER = [os.environ.get('EMAIL_RECEIVING_USER', 'admin@yourdomain.com')]  # Configure with your admin email
 
+# Pooled SMTP delivery - connections are reused across emails and recycled when idle
+EMAIL_TIMEOUT = 10  # seconds
+EMAIL_POOL_SIZE = 2
+EMAIL_POOL_MAX_IDLE = 60  # seconds; Gmail drops idle SMTP sessions after a few minutes
+
 # CORS Configuration for Emergency API
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -316,17 +356,194 @@ REST_FRAMEWORK = {
 }
 
 # Channels Configuration for WebSocket
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+# The in-memory layer only reaches clients on the same process; set REDIS_URL so
+# status and inventory pushes from job workers reach every web worker
+REDIS_URL = os.environ.get('REDIS_URL', '')
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [REDIS_URL],
+            },
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
+
+# ASGI workers started by gunicorn (the deploy configs default to 3). Each has its
+# own in-memory channel layer, so without REDIS_URL a push only reaches the clients
+# of the worker that sent it; pages fall back to polling for the rest
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', '1'))
+if WEB_CONCURRENCY > 1 and not REDIS_URL:
+    logging.getLogger(__name__).warning(
+        f"WEB_CONCURRENCY={WEB_CONCURRENCY} without REDIS_URL: using the in-memory channel layer, "
+        "so live updates only reach clients on the same worker"
+    )
+
+# Cache - shared through Redis when available, otherwise per process
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'shared',
+        },
     }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        # Without Redis the workers on a host still share this tier through files.
+        # Its add() isn't atomic, so two workers may occasionally repeat a lookup
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('SHARED_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'bloodbank-cache')),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+    }
+
+# Slow external lookups (geocoding, IP location): a per-process LRU in front of the
+# shared tier, so every worker reuses a result and it survives restarts. Entries
+# take their namespace's timeout; local copies are kept at most LOCAL_TIMEOUT seconds
+LOOKUP_CACHE_TIMEOUTS = {
+    'ip-location': 3600,
+    'geocode': 86400,
+    'reverse-geocode': 86400,
+}
+CACHES['lookups'] = {
+    'BACKEND': 'emergency.tiered_cache.TieredCache',
+    'LOCATION': 'lookups',
+    'TIMEOUT': 3600,
+    'OPTIONS': {
+        'SHARED': 'shared',
+        'MAX_ENTRIES': 2000,
+        'LOCAL_TIMEOUT': 300,
+        'TIMEOUTS': LOOKUP_CACHE_TIMEOUTS,
+    },
 }
 
+# ETag/304 on polling endpoints from version counters kept in the cache. Needs a
+# cache shared by every process that writes data, so it follows REDIS_URL by default
+CONDITIONAL_GET_ENABLED = os.environ.get('CONDITIONAL_GET_ENABLED', str(bool(REDIS_URL))).lower() == 'true'
+# Per-request counters expire this long after they are created; the shared
+# inventory and city counters never expire
+REQUEST_VERSION_TTL_SECONDS = 86400
+
+# Live inventory snapshots are cached until a stock change bumps the version counters.
+# A per-process cache can't see other workers' bumps, so it keeps them only briefly
+INVENTORY_CACHE_SECONDS = 300 if REDIS_URL else 15
+INVENTORY_PAGE_SIZE = 100  # hospitals per live-inventory API page (?limit= up to the max)
+INVENTORY_MAX_PAGE_SIZE = 500
+
+# Brotli level for compressed JSON responses (0-11); mid levels trade little size for much less CPU
+BROTLI_QUALITY = 5
+
+# Polled dashboard snapshots: after the TTL one caller recomputes while the rest
+# are served the previous snapshot for up to the grace period
+STAKEHOLDER_ANALYTICS_CACHE_SECONDS = 30
+SNAPSHOT_STALE_GRACE_SECONDS = 60
+SNAPSHOT_LOCK_TIMEOUT_SECONDS = 30  # a crashed recompute releases the lock after this
+SNAPSHOT_LOCK_WAIT_SECONDS = 5  # how long a cold-cache caller waits for another's recompute
+ADMIN_DASHBOARD_CACHE_SECONDS = 30  # also rebuilt as soon as stock, requests or donations change
+
+# Public pages are served to anonymous visitors from a rendered copy. Pages built from
+# inventory data are keyed by its version counters and, like the snapshots, kept only
+# briefly without a shared cache; pages without data are kept longer
+PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', 'True').lower() == 'true'
+PAGE_CACHE_SECONDS = 300 if REDIS_URL else 15
+STATIC_PAGE_CACHE_SECONDS = 600
+CACHE_STATS_ENABLED = True  # hit/miss counters behind the cache-metrics endpoint
+
 # Emergency System Settings
 EMERGENCY_SEARCH_RADIUS_KM = 25  # Default search radius in kilometers
 MAX_EMERGENCY_RESULTS = 10  # Maximum hospitals to show in emergency
 EMERGENCY_NOTIFICATION_FROM = 'noreply@bloodbankemergency.com'
 
+# Background processing of emergency requests (search + notifications run off the request path)
+EMERGENCY_BACKGROUND_WORKERS = int(os.environ.get('EMERGENCY_BACKGROUND_WORKERS', '4'))
+EMERGENCY_PROCESS_INLINE = os.environ.get('EMERGENCY_PROCESS_INLINE', 'False').lower() == 'true'
+EMERGENCY_COALESCE_WINDOW_SECONDS = 600  # repeat requests from the same phone and blood group attach to the open one
+
+# Token-bucket rate limits for the public endpoints (see emergency/ratelimit.py)
+# 'N/period' allows bursts of N, refilled at N per period; each identity has its
+# own bucket. A route can add a 'critical' budget for requests its urgency
+# resolver classes as CRITICAL. Buckets are kept in Redis when REDIS_URL is set and in the
+# database otherwise
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+# Number of reverse proxies in front of the app that append to X-Forwarded-For.
+# 0 trusts only REMOTE_ADDR, so clients can't pick their own IP bucket
+RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXY_COUNT', '0'))
+RATE_LIMITS = {
+    'emergency_request': {'ip': '20/m', 'phone': '5/m', 'session': '10/m'},
+    # Every quick request is stored as CRITICAL, so it only has the critical budget
+    'quick_request': {'ip': '60/m', 'phone': '20/m', 'session': '30/m'},
+    # Every webhook comes from Twilio's IPs, so only the sender's number is limited
+    'sms_webhook': {'phone': '5/m'},
+    'chat': {'ip': '30/m', 'session': '20/m'},
+}
+
+# Database-backed job queue (see emergency/jobs.py, run workers with `manage.py run_job_worker`)
+JOB_QUEUE_MAX_ATTEMPTS = int(os.environ.get('JOB_QUEUE_MAX_ATTEMPTS', '5'))
+JOB_QUEUE_RETRY_BASE_SECONDS = 5  # Backoff doubles per attempt from this base
+JOB_QUEUE_RETRY_MAX_SECONDS = 900
+JOB_QUEUE_STALE_AFTER_SECONDS = 300  # Requeue RUNNING jobs whose worker went silent
+# Web processes also drain the queue so no separate worker is required
+JOB_QUEUE_RUN_IN_WEB = os.environ.get('JOB_QUEUE_RUN_IN_WEB', 'True').lower() == 'true'
+JOB_QUEUE_LOCAL_BATCH = 10
+# Each web process's job timer sleeps until the next delayed job or retry falls
+# due, rechecking at least this often for jobs queued by other processes
+JOB_QUEUE_TIMER_MAX_SLEEP = 30
+JOB_QUEUE_PRIORITY_WORKERS = 1  # In-process runners reserved for CRITICAL requests
+
+# Urgency-aware scheduling: each priority point is worth JOB_PRIORITY_AGING_SECONDS
+# of waiting, so CRITICAL requests start ~10 minutes ahead of ROUTINE ones but
+# a ROUTINE request never waits behind newer ones for longer than that
+JOB_PRIORITY_AGING_SECONDS = 30
+EMERGENCY_URGENCY_PRIORITIES = {'CRITICAL': 20, 'URGENT': 10, 'ROUTINE': 0}
+EMERGENCY_ROUTINE_DEFER_DEPTH = 20  # ready jobs waiting before ROUTINE requests are held back
+EMERGENCY_ROUTINE_DEFER_SECONDS = 60
+
+# Follow-up SMS after a request: (minutes after creation, message type). Timers are
+# fired by the scheduler in `manage.py run_job_worker` and, with FOLLOW_UP_TIMERS_IN_WEB,
+# in each web process; the claim on each timer keeps them from firing twice
+# (see emergency/followups.py)
+EMERGENCY_FOLLOW_UPS = [(15, 'update'), (30, 'reminder')]
+FOLLOW_UP_TIMERS_IN_WEB = JOB_QUEUE_RUN_IN_WEB
+FOLLOW_UP_MAX_LATENESS_SECONDS = 600  # older timers (e.g. after downtime) are skipped, not sent
+FOLLOW_UP_WHEEL_TICK_SECONDS = 1.0
+FOLLOW_UP_WHEEL_SLOTS = 600  # wheel spans slots x tick = 10 minutes of upcoming timers
+FOLLOW_UP_REFILL_SECONDS = 30  # how often timers due within the wheel's span are loaded
+
+# Notification fan-out: channels are sent concurrently, each with its own deadline (seconds)
+NOTIFICATION_FANOUT_CONCURRENT = os.environ.get('NOTIFICATION_FANOUT_CONCURRENT', 'True').lower() == 'true'
+NOTIFICATION_FANOUT_WORKERS = 8
+NOTIFICATION_CHANNEL_TIMEOUTS = {
+    'sms': 10,
+    'admin_sms': 10,
+    'sms_reply': 10,
+    'follow_up': 10,
+    'email': 15,
+    'email_batch': 60,  # every ready email, sent over one SMTP connection
+}
+
+# Notification outbox: notifications are staged with the request's state change
+# and sent by the 'emergency.dispatch_outbox' job
+OUTBOX_BATCH_SIZE = 50  # capped at NOTIFICATION_FANOUT_WORKERS per batch
+OUTBOX_EMAIL_BATCH_SIZE = 50  # emails sent together over one pooled SMTP connection
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_CLAIM_TIMEOUT_SECONDS = 120  # claims older than this are assumed abandoned and sent again
+OUTBOX_MAX_BATCHES_PER_RUN = 20
+
 # Geospatial Database Configuration (if using PostGIS)
 if os.environ.get('USE_POSTGIS') == 'true':
     DATABASES['default']['ENGINE'] = 'django.contrib.gis.db.backends.postgis'
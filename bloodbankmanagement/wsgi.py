@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bloodbankmanagement.settings')
 
 application = get_wsgi_application()
+
+from emergency.jobs import start_local_timer  # noqa: E402
+
+# Run delayed and retried jobs in this process when no job worker is deployed
+start_local_timer()
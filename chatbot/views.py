@@ -17,6 +17,7 @@ except ImportError:
     genai = None
 from .models import ChatSession, ChatMessage
 from .forms import ChatMessageForm
+from emergency.ratelimit import no_urgency, rate_limit
 import logging
 
 # Configure logging
@@ -43,6 +44,7 @@ class ChatbotView(View):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('chat', urgency=no_urgency)
 def chat_api(request):
     """API endpoint for chat messages"""
     try:
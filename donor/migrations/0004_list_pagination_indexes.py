@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-19 09:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donor', '0003_donor_aadhaar_number'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blooddonate',
+            index=models.Index(fields=['donor', 'id'], name='blood_donate_donor_idx'),
+        ),
+    ]
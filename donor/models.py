@@ -30,5 +30,8 @@ class BloodDonate(models.Model):
     unit=models.PositiveIntegerField(default=0)
     status=models.CharField(max_length=20,default="Pending")
     date=models.DateField(auto_now=True)
+    class Meta:
+        # Donation history is keyset-paginated per donor in id order
+        indexes=[models.Index(fields=['donor','id'],name='blood_donate_donor_idx')]
     def __str__(self):
         return self.donor
\ No newline at end of file
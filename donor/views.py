@@ -10,6 +10,7 @@ from django.core.mail import send_mail
 from django.contrib.auth.models import User
 from blood import forms as bforms
 from blood import models as bmodels
+from blood.pagination import paginate_request
 from django.contrib.auth import authenticate, login
 
 def donor_signup_view(request):
@@ -64,8 +65,9 @@ def donate_blood_view(request):
 
 def donation_history_view(request):
     donor= models.Donor.objects.get(user_id=request.user.id)
-    donations=models.BloodDonate.objects.all().filter(donor=donor)
-    return render(request,'donor/donation_history.html',{'donations':donations})
+    donations=models.BloodDonate.objects.filter(donor=donor)
+    page=paginate_request(request,donations,('-id',))
+    return render(request,'donor/donation_history.html',{'donations':page,'donation_count':donations.count()})
 
 def make_request_view(request):
     request_form=bforms.RequestForm()
@@ -82,5 +84,6 @@ def make_request_view(request):
 
 def request_history_view(request):
     donor= models.Donor.objects.get(user_id=request.user.id)
-    blood_request=bmodels.BloodRequest.objects.all().filter(request_by_donor=donor)
-    return render(request,'donor/request_history.html',{'blood_request':blood_request})
+    blood_request=bmodels.BloodRequest.objects.filter(request_by_donor=donor)
+    page=paginate_request(request,blood_request,('-id',))
+    return render(request,'donor/request_history.html',{'blood_request':page,'request_count':blood_request.count()})
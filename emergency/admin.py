@@ -6,7 +6,10 @@ from .models import (
     EmergencyBloodStock, 
     EmergencyRequest, 
     EmergencyNotification,
-    EmergencyAnalytics
+    EmergencyAnalytics,
+    BackgroundJob,
+    InboundSMS,
+    FollowUpTimer
 )
 
 @admin.register(EmergencyHospital)
@@ -56,7 +59,7 @@ class EmergencyRequestAdmin(admin.ModelAdmin):
     list_display = ['request_id', 'blood_group', 'quantity_needed', 'status', 'urgency', 'notification_status', 'created_at']
     list_filter = ['status', 'urgency', 'blood_group', 'notification_sent', 'created_at']
     search_fields = ['request_id', 'contact_phone', 'contact_email', 'contact_name']
-    readonly_fields = ['request_id', 'created_at', 'updated_at', 'ip_address', 'user_agent']
+    readonly_fields = ['request_id', 'created_at', 'updated_at', 'ip_address', 'user_agent', 'notification_results', 'idempotency_key', 'duplicate_count', 'searching_at', 'found_at', 'notified_at', 'failed_at', 'stage_timings']
     
     fieldsets = (
         ('Request Information', {
@@ -69,14 +72,14 @@ class EmergencyRequestAdmin(admin.ModelAdmin):
             'fields': ('contact_name', 'contact_phone', 'contact_email')
         }),
         ('System Information', {
-            'fields': ('ip_address', 'user_agent', 'session_id'),
+            'fields': ('ip_address', 'user_agent', 'session_id', 'idempotency_key', 'duplicate_count'),
             'classes': ['collapse']
         }),
         ('Status Tracking', {
-            'fields': ('notification_sent', 'sms_sent', 'email_sent', 'completed_at')
+            'fields': ('notification_sent', 'sms_sent', 'email_sent', 'notification_results', 'completed_at')
         }),
         ('Timestamps', {
-            'fields': ('created_at', 'updated_at'),
+            'fields': ('created_at', 'searching_at', 'found_at', 'notified_at', 'failed_at', 'updated_at', 'stage_timings'),
             'classes': ['collapse']
         }),
         ('Notes', {
@@ -98,25 +101,36 @@ class EmergencyRequestAdmin(admin.ModelAdmin):
     
     notification_status.short_description = 'Notifications'
     
+    def stage_timings(self, obj):
+        latencies = obj.stage_latencies()
+        if not latencies:
+            return '-'
+        return ' → '.join(f"{status} +{seconds}s" for status, seconds in latencies.items())
+    
+    stage_timings.short_description = 'Time to each stage'
+    
     def get_queryset(self, request):
         return super().get_queryset(request).prefetch_related('hospitals_found')
 
 @admin.register(EmergencyNotification)
 class EmergencyNotificationAdmin(admin.ModelAdmin):
-    list_display = ['request', 'notification_type', 'recipient', 'status', 'sent_at']
-    list_filter = ['notification_type', 'status', 'sent_at']
-    search_fields = ['recipient', 'subject', 'request__request_id']
+    list_display = ['request', 'notification_type', 'channel', 'recipient', 'status', 'attempts', 'sent_at']
+    list_filter = ['notification_type', 'channel', 'status', 'sent_at']
+    search_fields = ['recipient', 'subject', 'request__request_id', 'provider_message_id']
     readonly_fields = ['sent_at', 'delivered_at', 'created_at']
     
     fieldsets = (
         ('Notification Details', {
-            'fields': ('request', 'notification_type', 'recipient', 'status')
+            'fields': ('request', 'notification_type', 'channel', 'recipient', 'status')
         }),
         ('Message Content', {
             'fields': ('subject', 'message')
         }),
         ('Tracking', {
-            'fields': ('sent_at', 'delivered_at', 'provider_response', 'error_message')
+            'fields': ('sent_at', 'delivered_at', 'provider_response', 'provider_message_id', 'error_message')
+        }),
+        ('Outbox', {
+            'fields': ('attempts', 'next_attempt_at', 'claimed_by', 'claimed_at')
         })
     )
 
@@ -143,6 +157,42 @@ class EmergencyAnalyticsAdmin(admin.ModelAdmin):
         return '0%'
     success_rate.short_description = 'Success Rate'
 
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'task', 'status', 'priority', 'attempts', 'max_attempts', 'run_at', 'effective_at', 'created_at']
+    list_filter = ['status', 'task']
+    search_fields = ['task', 'last_error', 'ordering_key']
+    readonly_fields = ['created_at', 'finished_at', 'locked_by', 'locked_at']
+    actions = ['requeue_jobs']
+    
+    def requeue_jobs(self, request, queryset):
+        from django.utils import timezone
+        from .jobs import effective_at
+        now = timezone.now()
+        updated = 0
+        requeueable = queryset.exclude(status='RUNNING')
+        for priority in set(requeueable.values_list('priority', flat=True)):
+            updated += requeueable.filter(priority=priority).update(
+                status='QUEUED', attempts=0, run_at=now, effective_at=effective_at(now, priority), finished_at=None
+            )
+        self.message_user(request, f"Requeued {updated} job(s)")
+    requeue_jobs.short_description = 'Requeue selected jobs'
+
+@admin.register(InboundSMS)
+class InboundSMSAdmin(admin.ModelAdmin):
+    list_display = ['from_number', 'body', 'status', 'reply_sent', 'emergency_request', 'received_at']
+    list_filter = ['status', 'reply_sent', 'received_at']
+    search_fields = ['from_number', 'body', 'message_sid']
+    readonly_fields = ['message_sid', 'received_at', 'processed_at']
+
+@admin.register(FollowUpTimer)
+class FollowUpTimerAdmin(admin.ModelAdmin):
+    list_display = ['request', 'message_type', 'offset_minutes', 'due_at', 'status', 'fired_at']
+    list_filter = ['status', 'message_type']
+    search_fields = ['request__request_id', 'request__contact_phone']
+    readonly_fields = ['created_at', 'fired_at']
+    raw_id_fields = ['request']
+
 # Customize admin site
 admin.site.site_header = "🩸 Emergency Blood Bank Administration"
 admin.site.site_title = "Emergency Blood Bank"
@@ -4,4 +4,10 @@ from django.apps import AppConfig
 class EmergencyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'emergency'
-    verbose_name = 'Emergency Blood Requests'
\ No newline at end of file
+    verbose_name = 'Emergency Blood Requests'
+
+    def ready(self):
+        # Register background queue tasks
+        from . import tasks  # noqa: F401
+        # Push status and stock changes to WebSocket subscribers
+        from . import signals  # noqa: F401
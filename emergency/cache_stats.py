@@ -0,0 +1,63 @@
+"""
+Cache hit and miss counters
+The counters live in the cache itself, so every worker sharing it reports into
+the same totals (with the local-memory cache they are per process). Recording
+never raises: a cache outage loses counts, not requests
+"""
+
+import logging
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+_tracked = []
+
+
+def track(name):
+    """Register a cache so it is reported even before its first hit or miss"""
+    if name not in _tracked:
+        _tracked.append(name)
+    return name
+
+
+def _counter_key(name, outcome):
+    return f"cache-stats:{name}:{outcome}"
+
+
+def record(name, hit):
+    track(name)
+    if not getattr(settings, 'CACHE_STATS_ENABLED', True):
+        return
+    key = _counter_key(name, 'hits' if hit else 'misses')
+    try:
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+    except Exception as e:
+        logger.debug(f"Could not record cache stats for {name}: {e}")
+
+
+def hit_rates():
+    """{name: {'hits', 'misses', 'hit_rate'}} for every tracked cache; hit_rate is a percentage or None"""
+    keys = [_counter_key(name, outcome) for name in _tracked for outcome in ('hits', 'misses')]
+    try:
+        counts = cache.get_many(keys)
+    except Exception as e:
+        logger.warning(f"Cache stats unavailable: {e}")
+        counts = {}
+
+    stats = {}
+    for name in _tracked:
+        hits = counts.get(_counter_key(name, 'hits'), 0)
+        misses = counts.get(_counter_key(name, 'misses'), 0)
+        total = hits + misses
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total * 100, 1) if total else None,
+        }
+    return stats
+
@@ -0,0 +1,88 @@
+"""
+In-memory circuit breaker for outbound notification providers
+Failures are recorded as they happen, so deciding whether to attempt a send
+needs no database query
+"""
+
+import logging
+import threading
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures
+    Open -> half-open once `reset_timeout` seconds have passed, letting one probe through
+    Half-open -> closed on a successful probe, back to open on a failed one
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or getattr(settings, 'SMS_CIRCUIT_FAILURE_THRESHOLD', 3)
+        self.reset_timeout = reset_timeout or getattr(settings, 'SMS_CIRCUIT_RESET_TIMEOUT', 300)
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self._state
+
+    def is_open(self):
+        """True while calls are being refused (does not reserve a half-open probe)"""
+        with self._lock:
+            state = self._current_state()
+            return state == self.OPEN or (state == self.HALF_OPEN and self._probe_in_flight)
+
+    def allow_request(self):
+        """Decide whether to attempt a call; in half-open only one probe is let through"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit for {self.name} closed after successful probe")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Circuit for {self.name} opened after {self._failures} failure(s)")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def reset(self):
+        self.record_success()
+
+    def snapshot(self):
+        with self._lock:
+            return {'state': self._current_state(), 'consecutive_failures': self._failures}
@@ -0,0 +1,73 @@
+"""
+WebSocket consumers for live emergency request status and blood inventory
+"""
+
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from .inventory import matching_cities
+from .models import EmergencyRequest
+from .realtime import inventory_group, request_group, request_status_event
+
+
+class RequestStatusConsumer(AsyncJsonWebsocketConsumer):
+    """Pushes status transitions for one emergency request"""
+
+    async def connect(self):
+        self.request_id = self.scope['url_route']['kwargs']['request_id']
+        self.group_name = request_group(self.request_id)
+
+        # Subscribe before reading the current status so no transition slips between the two
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+        current = await self._current_status()
+        if current is None:
+            await self.close(code=4404)
+            return
+        await self.send_json(current)
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def request_status(self, event):
+        await self.send_json(event)
+
+    @database_sync_to_async
+    def _current_status(self):
+        emergency_request = EmergencyRequest.objects.filter(request_id=self.request_id).only(
+            'request_id', 'status'
+        ).first()
+        if emergency_request is None:
+            return None
+        return request_status_event(emergency_request)
+
+
+class InventoryConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes stock changes, optionally filtered by city (?city=mumbai)
+    The filter matches cities the way the REST inventory does, so it follows
+    every hospital city it matches at connect time, Navi Mumbai included
+    """
+
+    async def connect(self):
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        city = (query.get('city') or [''])[0].strip()
+        self.group_names = await self._groups(city)
+
+        for group_name in self.group_names:
+            await self.channel_layer.group_add(group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        for group_name in getattr(self, 'group_names', []):
+            await self.channel_layer.group_discard(group_name, self.channel_name)
+
+    @database_sync_to_async
+    def _groups(self, city_filter):
+        if not city_filter:
+            return [inventory_group()]
+        return [inventory_group(city) for city in matching_cities(city_filter)]
+
+    async def inventory_delta(self, event):
+        await self.send_json(event)
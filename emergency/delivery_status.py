@@ -0,0 +1,117 @@
+"""
+Batched SMS delivery-status ingestion
+Each status callback is stored as a DeliveryStatusUpdate row before it is
+acknowledged, and the 'emergency.apply_delivery_statuses' job applies stored
+rows as a few bulk UPDATEs. The callback endpoint stays cheap while a campaign
+is being delivered, and a callback is never lost to a restart
+"""
+
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db.models import Case, DateTimeField, Value, When
+from .jobs import enqueue, wake_local_runner, wake_local_timer
+from .models import DeliveryStatusUpdate, EmergencyNotification
+
+logger = logging.getLogger(__name__)
+
+APPLY_TASK = 'emergency.apply_delivery_statuses'
+
+# Provider callback status -> notification status
+STATUS_MAPPING = {
+    'sent': 'SENT',
+    'delivered': 'DELIVERED',
+    'failed': 'FAILED',
+    'undelivered': 'FAILED',
+}
+
+# Callbacks can arrive out of order; a final status is never replaced by 'sent'
+_STATUS_RANK = {'SENT': 1, 'DELIVERED': 2, 'FAILED': 2}
+
+# This process's next scheduled apply job and the callbacks stored since it was queued
+_window = {'due': 0.0, 'count': 0}
+_window_lock = threading.Lock()
+
+
+def record_status(message_id, provider_status):
+    """
+    Store a delivery status for bulk application
+    Returns False for statuses we don't track (queued, sending, ...)
+    """
+    status = STATUS_MAPPING.get(provider_status)
+    if not message_id or status is None:
+        return False
+
+    DeliveryStatusUpdate.objects.create(provider_message_id=message_id, status=status)
+    _schedule_apply()
+    return True
+
+
+def _schedule_apply():
+    """
+    Queue an apply job once per SMS_STATUS_BATCH_LINGER seconds from this process,
+    or straight away once SMS_STATUS_BATCH_SIZE callbacks are waiting
+    """
+    linger = getattr(settings, 'SMS_STATUS_BATCH_LINGER', 1.0)
+    now = time.monotonic()
+    with _window_lock:
+        _window['count'] += 1
+        full = _window['count'] >= getattr(settings, 'SMS_STATUS_BATCH_SIZE', 200)
+        if now < _window['due'] and not full:
+            return  # An apply job is already on its way
+        _window['due'] = now + linger
+        _window['count'] = 0
+
+    enqueue(APPLY_TASK, delay=None if full else linger)
+    if full:
+        wake_local_runner()
+    else:
+        wake_local_timer()  # The job timer runs it at the end of the linger window
+
+
+def flush_status_updates():
+    """Apply stored statuses with one UPDATE per status; returns the number of notifications changed"""
+    batch_size = getattr(settings, 'SMS_STATUS_BATCH_SIZE', 200)
+    updated = 0
+    while True:
+        rows = list(DeliveryStatusUpdate.objects.order_by('id').values_list(
+            'id', 'provider_message_id', 'status', 'received_at'
+        )[:batch_size])
+        if not rows:
+            return updated
+
+        updated += _apply(rows)
+        # Applying a status twice changes nothing, so a failure here only repeats work
+        DeliveryStatusUpdate.objects.filter(id__in=[row[0] for row in rows]).delete()
+        logger.info(f"Applied {len(rows)} SMS delivery status callback(s)")
+        if len(rows) < batch_size:
+            return updated
+
+
+def _apply(rows):
+    latest = {}  # provider message ID -> (status, received_at)
+    for _, message_id, status, received_at in rows:
+        current = latest.get(message_id)
+        if current is None or _STATUS_RANK[status] >= _STATUS_RANK[current[0]]:
+            latest[message_id] = (status, received_at)
+
+    by_status = {}
+    for message_id, (status, received_at) in latest.items():
+        by_status.setdefault(status, {})[message_id] = received_at
+
+    updated = 0
+    for status, received in by_status.items():
+        notifications = EmergencyNotification.objects.filter(provider_message_id__in=list(received))
+        if status == 'SENT':
+            updated += notifications.filter(status='PENDING').update(status='SENT')
+        elif status == 'DELIVERED':
+            # Each message keeps the time its own delivery was reported
+            delivered_at = Case(
+                *[When(provider_message_id=message_id, then=Value(at)) for message_id, at in received.items()],
+                output_field=DateTimeField(),
+            )
+            updated += notifications.exclude(status='DELIVERED').update(status='DELIVERED', delivered_at=delivered_at)
+        else:
+            updated += notifications.exclude(status__in=['DELIVERED', 'FAILED']).update(status='FAILED')
+    return updated
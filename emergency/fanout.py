@@ -0,0 +1,133 @@
+"""
+Concurrent notification fan-out for the Emergency Blood Bank System
+Dispatches every channel at once so a slow provider cannot delay the others
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNEL_TIMEOUT = 10
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def pool_size():
+    return getattr(settings, 'NOTIFICATION_FANOUT_WORKERS', 8)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=pool_size(), thread_name_prefix='notify')
+    return _executor
+
+
+class _Call:
+    """A submitted send; started_at is set once a pool thread picks it up"""
+    __slots__ = ('started_at',)
+
+    def __init__(self):
+        self.started_at = None
+
+
+def _timed_call(func, release_connection=True, call=None):
+    """Run a channel sender and report its outcome and latency"""
+    started = time.monotonic()
+    if call is not None:
+        call.started_at = started
+    try:
+        ok = bool(func())
+        return {
+            'outcome': 'sent' if ok else 'failed',
+            'latency_ms': round((time.monotonic() - started) * 1000, 1),
+        }
+    except Exception as e:
+        return {
+            'outcome': 'error',
+            'latency_ms': round((time.monotonic() - started) * 1000, 1),
+            'error': str(e)[:200],
+        }
+    finally:
+        if release_connection:
+            close_old_connections()
+
+
+def get_channel_timeout(name):
+    """Deadline in seconds for a channel, from NOTIFICATION_CHANNEL_TIMEOUTS"""
+    timeouts = getattr(settings, 'NOTIFICATION_CHANNEL_TIMEOUTS', {})
+    return timeouts.get(name, DEFAULT_CHANNEL_TIMEOUT)
+
+
+def _await(future, call, timeout, queued_at):
+    """
+    The send's result, or None if it was cancelled without starting
+    A send's deadline runs from when it starts; one still queued after the
+    timeout is cancelled. Raises FuturesTimeout for a send running past its deadline
+    """
+    while True:
+        started_at = call.started_at
+        deadline = (started_at if started_at is not None else queued_at) + timeout
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FuturesTimeout:
+            if call.started_at is not None:
+                if time.monotonic() >= call.started_at + timeout:
+                    raise
+                continue  # Started while we waited; its own deadline applies
+            if future.cancel():
+                return None
+            time.sleep(0.001)  # Being picked up right now; wait for its start time
+
+
+def dispatch_channels(channels, on_late=None):
+    """
+    Send on all channels concurrently, each with its own deadline
+
+    channels: list of (name, callable) in priority order - earlier entries are
+    submitted first. Each callable returns True when the message was sent.
+    An entry may carry a third item naming the channel whose timeout applies.
+    Returns {name: {'outcome': 'sent'|'failed'|'error'|'timeout'|'not_started', 'latency_ms': float}}
+
+    'not_started' sends were cancelled while queued and never ran. A 'timeout'
+    send is still running; on_late(name, result) is called with its result when
+    it finishes, so callers can record it rather than send it again
+    """
+    if not getattr(settings, 'NOTIFICATION_FANOUT_CONCURRENT', True):
+        # Serial mode (tests, SQLite setups without concurrent writers)
+        return {name: _timed_call(func, release_connection=False) for name, func, *_ in channels}
+
+    executor = _get_executor()
+    queued_at = time.monotonic()
+
+    pending = []
+    for name, func, *timeout_name in channels:
+        timeout = get_channel_timeout(timeout_name[0] if timeout_name else name)
+        call = _Call()
+        pending.append((name, executor.submit(_timed_call, func, True, call), call, timeout))
+
+    results = {}
+    for name, future, call, timeout in pending:
+        try:
+            result = _await(future, call, timeout, queued_at)
+        except FuturesTimeout:
+            results[name] = {'outcome': 'timeout', 'latency_ms': round(timeout * 1000, 1)}
+            logger.warning(f"Notification channel '{name}' exceeded its {timeout}s deadline and is still running")
+            if on_late is not None:
+                future.add_done_callback(lambda done, name=name: on_late(name, done.result()))
+            continue
+        if result is None:
+            results[name] = {'outcome': 'not_started', 'latency_ms': 0.0}
+            logger.warning(f"Notification channel '{name}' was still queued after {timeout}s and was cancelled")
+        else:
+            results[name] = result
+
+    return results
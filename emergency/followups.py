@@ -0,0 +1,167 @@
+"""
+Follow-up and reminder SMS at set offsets after an emergency request
+Each follow-up is a FollowUpTimer row indexed by (status, due_at). Job workers
+and web processes run a FollowUpScheduler: it periodically range-scans only the
+timers due within the wheel's horizon, loads them into a hashed timer wheel, and
+fires each one on the tick it falls due - so pending timers cost nothing until
+they are close, however many there are. Timers overdue by more than
+FOLLOW_UP_MAX_LATENESS_SECONDS (after downtime) are skipped rather than sent
+"""
+
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .jobs import enqueue, wake_local_runner
+from .models import FollowUpTimer
+
+logger = logging.getLogger(__name__)
+
+
+def schedule_follow_ups(emergency_request):
+    """Create the EMERGENCY_FOLLOW_UPS timers for a new request; returns how many"""
+    if not emergency_request.contact_phone:
+        return 0
+
+    timers = [
+        FollowUpTimer(
+            request=emergency_request,
+            message_type=message_type,
+            offset_minutes=minutes,
+            due_at=emergency_request.created_at + timedelta(minutes=minutes),
+        )
+        for minutes, message_type in getattr(settings, 'EMERGENCY_FOLLOW_UPS', [])
+    ]
+    FollowUpTimer.objects.bulk_create(timers, ignore_conflicts=True)
+    return len(timers)
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: timers hash into slots by due tick, so adding one is O(1)
+    and each tick only inspects its own slot. Timers further out than one turn
+    stay in their slot until the wheel comes round to their tick
+    """
+
+    def __init__(self, slots=600, tick=1.0, now=None):
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]  # key -> due tick
+        self._slot_of = {}
+        self.current_tick = self._tick_of(time.time() if now is None else now)
+
+    def _tick_of(self, timestamp):
+        return int(timestamp // self.tick)
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def __contains__(self, key):
+        return key in self._slot_of
+
+    def add(self, key, due):
+        """Schedule key for the due timestamp; overdue keys fire on the next advance"""
+        self.cancel(key)
+        due_tick = max(self._tick_of(due), self.current_tick)
+        slot = due_tick % len(self.slots)
+        self.slots[slot][key] = due_tick
+        self._slot_of[key] = slot
+
+    def cancel(self, key):
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            self.slots[slot].pop(key, None)
+
+    def advance(self, now=None):
+        """Move the wheel up to now and return the keys that fell due"""
+        target = self._tick_of(time.time() if now is None else now)
+        expired = []
+        # After a long stall one full turn covers every slot
+        first = max(self.current_tick, target - len(self.slots) + 1)
+        for tick in range(first, target + 1):
+            slot = self.slots[tick % len(self.slots)]
+            for key, due_tick in list(slot.items()):
+                if due_tick <= target:
+                    del slot[key]
+                    del self._slot_of[key]
+                    expired.append(key)
+        self.current_tick = max(self.current_tick, target + 1)
+        return expired
+
+
+class FollowUpScheduler:
+    """Feeds due-soon timers from the database into a TimerWheel and fires them"""
+
+    def __init__(self, tick=None, slots=None, refill_interval=None):
+        self.tick = tick or getattr(settings, 'FOLLOW_UP_WHEEL_TICK_SECONDS', 1.0)
+        slots = slots or getattr(settings, 'FOLLOW_UP_WHEEL_SLOTS', 600)
+        self.refill_interval = refill_interval or getattr(settings, 'FOLLOW_UP_REFILL_SECONDS', 30)
+        self.wheel = TimerWheel(slots=slots, tick=self.tick)
+        self.horizon = timedelta(seconds=slots * self.tick)
+        self.stop_event = threading.Event()
+        self._last_refill = None
+
+    def _stale_before(self):
+        return timezone.now() - timedelta(seconds=getattr(settings, 'FOLLOW_UP_MAX_LATENESS_SECONDS', 600))
+
+    def refill(self):
+        """Load pending timers due within the horizon (an index range scan); returns how many were added"""
+        now = timezone.now()
+        stale_before = self._stale_before()
+        skipped = FollowUpTimer.objects.filter(status='PENDING', due_at__lt=stale_before).update(status='SKIPPED')
+        if skipped:
+            logger.warning(f"Skipped {skipped} follow-up timer(s) overdue by more than {now - stale_before}")
+
+        cutoff = now + self.horizon
+        added = 0
+        for timer_id, due_at in FollowUpTimer.objects.filter(
+            status='PENDING', due_at__lte=cutoff
+        ).values_list('id', 'due_at').iterator():
+            if timer_id not in self.wheel:
+                self.wheel.add(timer_id, due_at.timestamp())
+                added += 1
+        return added
+
+    def fire(self, timer_ids):
+        """Claim timers that are still pending and queue their SMS; returns how many fired"""
+        fired = 0
+        stale_before = self._stale_before()
+        for timer_id in timer_ids:
+            # The conditional update is the claim: cancelled timers, ones fired by
+            # another scheduler and stale ones (left for refill to skip) are passed over
+            with transaction.atomic():
+                claimed = FollowUpTimer.objects.filter(
+                    id=timer_id, status='PENDING', due_at__gte=stale_before
+                ).update(status='FIRED', fired_at=timezone.now())
+                if claimed:
+                    enqueue('emergency.send_follow_up', {'timer_id': timer_id}, priority=5)
+                    wake_local_runner()
+                    fired += 1
+        return fired
+
+    def run_once(self, now=None):
+        """Refill when due, advance the wheel and fire what expired"""
+        now = time.time() if now is None else now
+        if self._last_refill is None or now - self._last_refill >= self.refill_interval:
+            self._last_refill = now
+            self.refill()
+        return self.fire(self.wheel.advance(now))
+
+    def run_forever(self):
+        logger.info(f"Follow-up scheduler started ({len(self.wheel.slots)} slots x {self.tick}s)")
+        while not self.stop_event.is_set():
+            close_old_connections()
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Follow-up scheduler error: {e}")
+                self._last_refill = None  # Reload from the table once the database is back
+            finally:
+                close_old_connections()
+            self.stop_event.wait(self.tick)
+        logger.info("Follow-up scheduler stopped")
+
+    def stop(self):
+        self.stop_event.set()
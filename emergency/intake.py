@@ -0,0 +1,111 @@
+"""
+Duplicate-safe intake for emergency requests
+Retries carrying the same idempotency key (an Idempotency-Key header, or the
+Twilio MessageSid for SMS) and repeat submissions from the same phone for the
+same blood group resolve to the existing request instead of starting another
+search-and-notify cycle
+"""
+
+import hashlib
+import logging
+import re
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import JsonResponse
+from django.utils import timezone
+from .followups import schedule_follow_ups
+from .models import EmergencyRequest
+
+logger = logging.getLogger(__name__)
+
+# Requests still being worked on; repeats attach to these
+OPEN_STATUSES = ('PENDING', 'SEARCHING', 'FOUND', 'NOTIFIED')
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def normalize_phone(phone):
+    """Clean a phone number to +91XXXXXXXXXX form where it looks Indian"""
+    phone_clean = re.sub(r'[^0-9+]', '', phone or '')
+    if not phone_clean.startswith('+'):
+        if phone_clean.startswith('91') and len(phone_clean) == 12:
+            phone_clean = '+' + phone_clean
+        elif len(phone_clean) == 10:
+            phone_clean = '+91' + phone_clean
+    return phone_clean
+
+
+def make_idempotency_key(source, raw_key):
+    """Namespace a client-supplied key by source, hashing keys too long for the column"""
+    raw_key = (raw_key or '').strip()
+    if not raw_key:
+        return None
+    key = f"{source}:{raw_key}"
+    if len(key) > 100:
+        key = f"{source}:{hashlib.sha256(raw_key.encode()).hexdigest()}"
+    return key
+
+
+def get_request_idempotency_key(request):
+    """Idempotency key from the request header, if the client sent one"""
+    return make_idempotency_key('web', request.headers.get(IDEMPOTENCY_HEADER))
+
+
+def find_duplicate_request(contact_phone, blood_group, idempotency_key=None):
+    """
+    Return the existing request this submission duplicates, or None
+    Coalesced repeats (as opposed to exact retries) are counted on the request
+    """
+    if idempotency_key:
+        existing = EmergencyRequest.objects.filter(idempotency_key=idempotency_key).first()
+        if existing:
+            logger.info(f"Idempotent retry {idempotency_key} resolved to request {existing.request_id}")
+            return existing
+
+    window = getattr(settings, 'EMERGENCY_COALESCE_WINDOW_SECONDS', 600)
+    if not contact_phone or not window:
+        return None
+
+    existing = EmergencyRequest.objects.filter(
+        contact_phone=contact_phone,
+        blood_group=blood_group,
+        status__in=OPEN_STATUSES,
+        created_at__gte=timezone.now() - timedelta(seconds=window)
+    ).order_by('-created_at').first()
+
+    if existing:
+        EmergencyRequest.objects.filter(pk=existing.pk).update(duplicate_count=F('duplicate_count') + 1)
+        logger.info(f"Coalesced repeat {blood_group} request from {contact_phone} into {existing.request_id}")
+    return existing
+
+
+def create_request_once(idempotency_key=None, **fields):
+    """
+    Create an emergency request, returning (request, created)
+    Concurrent submissions with the same key resolve to whichever insert won
+    """
+    if idempotency_key:
+        fields['idempotency_key'] = idempotency_key
+
+    try:
+        with transaction.atomic():
+            emergency_request = EmergencyRequest.objects.create(**fields)
+            schedule_follow_ups(emergency_request)
+            return emergency_request, True
+    except IntegrityError:
+        if not idempotency_key:
+            raise
+        return EmergencyRequest.objects.get(idempotency_key=idempotency_key), False
+
+
+def duplicate_request_response(emergency_request):
+    """Response for a retried or repeated submission - points at the existing request"""
+    return JsonResponse({
+        'success': True,
+        'request_id': str(emergency_request.request_id),
+        'message': 'Emergency request already received and is being processed',
+        'status': emergency_request.status.lower(),
+        'duplicate': True
+    })
@@ -0,0 +1,169 @@
+"""
+Cached live inventory snapshots
+City and blood-group totals come from one GROUP BY query and the per-hospital
+stock from a flat values query; the compact result is cached per city filter
+under the version counters of the cities it matches, so any stock or hospital
+change there makes the next read rebuild it. Per-user work - distances and sorting - is done on
+the cached copy and never touches the ORM
+"""
+
+import logging
+from bisect import bisect_right
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils.text import slugify
+from blood.pagination import decode_cursor, encode_cursor
+from . import cache_stats
+from .location_utils import DistanceCalculator
+from .models import EmergencyBloodStock, EmergencyHospital
+from .serialization import INVENTORY_HOSPITAL_FIELDS, InventoryHospitalRow, km
+from .versions import HOSPITALS, INVENTORY, city_key, get_versions
+
+logger = logging.getLogger(__name__)
+
+cache_stats.track('inventory-snapshot')
+
+BLOOD_TYPES = [blood_group for blood_group, _ in EmergencyBloodStock.BLOOD_GROUPS]
+
+
+def _level(blood_group, units):
+    # O- is shown as 'less' rather than a count while it is scarce
+    if blood_group == 'O-' and 0 < units < 10:
+        return 'less', 'low'
+    if units == 0:
+        return '0', 'empty'
+    if units <= 5:
+        return str(units), 'critical'
+    if units <= 15:
+        return str(units), 'low'
+    return str(units), 'available'
+
+
+# (blood group, units) -> (display, status class) for every level below 'available'
+STOCK_LEVELS = {
+    (blood_group, units): _level(blood_group, units) for blood_group in BLOOD_TYPES for units in range(16)
+}
+
+
+def stock_level(blood_group, units):
+    """Display text and status class for a stock count on the public inventory page"""
+    return STOCK_LEVELS.get((blood_group, units)) or (str(units), 'available')
+
+
+def _empty_inventory():
+    return dict.fromkeys(BLOOD_TYPES, 0)
+
+
+def build_inventory_snapshot(city_filter=''):
+    """Totals and the compact hospital list for active hospitals, optionally in one city"""
+    hospitals = EmergencyHospital.objects.filter(is_active=True)
+    stock = EmergencyBloodStock.objects.filter(hospital__is_active=True)
+    if city_filter:
+        hospitals = hospitals.filter(city__icontains=city_filter)
+        stock = stock.filter(hospital__city__icontains=city_filter)
+
+    cities = {}
+    total_inventory = _empty_inventory()
+    for city, blood_group, units in stock.values_list('hospital__city', 'blood_group').annotate(
+        units=Sum('units_available')
+    ).order_by():
+        city_data = cities.setdefault(city, {'inventory': _empty_inventory(), 'total_units': 0, 'hospital_count': 0})
+        city_data['inventory'][blood_group] += units
+        city_data['total_units'] += units
+        total_inventory[blood_group] += units
+
+    hospital_inventory = {}
+    for hospital_id, blood_group, units in stock.values_list('hospital_id', 'blood_group', 'units_available'):
+        hospital_inventory.setdefault(hospital_id, _empty_inventory())[blood_group] = units
+
+    # Hospitals are kept as plain tuples: (lat, lng, row values, inventory, total units)
+    hospital_list = []
+    for *values, latitude, longitude in hospitals.order_by('id').values_list(
+        *INVENTORY_HOSPITAL_FIELDS, 'latitude', 'longitude'
+    ):
+        inventory = hospital_inventory.get(values[0]) or _empty_inventory()
+        hospital_list.append((float(latitude), float(longitude), tuple(values), inventory, sum(inventory.values())))
+        cities.setdefault(
+            values[2], {'inventory': _empty_inventory(), 'total_units': 0, 'hospital_count': 0}
+        )['hospital_count'] += 1
+
+    return {'total_inventory': total_inventory, 'cities': cities, 'hospitals': hospital_list}
+
+
+def _hospital_cities():
+    """Distinct hospital cities, cached until a hospital changes"""
+    version, = get_versions(HOSPITALS)
+    key = f"inventory-cities:{version}"
+    cities = cache.get(key)
+    if cities is None:
+        cities = sorted(set(EmergencyHospital.objects.values_list('city', flat=True)))
+        cache.set(key, cities, getattr(settings, 'INVENTORY_CACHE_SECONDS', 300))
+    return cities
+
+
+def inventory_versions(city_filter=''):
+    """
+    Version counters behind a city filter's snapshot
+    The filter matches cities by substring, so it depends on every city it
+    matches; a hospital in a newly matching city changes the list itself
+    """
+    if not city_filter:
+        return [INVENTORY]
+    return [city_key(city) for city in matching_cities(city_filter)]
+
+
+def matching_cities(city_filter):
+    """Hospital cities a city filter matches - case-insensitively, by substring"""
+    needle = city_filter.casefold()
+    return [city for city in _hospital_cities() if needle in city.casefold()]
+
+
+def get_inventory_snapshot(city_filter=''):
+    """The snapshot for a city filter, from the cache unless inventory changed since it was built"""
+    try:
+        versions = get_versions(*inventory_versions(city_filter))
+    except Exception as e:
+        logger.warning(f"Version counters unavailable, building inventory uncached: {e}")
+        return build_inventory_snapshot(city_filter)
+
+    key = f"inventory-snapshot:{slugify(city_filter) or 'all'}:{'-'.join(map(str, versions))}"
+    snapshot = cache.get(key)
+    cache_stats.record('inventory-snapshot', snapshot is not None)
+    if snapshot is None:
+        snapshot = build_inventory_snapshot(city_filter)
+        cache.set(key, snapshot, getattr(settings, 'INVENTORY_CACHE_SECONDS', 300))
+    return snapshot
+
+
+def hospitals_by_distance(snapshot, user_lat=None, user_lng=None):
+    """
+    (sort key, InventoryHospitalRow) pairs from a snapshot with each hospital's
+    distance to the user, nearest first. Without a location they stay in id order
+    and distance is None. Keys are unique, so they double as keyset cursors
+    """
+    if user_lat is None or user_lng is None:
+        return [
+            ((values[0],), InventoryHospitalRow(*values, inventory, total_units))
+            for _, _, values, inventory, total_units in snapshot['hospitals']
+        ]
+
+    ranked = []
+    for lat, lng, values, inventory, total_units in snapshot['hospitals']:
+        distance = DistanceCalculator.haversine_distance(lat, lng, user_lat, user_lng)
+        ranked.append(((distance, values[0]), InventoryHospitalRow(*values, inventory, total_units, km(distance))))
+    ranked.sort(key=lambda item: item[0])
+    return ranked
+
+
+def page_hospitals(ranked, cursor=None, limit=None):
+    """The rows after a cursor from hospitals_by_distance, and the cursor for the next page"""
+    limit = limit or getattr(settings, 'INVENTORY_PAGE_SIZE', 100)
+    keys = [key for key, _ in ranked]
+    start = 0
+    decoded = decode_cursor(cursor)
+    if decoded and len(decoded[1]) == len(keys[0] if keys else ()):
+        start = bisect_right(keys, tuple(decoded[1]))
+    page = ranked[start:start + limit]
+    next_cursor = encode_cursor(page[-1][0]) if page and start + limit < len(ranked) else None
+    return [row for _, row in page], next_cursor
@@ -0,0 +1,451 @@
+"""
+Database-backed job queue for the Emergency Blood Bank System
+Runs notifications, analytics and sweeps off the request path without a broker
+
+Ready jobs run in effective_at order: run_at brought forward by
+JOB_PRIORITY_AGING_SECONDS per priority point. A higher priority is a head
+start rather than an absolute rank, so a waiting job ages past newer,
+higher-priority ones instead of starving
+"""
+
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Avg, Count, DurationField, Exists, ExpressionWrapper, F, Min, OuterRef, Q
+from django.utils import timezone
+from .models import BackgroundJob, BackgroundJobLock
+
+logger = logging.getLogger(__name__)
+
+# Registered task name -> callable(**payload)
+TASKS = {}
+
+_local_executors = {}
+_local_executor_lock = threading.Lock()
+
+# This process's job timer thread and the event that cuts its sleep short
+_local_timer = {'thread': None}
+_local_timer_wake = threading.Event()
+
+
+def register_task(name, max_attempts=None):
+    """Register a function as a queue task under the given name"""
+    def decorator(func):
+        func.task_name = name
+        func.max_attempts = max_attempts
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def effective_at(run_at, priority):
+    """Ordering time for a job: each priority point counts as JOB_PRIORITY_AGING_SECONDS of waiting"""
+    return run_at - timedelta(seconds=priority * getattr(settings, 'JOB_PRIORITY_AGING_SECONDS', 30))
+
+
+def enqueue(task_name, payload=None, priority=0, delay=None, max_attempts=None, ordering_key=''):
+    """
+    Store a job for background execution
+    Jobs with the same ordering_key run one at a time in enqueue order
+    Returns the created BackgroundJob
+    """
+    if task_name not in TASKS:
+        raise ValueError(f"Unknown task: {task_name}")
+
+    if max_attempts is None:
+        max_attempts = TASKS[task_name].max_attempts or getattr(settings, 'JOB_QUEUE_MAX_ATTEMPTS', 5)
+
+    run_at = timezone.now()
+    if delay:
+        run_at += delay if isinstance(delay, timedelta) else timedelta(seconds=delay)
+
+    return BackgroundJob.objects.create(
+        task=task_name,
+        payload=payload or {},
+        priority=priority,
+        max_attempts=max_attempts,
+        run_at=run_at,
+        effective_at=effective_at(run_at, priority),
+        ordering_key=ordering_key,
+    )
+
+
+def default_worker_id():
+    """Identify the current worker thread for claim bookkeeping"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def claim_jobs(worker_id=None, limit=1, min_priority=None):
+    """
+    Claim up to `limit` ready jobs for this worker, optionally only those of at least min_priority
+    Uses SELECT ... FOR UPDATE SKIP LOCKED where supported, otherwise the lock table
+    """
+    worker_id = worker_id or default_worker_id()
+    now = timezone.now()
+    ready = _ready_jobs(now)
+    if min_priority is not None:
+        ready = ready.filter(priority__gte=min_priority)
+
+    if connection.features.has_select_for_update_skip_locked:
+        return _claim_skip_locked(ready, worker_id, limit, now)
+    return _claim_with_lock_table(ready, worker_id, limit, now)
+
+
+def _ready_jobs(now):
+    # A keyed job is only ready once every earlier job with its key has finished
+    earlier_unfinished = BackgroundJob.objects.filter(
+        ordering_key=OuterRef('ordering_key'),
+        status__in=['QUEUED', 'RUNNING'],
+        id__lt=OuterRef('id')
+    )
+    return BackgroundJob.objects.filter(
+        Q(ordering_key='') | ~Exists(earlier_unfinished),
+        status='QUEUED',
+        run_at__lte=now
+    ).order_by('effective_at', 'id')
+
+
+def _claim_skip_locked(ready, worker_id, limit, now):
+    with transaction.atomic():
+        job_ids = list(
+            ready.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit]
+        )
+        if not job_ids:
+            return []
+        BackgroundJob.objects.filter(id__in=job_ids).update(
+            status='RUNNING',
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F('attempts') + 1
+        )
+    return list(BackgroundJob.objects.filter(id__in=job_ids).order_by('effective_at', 'id'))
+
+
+def _claim_with_lock_table(ready, worker_id, limit, now):
+    # Over-fetch candidates since other workers may win some of them
+    candidate_ids = list(ready.values_list('id', flat=True)[:limit * 4])
+
+    claimed_ids = []
+    for job_id in candidate_ids:
+        if len(claimed_ids) >= limit:
+            break
+        try:
+            with transaction.atomic():
+                # The unique job column makes this insert the claim itself
+                BackgroundJobLock.objects.create(job_id=job_id, locked_by=worker_id)
+                updated = BackgroundJob.objects.filter(id=job_id, status='QUEUED').update(
+                    status='RUNNING',
+                    locked_by=worker_id,
+                    locked_at=now,
+                    attempts=F('attempts') + 1
+                )
+                if not updated:
+                    raise IntegrityError("Job no longer queued")
+            claimed_ids.append(job_id)
+        except IntegrityError:
+            continue
+
+    if not claimed_ids:
+        return []
+    return list(BackgroundJob.objects.filter(id__in=claimed_ids).order_by('effective_at', 'id'))
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter for the given attempt count"""
+    base = getattr(settings, 'JOB_QUEUE_RETRY_BASE_SECONDS', 5)
+    cap = getattr(settings, 'JOB_QUEUE_RETRY_MAX_SECONDS', 900)
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return delay + random.uniform(0, delay * 0.1)
+
+
+def run_job(job):
+    """Execute a claimed job and record its outcome"""
+    func = TASKS.get(job.task)
+    try:
+        if func is None:
+            raise LookupError(f"No task registered as '{job.task}'")
+        func(**job.payload)
+    except Exception as e:
+        _record_failure(job, e)
+        return False
+    else:
+        BackgroundJob.objects.filter(id=job.id).update(
+            status='SUCCEEDED',
+            finished_at=timezone.now(),
+            last_error=''
+        )
+        return True
+    finally:
+        BackgroundJobLock.objects.filter(job_id=job.id).delete()
+
+
+def _record_failure(job, error):
+    error_message = f"{type(error).__name__}: {error}"[:2000]
+
+    if job.attempts >= job.max_attempts:
+        # Out of retries - park in the dead-letter state for manual inspection
+        BackgroundJob.objects.filter(id=job.id).update(
+            status='DEAD',
+            finished_at=timezone.now(),
+            last_error=error_message
+        )
+        logger.error(f"Job {job.task} #{job.id} dead-lettered after {job.attempts} attempts: {error_message}")
+        return
+
+    delay = retry_delay(job.attempts)
+    run_at = timezone.now() + timedelta(seconds=delay)
+    BackgroundJob.objects.filter(id=job.id).update(
+        status='QUEUED',
+        run_at=run_at,
+        effective_at=effective_at(run_at, job.priority),
+        locked_by='',
+        locked_at=None,
+        last_error=error_message
+    )
+    wake_local_timer()
+    logger.warning(f"Job {job.task} #{job.id} failed (attempt {job.attempts}), retrying in {delay:.0f}s: {error_message}")
+
+
+def requeue_stale_jobs():
+    """Return jobs held by crashed workers to the queue"""
+    stale_after = getattr(settings, 'JOB_QUEUE_STALE_AFTER_SECONDS', 300)
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+
+    with transaction.atomic():
+        stale_ids = list(BackgroundJob.objects.filter(
+            status='RUNNING',
+            locked_at__lt=cutoff
+        ).values_list('id', flat=True))
+        if not stale_ids:
+            return 0
+        BackgroundJobLock.objects.filter(job_id__in=stale_ids).delete()
+        count = BackgroundJob.objects.filter(id__in=stale_ids, status='RUNNING').update(
+            status='QUEUED',
+            locked_by='',
+            locked_at=None
+        )
+
+    logger.warning(f"Requeued {count} stale background jobs")
+    return count
+
+
+def run_pending_jobs(max_jobs=None, worker_id=None, min_priority=None):
+    """Claim and run ready jobs until the queue is empty or max_jobs is reached"""
+    worker_id = worker_id or default_worker_id()
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        jobs = claim_jobs(worker_id, limit=1, min_priority=min_priority)
+        if not jobs:
+            break
+        for job in jobs:
+            run_job(job)
+            processed += 1
+    return processed
+
+
+class JobWorker:
+    """Polling worker loop used by the run_job_worker management command"""
+
+    def __init__(self, batch_size=1, poll_interval=1.0, worker_id=None, min_priority=None):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.min_priority = min_priority
+        self.worker_id = worker_id or default_worker_id()
+        self.stop_event = threading.Event()
+        self._last_sweep = 0.0
+
+    def run_once(self):
+        """Run one claim/execute cycle; returns the number of jobs processed"""
+        close_old_connections()
+        try:
+            if time.monotonic() - self._last_sweep > getattr(settings, 'JOB_QUEUE_STALE_AFTER_SECONDS', 300) / 2:
+                self._last_sweep = time.monotonic()
+                requeue_stale_jobs()
+
+            jobs = claim_jobs(self.worker_id, limit=self.batch_size, min_priority=self.min_priority)
+            for job in jobs:
+                run_job(job)
+            return len(jobs)
+        finally:
+            close_old_connections()
+
+    def run_forever(self):
+        logger.info(f"Job worker {self.worker_id} started")
+        while not self.stop_event.is_set():
+            try:
+                processed = self.run_once()
+            except Exception as e:
+                logger.error(f"Job worker {self.worker_id} error: {e}")
+                processed = 0
+            if not processed:
+                self.stop_event.wait(self.poll_interval)
+        logger.info(f"Job worker {self.worker_id} stopped")
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def queue_metrics(window=timedelta(minutes=15)):
+    """
+    Queue depth and wait time per priority
+    depth counts all queued jobs, ready those already due; oldest_wait_seconds is how
+    long the oldest due job has waited, avg_wait_seconds the due-to-claim wait of jobs
+    started within the window
+    """
+    now = timezone.now()
+    labels = {priority: urgency for urgency, priority in getattr(settings, 'EMERGENCY_URGENCY_PRIORITIES', {}).items()}
+    metrics = {}
+
+    def entry(priority):
+        return metrics.setdefault(priority, {
+            'priority': priority,
+            'label': labels.get(priority, str(priority)),
+            'depth': 0,
+            'ready': 0,
+            'oldest_wait_seconds': 0,
+            'started': 0,
+            'avg_wait_seconds': None,
+        })
+
+    queued = BackgroundJob.objects.filter(status='QUEUED').values('priority').annotate(
+        depth=Count('id'),
+        ready=Count('id', filter=Q(run_at__lte=now)),
+        oldest_due=Min('run_at', filter=Q(run_at__lte=now)),
+    )
+    for row in queued:
+        item = entry(row['priority'])
+        item['depth'] = row['depth']
+        item['ready'] = row['ready']
+        if row['oldest_due']:
+            item['oldest_wait_seconds'] = round((now - row['oldest_due']).total_seconds(), 1)
+
+    started = BackgroundJob.objects.filter(
+        status__in=['RUNNING', 'SUCCEEDED', 'DEAD'],
+        locked_at__gte=now - window
+    ).values('priority').annotate(
+        started=Count('id'),
+        avg_wait=Avg(ExpressionWrapper(F('locked_at') - F('run_at'), output_field=DurationField())),
+    )
+    for row in started:
+        item = entry(row['priority'])
+        item['started'] = row['started']
+        if row['avg_wait'] is not None:
+            item['avg_wait_seconds'] = round(max(row['avg_wait'].total_seconds(), 0), 3)
+
+    return sorted(metrics.values(), key=lambda item: -item['priority'])
+
+
+def _get_local_executor(lane='default'):
+    executor = _local_executors.get(lane)
+    if executor is None:
+        with _local_executor_lock:
+            executor = _local_executors.get(lane)
+            if executor is None:
+                # The priority lane is kept free of routine work so urgent jobs never queue behind it
+                if lane == 'priority':
+                    workers = getattr(settings, 'JOB_QUEUE_PRIORITY_WORKERS', 1)
+                else:
+                    workers = getattr(settings, 'EMERGENCY_BACKGROUND_WORKERS', 4)
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'job-runner-{lane}')
+                _local_executors[lane] = executor
+    return executor
+
+
+def _drain_locally(min_priority=None):
+    close_old_connections()
+    try:
+        run_pending_jobs(max_jobs=getattr(settings, 'JOB_QUEUE_LOCAL_BATCH', 10), min_priority=min_priority)
+    except Exception as e:
+        logger.error(f"In-process job runner error: {e}")
+    finally:
+        close_old_connections()
+
+
+def wake_local_runner(min_priority=None):
+    """
+    Drain ready jobs on this process's thread pool after the current transaction commits
+    Lets web processes run jobs when no dedicated worker is deployed. With min_priority,
+    the priority lane also drains jobs of at least that priority, so they start even
+    while every regular runner is busy
+    """
+    if not getattr(settings, 'JOB_QUEUE_RUN_IN_WEB', True):
+        return
+
+    def submit():
+        _get_local_executor().submit(_drain_locally)
+        if min_priority is not None:
+            _get_local_executor('priority').submit(_drain_locally, min_priority)
+
+    transaction.on_commit(submit)
+
+
+def start_local_timer():
+    """
+    Start this process's job timer, which sleeps until the next queued job falls
+    due and drains it on the local runner, and its follow-up SMS scheduler.
+    Retries, delayed jobs and follow-ups then run in web processes even when no
+    worker is deployed. Called by the ASGI and WSGI entry points, so management
+    commands never start it
+    """
+    if not getattr(settings, 'JOB_QUEUE_RUN_IN_WEB', True):
+        return
+    with _local_executor_lock:
+        if _local_timer['thread'] is not None:
+            return
+        _local_timer['thread'] = threading.Thread(target=_run_local_timer, name='job-timer', daemon=True)
+    _local_timer['thread'].start()
+
+    if getattr(settings, 'FOLLOW_UP_TIMERS_IN_WEB', True):
+        # Imported here: followups imports this module
+        from .followups import FollowUpScheduler
+        threading.Thread(target=FollowUpScheduler().run_forever, name='follow-up-scheduler', daemon=True).start()
+
+
+def wake_local_timer():
+    """Have the job timer recheck the queue, e.g. after enqueueing a job with a delay"""
+    if _local_timer['thread'] is not None:
+        transaction.on_commit(_local_timer_wake.set)
+
+
+def next_due_in(now=None):
+    """(ready job count, seconds until the next queued job falls due or None)"""
+    now = now or timezone.now()
+    pending = BackgroundJob.objects.filter(status='QUEUED').aggregate(
+        ready=Count('id', filter=Q(run_at__lte=now)),
+        upcoming=Min('run_at', filter=Q(run_at__gt=now)),
+    )
+    upcoming = pending['upcoming']
+    return pending['ready'], (upcoming - now).total_seconds() if upcoming else None
+
+
+def timer_tick():
+    """Hand ready jobs to the local runner; returns how long the timer may sleep"""
+    # Jobs queued by other processes are picked up within JOB_QUEUE_TIMER_MAX_SLEEP
+    wait = getattr(settings, 'JOB_QUEUE_TIMER_MAX_SLEEP', 30)
+    ready, upcoming = next_due_in()
+    if ready:
+        _get_local_executor().submit(_drain_locally)
+    if upcoming is not None:
+        wait = min(wait, upcoming)
+    return max(wait, 0.05)
+
+
+def _run_local_timer():
+    while True:
+        _local_timer_wake.clear()
+        wait = getattr(settings, 'JOB_QUEUE_TIMER_MAX_SLEEP', 30)
+        close_old_connections()
+        try:
+            wait = timer_tick()
+        except Exception as e:
+            logger.error(f"Job timer error: {e}")
+        finally:
+            close_old_connections()
+        _local_timer_wake.wait(wait)
@@ -3,16 +3,22 @@ Location utilities for Emergency Blood Bank System
 Provides IP geolocation, geocoding, and distance calculation services
 """
 
+import hashlib
 import requests
 import logging
 from math import radians, cos, sin, asin, sqrt
 from django.conf import settings
-from django.core.cache import cache
+from django.core.cache import caches
 from typing import Tuple, Optional, Dict, Any
 
 logger = logging.getLogger(__name__)
 
 
+def lookup_cache():
+    """The tiered cache for external lookups, namespaced ip-location/geocode/reverse-geocode"""
+    return caches['lookups']
+
+
 class LocationService:
     """Enhanced location service with multiple providers and fallbacks"""
     
@@ -27,13 +33,11 @@ class LocationService:
         """
         if not ip_address or ip_address in ['127.0.0.1', 'localhost']:
             return None, None, None
-            
-        # Check cache first
-        cache_key = f"ip_location_{ip_address}"
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            return cached_result
-            
+        
+        result = lookup_cache().get_or_set(f"ip-location:{ip_address}", lambda: self._lookup_ip(ip_address))
+        return result or (None, None, None)
+    
+    def _lookup_ip(self, ip_address):
         try:
             # Try IPInfo.io first (more accurate)
             if self.ipinfo_token:
@@ -49,10 +53,7 @@ class LocationService:
                         lat_str, lng_str = data['loc'].split(',')
                         lat, lng = float(lat_str), float(lng_str)
                         city = data.get('city', 'Unknown')
-                        result = (lat, lng, city)
-                        # Cache for 1 hour
-                        cache.set(cache_key, result, 3600)
-                        return result
+                        return (lat, lng, city)
             
             # Fallback to ip-api.com (free, no key required)
             response = requests.get(
@@ -66,15 +67,12 @@ class LocationService:
                     lat = float(data.get('lat', 0))
                     lng = float(data.get('lon', 0))
                     city = data.get('city', 'Unknown')
-                    result = (lat, lng, city)
-                    # Cache for 1 hour
-                    cache.set(cache_key, result, 3600)
-                    return result
+                    return (lat, lng, city)
                     
         except Exception as e:
             logger.warning(f"IP geolocation failed for {ip_address}: {e}")
             
-        return None, None, None
+        return None
     
     def geocode_address(self, address: str) -> Tuple[Optional[float], Optional[float]]:
         """
@@ -83,13 +81,13 @@ class LocationService:
         """
         if not address or not self.google_api_key:
             return None, None
-            
-        # Check cache first
-        cache_key = f"geocode_{hash(address.lower())}"
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            return cached_result
-            
+        
+        # A stable digest, unlike hash(), so every worker finds the same entry
+        digest = hashlib.sha1(address.strip().lower().encode()).hexdigest()
+        result = lookup_cache().get_or_set(f"geocode:{digest}", lambda: self._geocode(address))
+        return result or (None, None)
+    
+    def _geocode(self, address):
         try:
             response = requests.get(
                 "https://maps.googleapis.com/maps/api/geocode/json",
@@ -104,16 +102,12 @@ class LocationService:
                 data = response.json()
                 if data.get('status') == 'OK' and data.get('results'):
                     location = data['results'][0]['geometry']['location']
-                    lat, lng = location['lat'], location['lng']
-                    result = (lat, lng)
-                    # Cache for 24 hours
-                    cache.set(cache_key, result, 86400)
-                    return result
+                    return (location['lat'], location['lng'])
                     
         except Exception as e:
             logger.error(f"Geocoding failed for '{address}': {e}")
             
-        return None, None
+        return None
     
     def reverse_geocode(self, lat: float, lng: float) -> Optional[str]:
         """
@@ -122,13 +116,11 @@ class LocationService:
         """
         if not self.google_api_key:
             return f"Coordinates: {lat:.6f}, {lng:.6f}"
-            
-        # Check cache first
-        cache_key = f"reverse_geocode_{lat:.6f}_{lng:.6f}"
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            return cached_result
-            
+        
+        address = lookup_cache().get_or_set(f"reverse-geocode:{lat:.6f}_{lng:.6f}", lambda: self._reverse_geocode(lat, lng))
+        return address or f"Coordinates: {lat:.6f}, {lng:.6f}"
+    
+    def _reverse_geocode(self, lat, lng):
         try:
             response = requests.get(
                 "https://maps.googleapis.com/maps/api/geocode/json",
@@ -142,15 +134,12 @@ class LocationService:
             if response.status_code == 200:
                 data = response.json()
                 if data.get('status') == 'OK' and data.get('results'):
-                    address = data['results'][0]['formatted_address']
-                    # Cache for 24 hours
-                    cache.set(cache_key, address, 86400)
-                    return address
+                    return data['results'][0]['formatted_address']
                     
         except Exception as e:
             logger.error(f"Reverse geocoding failed for {lat}, {lng}: {e}")
             
-        return f"Coordinates: {lat:.6f}, {lng:.6f}"
+        return None
     
     def get_location_details(self, request, user_lat=None, user_lng=None, location_text=None) -> Dict[str, Any]:
         """
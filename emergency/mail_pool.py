@@ -0,0 +1,181 @@
+"""
+Pooled email delivery for the Emergency Blood Bank System
+Keeps a few long-lived SMTP connections open instead of doing a TLS handshake
+and login per email
+"""
+
+import logging
+import queue
+import smtplib
+import threading
+import time
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the connection itself is unusable and should be replaced
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+class _PooledConnection:
+    def __init__(self, backend):
+        self.backend = backend
+        self.last_used = time.monotonic()
+
+
+class SMTPConnectionPool:
+    """
+    Fixed-size pool of open email backend connections
+    Idle connections are recycled before the server drops them, and a send that
+    hits a dead connection reconnects and retries once
+    """
+
+    def __init__(self, size=None, max_idle=None):
+        self.size = size or getattr(settings, 'EMAIL_POOL_SIZE', 2)
+        self.max_idle = max_idle or getattr(settings, 'EMAIL_POOL_MAX_IDLE', 60)
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def _new_connection(self):
+        backend = get_connection(fail_silently=False, timeout=getattr(settings, 'EMAIL_TIMEOUT', 10))
+        backend.open()
+        return _PooledConnection(backend)
+
+    def _close(self, pooled):
+        try:
+            pooled.backend.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    pooled = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._new_connection()
+                if time.monotonic() - pooled.last_used < self.max_idle:
+                    return pooled
+                # The server has probably timed this one out already
+                self._close(pooled)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, pooled, healthy=True):
+        if healthy:
+            pooled.last_used = time.monotonic()
+            self._idle.put(pooled)
+        else:
+            self._close(pooled)
+        self._slots.release()
+
+    def send_batch(self, messages):
+        """
+        Send EmailMessages over one pooled connection
+        Returns one entry per message: None if it was sent, else the exception that
+        failed it. A rejected message doesn't stop the rest; a connection lost twice
+        fails every message not yet sent
+        """
+        messages = list(messages)
+        if not messages:
+            return []
+
+        pooled = self.acquire()
+        errors = []
+        healthy = True
+        try:
+            reconnected = False
+            while len(errors) < len(messages):
+                index = len(errors)
+                try:
+                    pooled.backend.send_messages(messages[index:index + 1])
+                    errors.append(None)
+                except CONNECTION_ERRORS as e:
+                    if reconnected:
+                        healthy = False
+                        errors.extend([e] * (len(messages) - index))
+                        break
+                    # Resume from the failed message so nothing is sent twice
+                    logger.warning(f"Pooled SMTP connection failed, reconnecting: {e}")
+                    self._close(pooled)
+                    pooled = self._new_connection()
+                    reconnected = True
+                except Exception as e:
+                    errors.append(e)
+        except Exception:
+            self.release(pooled, healthy=False)
+            raise
+
+        self.release(pooled, healthy)
+        return errors
+
+    def send_messages(self, messages):
+        """Send EmailMessages over one pooled connection; returns the number sent, raising the first failure"""
+        errors = self.send_batch(messages)
+        for error in errors:
+            if error is not None:
+                raise error
+        return len(errors)
+
+    def close_all(self):
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+
+
+def _settings_key():
+    return (
+        getattr(settings, 'EMAIL_BACKEND', ''),
+        getattr(settings, 'EMAIL_HOST', ''),
+        getattr(settings, 'EMAIL_PORT', None),
+        getattr(settings, 'EMAIL_HOST_USER', ''),
+    )
+
+
+def get_mail_pool():
+    """Get the process-wide connection pool, rebuilt if the email settings change"""
+    global _pool, _pool_key
+    key = _settings_key()
+    if _pool is not None and _pool_key == key:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None or _pool_key != key:
+            if _pool is not None:
+                _pool.close_all()
+            _pool = SMTPConnectionPool()
+            _pool_key = key
+    return _pool
+
+
+def reset_mail_pool():
+    """Close pooled connections and drop the pool"""
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _pool = None
+        _pool_key = None
+
+
+def build_email(subject, message, from_email, recipient_list, html_message=None):
+    email = EmailMultiAlternatives(subject, message, from_email, recipient_list)
+    if html_message:
+        email.attach_alternative(html_message, 'text/html')
+    return email
+
+
+def send_pooled_mail(subject, message, from_email, recipient_list, html_message=None):
+    """Drop-in replacement for send_mail() that reuses a pooled connection"""
+    email = build_email(subject, message, from_email, recipient_list, html_message)
+    return get_mail_pool().send_messages([email])
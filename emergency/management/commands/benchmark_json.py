@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.text import compress_string
+from emergency.compression import brotli
+from emergency.inventory import BLOOD_TYPES
+from emergency.serialization import InventoryHospitalRow, dumps, orjson
+import json
+import random
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmark live-inventory JSON encoding (time) and compression (payload size)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hospitals', type=int, default=500, help='Hospitals in the payload (default: 500)')
+        parser.add_argument('--iterations', type=int, default=200, help='Encodes per timing (default: 200)')
+
+    def _payload(self, count):
+        rng = random.Random(42)
+        rows = []
+        for i in range(count):
+            inventory = {blood_type: rng.randint(0, 40) for blood_type in BLOOD_TYPES}
+            rows.append(InventoryHospitalRow(
+                id=i, name=f"Hospital {i}", city='Mumbai', address=f"{i} Hospital Road, Mumbai",
+                phone='+912224136051', emergency_phone='+912224136000', operates_24x7=bool(i % 3),
+                inventory=inventory, total_units=sum(inventory.values()), distance=round(rng.uniform(0, 50), 1),
+            ))
+        return rows
+
+    def _time(self, encode, data, iterations):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            body = encode(data)
+        return (time.perf_counter() - start) / iterations * 1000, body
+
+    def handle(self, *args, **options):
+        rows = self._payload(options['hospitals'])
+        iterations = options['iterations']
+
+        # Before: dicts with preformatted distance strings through the stdlib encoder
+        legacy = {'success': True, 'data': {'hospitals': [
+            {**{field: getattr(row, field) for field in row.__slots__}, 'distance': f"{row.distance:.1f}"} for row in rows
+        ]}}
+        current = {'success': True, 'data': {'hospitals': rows}}
+
+        legacy_ms, legacy_body = self._time(
+            lambda data: json.dumps(data, cls=DjangoJSONEncoder).encode(), legacy, iterations
+        )
+        current_ms, current_body = self._time(dumps, current, iterations)
+
+        self.stdout.write(f"{options['hospitals']} hospitals, {iterations} iterations")
+        self.stdout.write(f"  json + dicts:        {legacy_ms:8.3f} ms/encode  {len(legacy_body):>9,} bytes")
+        self.stdout.write(
+            f"  {'orjson' if orjson else 'json (no orjson)'} + rows:".ljust(23)
+            + f"{current_ms:8.3f} ms/encode  {len(current_body):>9,} bytes"
+        )
+        if legacy_ms and current_ms:
+            self.stdout.write(f"  speedup:             {legacy_ms / current_ms:8.1f}x")
+
+        gzip_ms, gzipped = self._time(compress_string, current_body, max(iterations // 10, 1))
+        self.stdout.write(f"  gzip:                {gzip_ms:8.3f} ms        {len(gzipped):>9,} bytes")
+        if brotli is not None:
+            brotli_ms, compressed = self._time(lambda body: brotli.compress(body, quality=5), current_body, max(iterations // 10, 1))
+            self.stdout.write(f"  brotli (q5):         {brotli_ms:8.3f} ms        {len(compressed):>9,} bytes")
+        else:
+            self.stdout.write("  brotli:              not installed (pip install Brotli)")
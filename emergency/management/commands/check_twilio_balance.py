@@ -1,8 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from django.utils import timezone
-from twilio.rest import Client
 from twilio.base.exceptions import TwilioException
+from emergency.twilio_client import get_twilio_client
 import logging
 
 logger = logging.getLogger(__name__)
@@ -25,7 +25,9 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         try:
-            client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+            client = get_twilio_client()
+            if client is None:
+                raise TwilioException("Twilio credentials are not configured")
             
             # Get account information
             account = client.api.accounts(settings.TWILIO_ACCOUNT_SID).fetch()
@@ -0,0 +1,144 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+import multiprocessing
+import signal
+import threading
+import logging
+
+from emergency.followups import FollowUpScheduler
+from emergency.jobs import JobWorker, default_worker_id
+from emergency.twilio_client import warm_twilio_client_async
+
+logger = logging.getLogger(__name__)
+
+
+def _run_threads(threads, batch_size, poll_interval, once, min_priority=None, timers=False):
+    """Run `threads` job workers in the current process until stopped"""
+    workers = [
+        JobWorker(
+            batch_size=batch_size,
+            poll_interval=poll_interval,
+            worker_id=f"{default_worker_id()}-{i}",
+            min_priority=min_priority
+        )
+        for i in range(threads)
+    ]
+
+    # One timer wheel per deployment is enough; extra ones only duplicate the table scans
+    scheduler = FollowUpScheduler() if timers else None
+
+    if once:
+        if scheduler:
+            scheduler.run_once()
+        return sum(worker.run_once() for worker in workers)
+
+    warm_twilio_client_async()
+
+    def shutdown(signum, frame):
+        for worker in workers:
+            worker.stop()
+        if scheduler:
+            scheduler.stop()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    pool = [threading.Thread(target=worker.run_forever, name=worker.worker_id) for worker in workers]
+    if scheduler:
+        pool.append(threading.Thread(target=scheduler.run_forever, name='follow-up-scheduler'))
+    for thread in pool:
+        thread.start()
+    # Join with a timeout so the main thread keeps handling signals
+    while any(thread.is_alive() for thread in pool):
+        for thread in pool:
+            thread.join(timeout=1.0)
+    return 0
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers for the database-backed job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=2,
+            help='Worker threads per process (default: 2)'
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=1,
+            help='Worker processes to start (default: 1)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1,
+            help='Jobs claimed per poll by each worker (default: 1)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when the queue is empty (default: 1.0)'
+        )
+        parser.add_argument(
+            '--min-priority',
+            type=int,
+            default=None,
+            help='Only run jobs of at least this priority, e.g. a reserved lane for CRITICAL requests'
+        )
+        parser.add_argument(
+            '--no-timers',
+            action='store_true',
+            help='Do not run the follow-up SMS scheduler in this worker'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run a single claim cycle and exit'
+        )
+
+    def handle(self, *args, **options):
+        threads = max(1, options['threads'])
+        processes = max(1, options['processes'])
+        batch_size = max(1, options['batch_size'])
+        poll_interval = options['poll_interval']
+        once = options['once']
+        min_priority = options['min_priority']
+        timers = not options['no_timers']
+
+        self.stdout.write(f"⚙️  Starting job worker: {processes} process(es) x {threads} thread(s)")
+
+        if processes == 1:
+            processed = _run_threads(threads, batch_size, poll_interval, once, min_priority, timers)
+            if once:
+                self.stdout.write(self.style.SUCCESS(f"✅ Processed {processed} job(s)"))
+            return
+
+        # Children must not share the parent's database connections
+        connections.close_all()
+        children = [
+            multiprocessing.Process(
+                target=_run_threads,
+                args=(threads, batch_size, poll_interval, once, min_priority, timers and i == 0),
+                name=f"job-worker-{i}"
+            )
+            for i in range(processes)
+        ]
+        for child in children:
+            child.start()
+
+        def shutdown(signum, frame):
+            for child in children:
+                if child.is_alive():
+                    child.terminate()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        for child in children:
+            child.join()
+
+        self.stdout.write(self.style.SUCCESS("✅ Job workers stopped"))
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0004_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergencyrequest',
+            name='notification_results',
+            field=models.JSONField(blank=True, default=dict, help_text='Per-channel outcome and latency'),
+        ),
+    ]
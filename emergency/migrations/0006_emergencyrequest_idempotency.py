@@ -0,0 +1,27 @@
+# Generated by Django 4.2.16 on 2026-10-19 08:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0005_emergencyrequest_notification_results'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergencyrequest',
+            name='duplicate_count',
+            field=models.PositiveIntegerField(default=0, help_text='Repeat submissions attached to this request'),
+        ),
+        migrations.AddField(
+            model_name='emergencyrequest',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='Client or Twilio key for safe retries', max_length=100, null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='emergencyrequest',
+            index=models.Index(fields=['contact_phone', 'blood_group', 'created_at'], name='emergency_req_coalesce_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.16 on 2026-10-19 08:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0006_emergencyrequest_idempotency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboundSMS',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_sid', models.CharField(blank=True, help_text='Twilio MessageSid', max_length=64, null=True, unique=True)),
+                ('from_number', models.CharField(max_length=20)),
+                ('to_number', models.CharField(blank=True, max_length=20)),
+                ('body', models.TextField(blank=True)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('RECEIVED', 'Received'), ('PROCESSED', 'Processed')], default='RECEIVED', max_length=20)),
+                ('reply', models.TextField(blank=True)),
+                ('reply_sent', models.BooleanField(default=False)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Inbound SMS',
+                'verbose_name_plural': 'Inbound SMS',
+                'ordering': ['-received_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='ordering_key',
+            field=models.CharField(blank=True, help_text='Jobs sharing a key run one at a time, oldest first', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='backgroundjob',
+            index=models.Index(fields=['ordering_key', 'status'], name='emergency_job_ordering_idx'),
+        ),
+        migrations.AddField(
+            model_name='inboundsms',
+            name='emergency_request',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='inbound_messages', to='emergency.emergencyrequest'),
+        ),
+        migrations.AddIndex(
+            model_name='inboundsms',
+            index=models.Index(fields=['from_number', 'received_at'], name='emergency_inbound_sender_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-19 08:56
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Length
+
+
+def backfill_provider_message_id(apps, schema_editor):
+    """Copy real provider IDs out of provider_response, skipping simulated sends"""
+    EmergencyNotification = apps.get_model('emergency', 'EmergencyNotification')
+    EmergencyNotification.objects.annotate(
+        response_length=Length('provider_response')
+    ).filter(
+        notification_type='SMS', response_length__gt=0, response_length__lte=100
+    ).exclude(
+        provider_response__startswith='SIMULATED'
+    ).update(provider_message_id=F('provider_response'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0007_inboundsms_job_ordering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergencynotification',
+            name='provider_message_id',
+            field=models.CharField(blank=True, db_index=True, help_text='Provider message ID matched by delivery status callbacks', max_length=100),
+        ),
+        migrations.RunPython(backfill_provider_message_id, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-19 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0008_notification_provider_message_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergencyrequest',
+            name='failed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='emergencyrequest',
+            name='found_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='emergencyrequest',
+            name='notified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='emergencyrequest',
+            name='searching_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.16 on 2026-10-19 09:01
+
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def backfill_effective_at(apps, schema_editor):
+    """Order existing jobs by run_at less their priority head start"""
+    BackgroundJob = apps.get_model('emergency', 'BackgroundJob')
+    step = getattr(settings, 'JOB_PRIORITY_AGING_SECONDS', 30)
+    pending = BackgroundJob.objects.filter(status__in=['QUEUED', 'RUNNING'])
+    for job in pending.only('id', 'run_at', 'priority').iterator():
+        BackgroundJob.objects.filter(id=job.id).update(
+            effective_at=job.run_at - timedelta(seconds=job.priority * step)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0009_emergencyrequest_stage_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='effective_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='run_at brought forward by the priority; ready jobs run in this order'),
+        ),
+        migrations.AddIndex(
+            model_name='backgroundjob',
+            index=models.Index(fields=['status', 'effective_at'], name='emergency_job_effective_idx'),
+        ),
+        migrations.RunPython(backfill_effective_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.16 on 2026-10-19 09:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0010_backgroundjob_effective_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowUpTimer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_type', models.CharField(choices=[('update', 'Status Update'), ('reminder', 'Reminder')], max_length=20)),
+                ('offset_minutes', models.PositiveIntegerField(help_text='Minutes after the request was created')),
+                ('due_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('FIRED', 'Fired'), ('CANCELLED', 'Cancelled')], default='PENDING', max_length=20)),
+                ('fired_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='follow_up_timers', to='emergency.emergencyrequest')),
+            ],
+            options={
+                'verbose_name': 'Follow-up Timer',
+                'verbose_name_plural': 'Follow-up Timers',
+                'ordering': ['due_at'],
+                'indexes': [models.Index(fields=['status', 'due_at'], name='emergency_followup_due_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='followuptimer',
+            constraint=models.UniqueConstraint(fields=('request', 'message_type', 'offset_minutes'), name='emergency_followup_unique'),
+        ),
+    ]
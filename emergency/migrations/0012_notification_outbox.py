@@ -0,0 +1,43 @@
+# Generated by Django 4.2.16 on 2026-10-19 09:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0011_followuptimer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergencynotification',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='emergencynotification',
+            name='channel',
+            field=models.CharField(blank=True, help_text='Fan-out channel, e.g. sms, admin_sms, email', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='emergencynotification',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='emergencynotification',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='emergencynotification',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='emergencynotification',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='emergency_outbox_ready_idx'),
+        ),
+    ]
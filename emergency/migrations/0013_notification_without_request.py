@@ -0,0 +1,24 @@
+# Generated by Django 4.2.16 on 2026-10-19 09:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0012_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergencynotification',
+            name='html_message',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='emergencynotification',
+            name='request',
+            field=models.ForeignKey(blank=True, help_text='Empty for notifications outside an emergency request', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='emergency.emergencyrequest'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.16 on 2026-10-19 09:42
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0014_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryStatusUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider_message_id', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SENT', 'Sent Successfully'), ('FAILED', 'Failed to Send'), ('DELIVERED', 'Delivered')], max_length=20)),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Delivery Status Update',
+                'verbose_name_plural': 'Delivery Status Updates',
+            },
+        ),
+    ]
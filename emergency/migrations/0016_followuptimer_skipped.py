@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 09:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0015_deliverystatusupdate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='followuptimer',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('FIRED', 'Fired'), ('CANCELLED', 'Cancelled'), ('SKIPPED', 'Skipped')], default='PENDING', max_length=20),
+        ),
+    ]
@@ -107,6 +107,11 @@ class EmergencyBloodStock(models.Model):
         """Convert bags to milliliters"""
         return self.units_available * getattr(settings, 'BLOOD_BAG_TO_ML_RATIO', 350)
 
+class InvalidTransition(Exception):
+    """Raised when a request is moved to a status its lifecycle doesn't allow"""
+    pass
+
+
 class EmergencyRequest(models.Model):
     """Emergency blood request model - no login required"""
     
@@ -130,6 +135,29 @@ class EmergencyRequest(models.Model):
         ('FAILED', 'No Hospitals Available'),
     ]
     
+    # Lifecycle: status -> statuses it may move to. Re-entering SEARCHING lets a
+    # retried job pick up a request whose previous attempt died part way
+    TRANSITIONS = {
+        'PENDING': {'SEARCHING', 'FAILED', 'COMPLETED'},
+        'SEARCHING': {'SEARCHING', 'FOUND', 'FAILED'},
+        'FOUND': {'SEARCHING', 'NOTIFIED', 'FAILED', 'COMPLETED'},
+        'NOTIFIED': {'COMPLETED'},
+        'FAILED': {'SEARCHING', 'COMPLETED'},
+        'COMPLETED': set(),
+    }
+    
+    # No follow-up SMS is sent once a request has reached one of these
+    FINISHED_STATUSES = ('COMPLETED', 'FAILED')
+    
+    # Field stamped when the request enters each status
+    STAGE_TIMESTAMPS = {
+        'SEARCHING': 'searching_at',
+        'FOUND': 'found_at',
+        'NOTIFIED': 'notified_at',
+        'COMPLETED': 'completed_at',
+        'FAILED': 'failed_at',
+    }
+    
     URGENCY_LEVELS = [
         ('CRITICAL', 'Critical - Life Threatening'),
         ('URGENT', 'Urgent - Within Hours'),
@@ -165,10 +193,19 @@ class EmergencyRequest(models.Model):
     notification_sent = models.BooleanField(default=False)
     sms_sent = models.BooleanField(default=False)
     email_sent = models.BooleanField(default=False)
+    notification_results = models.JSONField(default=dict, blank=True, help_text="Per-channel outcome and latency")
+    
+    # Duplicate handling
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True, unique=True, help_text="Client or Twilio key for safe retries")
+    duplicate_count = models.PositiveIntegerField(default=0, help_text="Repeat submissions attached to this request")
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    searching_at = models.DateTimeField(null=True, blank=True)
+    found_at = models.DateTimeField(null=True, blank=True)
+    notified_at = models.DateTimeField(null=True, blank=True)
+    failed_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     
     # Notes and feedback
@@ -179,6 +216,9 @@ class EmergencyRequest(models.Model):
         verbose_name = "Emergency Request"
         verbose_name_plural = "Emergency Requests"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['contact_phone', 'blood_group', 'created_at'], name='emergency_req_coalesce_idx'),
+        ]
     
     def __str__(self):
         return f"Emergency: {self.blood_group} ({self.quantity_needed} bags) - {self.get_status_display()}"
@@ -215,11 +255,41 @@ class EmergencyRequest(models.Model):
         max_results = getattr(settings, 'MAX_EMERGENCY_RESULTS', 10)
         return [hospital for hospital, distance in available_hospitals[:max_results]]
     
+    def transition_to(self, status, save=True, update_fields=()):
+        """
+        Move to a new status and stamp its stage timestamp
+        Saves only the changed columns plus any extra update_fields; pass save=False
+        to batch the change with other writes. Returns the fields that need saving
+        """
+        if status not in self.TRANSITIONS[self.status]:
+            raise InvalidTransition(f"Emergency request {self.request_id} cannot go from {self.status} to {status}")
+        
+        self.status = status
+        fields = ['status', 'updated_at', *update_fields]
+        stamp_field = self.STAGE_TIMESTAMPS.get(status)
+        if stamp_field:
+            setattr(self, stamp_field, timezone.now())
+            fields.append(stamp_field)
+        
+        if save:
+            self.save(update_fields=fields)
+        return fields
+    
+    def stage_latencies(self):
+        """Seconds spent reaching each recorded stage, measured from the previous one"""
+        latencies = {}
+        previous = self.created_at
+        for status in ['SEARCHING', 'FOUND', 'FAILED', 'NOTIFIED', 'COMPLETED']:
+            reached = getattr(self, self.STAGE_TIMESTAMPS[status])
+            if reached and previous:
+                latencies[status] = round((reached - previous).total_seconds(), 3)
+                previous = reached
+        return latencies
+    
     def mark_completed(self):
         """Mark request as completed"""
-        self.status = 'COMPLETED'
-        self.completed_at = timezone.now()
-        self.save()
+        self.transition_to('COMPLETED')
+        self.follow_up_timers.filter(status='PENDING').update(status='CANCELLED')
     
     def get_search_summary(self):
         """Get summary of search results"""
@@ -246,13 +316,16 @@ class EmergencyNotification(models.Model):
         ('DELIVERED', 'Delivered'),
     ]
     
-    request = models.ForeignKey(EmergencyRequest, on_delete=models.CASCADE, related_name='notifications')
+    request = models.ForeignKey(EmergencyRequest, on_delete=models.CASCADE, related_name='notifications',
+                                null=True, blank=True, help_text="Empty for notifications outside an emergency request")
     notification_type = models.CharField(max_length=10, choices=NOTIFICATION_TYPES)
+    channel = models.CharField(max_length=20, blank=True, help_text="Fan-out channel, e.g. sms, admin_sms, email")
     recipient = models.CharField(max_length=200, help_text="Phone number or email")
     
     # Message Content
     subject = models.CharField(max_length=200, blank=True)
     message = models.TextField()
+    html_message = models.TextField(blank=True)
     
     # Status Tracking
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
@@ -261,14 +334,25 @@ class EmergencyNotification(models.Model):
     
     # Response Tracking
     provider_response = models.TextField(blank=True, help_text="Response from SMS/Email provider")
+    provider_message_id = models.CharField(max_length=100, blank=True, db_index=True,
+                                           help_text="Provider message ID matched by delivery status callbacks")
     error_message = models.TextField(blank=True)
     
+    # Outbox dispatch: PENDING rows are sent by emergency.outbox
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=64, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         verbose_name = "Emergency Notification"
         verbose_name_plural = "Emergency Notifications"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='emergency_outbox_ready_idx'),
+        ]
     
     def __str__(self):
         return f"{self.notification_type} to {self.recipient} - {self.get_status_display()}"
@@ -483,3 +567,161 @@ class EmergencyAnalytics(models.Model):
     
     def __str__(self):
         return f"Analytics for {self.date} - {self.blood_group or 'All'}"
+
+class InboundSMS(models.Model):
+    """Inbound SMS stored by the webhook and processed in the background"""
+    
+    STATUS_CHOICES = [
+        ('RECEIVED', 'Received'),
+        ('PROCESSED', 'Processed'),
+    ]
+    
+    message_sid = models.CharField(max_length=64, unique=True, null=True, blank=True, help_text="Twilio MessageSid")
+    from_number = models.CharField(max_length=20)
+    to_number = models.CharField(max_length=20, blank=True)
+    body = models.TextField(blank=True)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    
+    # Processing outcome
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='RECEIVED')
+    emergency_request = models.ForeignKey(EmergencyRequest, on_delete=models.SET_NULL, null=True, blank=True, related_name='inbound_messages')
+    reply = models.TextField(blank=True)
+    reply_sent = models.BooleanField(default=False)
+    
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Inbound SMS"
+        verbose_name_plural = "Inbound SMS"
+        ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['from_number', 'received_at'], name='emergency_inbound_sender_idx'),
+        ]
+    
+    def __str__(self):
+        return f"SMS from {self.from_number} - {self.get_status_display()}"
+
+class DeliveryStatusUpdate(models.Model):
+    """SMS delivery-status callback stored before it is acknowledged and applied in bulk"""
+    
+    provider_message_id = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=EmergencyNotification.STATUS_CHOICES)
+    received_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = "Delivery Status Update"
+        verbose_name_plural = "Delivery Status Updates"
+    
+    def __str__(self):
+        return f"{self.provider_message_id} -> {self.status}"
+
+class FollowUpTimer(models.Model):
+    """Pending follow-up SMS for a request, fired by the scheduler at due_at"""
+    
+    MESSAGE_TYPES = [
+        ('update', 'Status Update'),
+        ('reminder', 'Reminder'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('FIRED', 'Fired'),
+        ('CANCELLED', 'Cancelled'),
+        ('SKIPPED', 'Skipped'),
+    ]
+    
+    request = models.ForeignKey(EmergencyRequest, on_delete=models.CASCADE, related_name='follow_up_timers')
+    message_type = models.CharField(max_length=20, choices=MESSAGE_TYPES)
+    offset_minutes = models.PositiveIntegerField(help_text="Minutes after the request was created")
+    due_at = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    fired_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Follow-up Timer"
+        verbose_name_plural = "Follow-up Timers"
+        ordering = ['due_at']
+        constraints = [
+            models.UniqueConstraint(fields=['request', 'message_type', 'offset_minutes'], name='emergency_followup_unique'),
+        ]
+        indexes = [
+            # The scheduler only ever range-scans pending timers by due time
+            models.Index(fields=['status', 'due_at'], name='emergency_followup_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_message_type_display()} +{self.offset_minutes}min for {self.request.request_id} - {self.get_status_display()}"
+
+class BackgroundJob(models.Model):
+    """Durable job queue entry processed by the background workers"""
+    
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('SUCCEEDED', 'Succeeded'),
+        ('DEAD', 'Dead-lettered'),
+    ]
+    
+    task = models.CharField(max_length=100, help_text="Registered task name")
+    payload = models.JSONField(default=dict, blank=True)
+    priority = models.IntegerField(default=0, help_text="Higher runs first")
+    effective_at = models.DateTimeField(default=timezone.now, help_text="run_at brought forward by the priority; ready jobs run in this order")
+    ordering_key = models.CharField(max_length=100, blank=True, help_text="Jobs sharing a key run one at a time, oldest first")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='QUEUED')
+    
+    # Retry tracking
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now, help_text="Earliest time the job may run")
+    last_error = models.TextField(blank=True)
+    
+    # Claim tracking
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Background Job"
+        verbose_name_plural = "Background Jobs"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='emergency_job_ready_idx'),
+            models.Index(fields=['ordering_key', 'status'], name='emergency_job_ordering_idx'),
+            models.Index(fields=['status', 'effective_at'], name='emergency_job_effective_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.task} #{self.pk} - {self.get_status_display()}"
+
+class BackgroundJobLock(models.Model):
+    """Claim marker for databases without SELECT ... FOR UPDATE SKIP LOCKED"""
+    
+    job = models.OneToOneField(BackgroundJob, on_delete=models.CASCADE, related_name='lock')
+    locked_by = models.CharField(max_length=100)
+    acquired_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Background Job Lock"
+        verbose_name_plural = "Background Job Locks"
+    
+    def __str__(self):
+        return f"Job #{self.job_id} locked by {self.locked_by}"
+
+
+class RateLimitBucket(models.Model):
+    """Token bucket shared by every worker when Redis is not configured (see emergency/ratelimit.py)"""
+    
+    key = models.CharField(max_length=255, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.FloatField(db_index=True, help_text="Unix time of the last refill")
+    
+    class Meta:
+        verbose_name = "Rate Limit Bucket"
+        verbose_name_plural = "Rate Limit Buckets"
+    
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.1f} tokens"
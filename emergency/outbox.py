@@ -0,0 +1,319 @@
+"""
+Transactional outbox for emergency notifications
+Callers stage PENDING EmergencyNotification rows in the same transaction as the
+request's state change, together with a dispatch job. The dispatcher claims
+ready rows in batches, sends them concurrently and records each outcome;
+failures are retried with backoff. Ready emails go out together over one pooled
+SMTP connection rather than one connection each. Delivery is at-least-once: a dispatcher that
+dies mid-batch leaves its claims to expire and be sent again, but a committed
+notification is never dropped
+"""
+
+import logging
+import threading
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .fanout import dispatch_channels, pool_size
+from .jobs import effective_at, enqueue, retry_delay, wake_local_runner, wake_local_timer
+from .mail_pool import build_email, get_mail_pool
+from .models import BackgroundJob, EmergencyNotification, EmergencyRequest
+from .sms_providers import SMSDeliveryError, get_sms_router
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_TASK = 'emergency.dispatch_outbox'
+
+# The dispatch job staged by this thread's open transaction
+_scheduled = threading.local()
+
+
+def stage_notification(emergency_request, channel, notification_type, recipient, message, subject='', html_message=''):
+    """
+    Add a notification to the outbox; call inside the transaction making the state change
+    emergency_request may be None for notifications outside an emergency request.
+    The dispatch job commits (or rolls back) with it
+    """
+    notification = EmergencyNotification.objects.create(
+        request=emergency_request,
+        notification_type=notification_type,
+        channel=channel,
+        recipient=recipient,
+        subject=subject,
+        message=message,
+        html_message=html_message,
+        status='PENDING',
+    )
+    _schedule_once(_request_priority(emergency_request) if emergency_request else 0)
+    return notification
+
+
+def _request_priority(emergency_request):
+    from .tasks import urgency_priority
+    return urgency_priority(emergency_request.urgency)
+
+
+def _schedule_once(priority):
+    """
+    One dispatch job per transaction, however many notifications it stages
+    The job is stored in the transaction so it commits with the rows. The thread
+    remembers it until commit by its one-off ordering_key; a job rolled back with
+    a savepoint is no longer found, and a fresh one is queued in its place
+    """
+    job = getattr(_scheduled, 'job', None)
+    if job is not None and transaction.get_connection().in_atomic_block:
+        if BackgroundJob.objects.filter(id=job.id, ordering_key=job.ordering_key, status='QUEUED').exists():
+            if priority > job.priority:
+                job.priority = priority
+                job.effective_at = effective_at(job.run_at, priority)
+                job.save(update_fields=['priority', 'effective_at'])
+            return
+    _scheduled.job = enqueue(DISPATCH_TASK, priority=priority, ordering_key=f"outbox:{uuid.uuid4().hex}")
+    transaction.on_commit(_dispatch_committed)
+
+
+def _dispatch_committed():
+    _scheduled.job = None
+    wake_local_runner()
+
+
+def schedule_dispatch(delay=None, priority=0):
+    """Queue a dispatcher run with the current transaction"""
+    enqueue(DISPATCH_TASK, priority=priority, delay=delay)
+    if delay:
+        wake_local_timer()
+    else:
+        wake_local_runner()
+
+
+def _claim_batch(limit, kind=Q()):
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, 'OUTBOX_CLAIM_TIMEOUT_SECONDS', 120))
+    claimable = Q(claimed_at__isnull=True) | Q(claimed_at__lt=stale)
+    ids = list(EmergencyNotification.objects.filter(
+        kind, claimable, status='PENDING', next_attempt_at__lte=now
+    ).order_by('id').values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+
+    # Re-checking the claim condition in the UPDATE means a row lost to a
+    # concurrent dispatcher is simply skipped
+    token = uuid.uuid4().hex
+    EmergencyNotification.objects.filter(claimable, id__in=ids, status='PENDING').update(
+        claimed_by=token, claimed_at=now
+    )
+    return list(EmergencyNotification.objects.filter(claimed_by=token, status='PENDING').order_by('id'))
+
+
+def _send_sms(notification):
+    sms_router = get_sms_router()
+    if not sms_router.is_configured():
+        logger.warning(f"No SMS provider configured. SMS to {notification.recipient} simulated:\n{notification.message}")
+        return 'SIMULATED'
+
+    result = sms_router.send(notification.recipient, notification.message)
+    if not result['success']:
+        raise SMSDeliveryError('; '.join(result['errors']))
+    return result['message_id'] or ''
+
+
+def _send_emails(notifications):
+    """Send emails over one pooled SMTP connection; returns {notification id: exception or None}"""
+    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'emergency@bloodbank.com')
+    messages = [
+        build_email(
+            subject=notification.subject,
+            message=notification.message,
+            from_email=from_email,
+            recipient_list=[notification.recipient],
+            html_message=notification.html_message or None,
+        )
+        for notification in notifications
+    ]
+    errors = get_mail_pool().send_batch(messages)
+    return {notification.id: error for notification, error in zip(notifications, errors)}
+
+
+SENDERS = {
+    'SMS': _send_sms,
+}
+
+EMAILS = Q(notification_type='EMAIL')
+EMAIL_BATCH = 'emails'  # fan-out entry that sends every claimed email
+
+
+def _sender(notification, message_ids):
+    def send():
+        message_ids[notification.id] = SENDERS[notification.notification_type](notification)
+        return True
+    return send
+
+
+def _email_sender(emails, email_errors):
+    def send():
+        email_errors.update(_send_emails(emails))
+        return True
+    return send
+
+
+def _email_result(notification, batch_result, email_errors):
+    """One email's share of the email batch's outcome"""
+    error = email_errors.get(notification.id)
+    if batch_result['outcome'] == 'sent' and error is not None:
+        return {**batch_result, 'outcome': 'error', 'error': str(error)[:200]}
+    return batch_result
+
+
+def dispatch_batch(limit=None):
+    """
+    Claim and send one batch; returns the number of notifications handled
+    Up to OUTBOX_EMAIL_BATCH_SIZE emails are sent as one fan-out entry over a
+    single SMTP connection; other notifications get an entry each. Entries are
+    capped at the fan-out pool size so no send waits in the queue behind
+    another. A send still running at its deadline keeps its claim and has its
+    outcome recorded when it finishes, rather than being sent again
+    """
+    slots = min(limit or getattr(settings, 'OUTBOX_BATCH_SIZE', 50), pool_size())
+    emails = _claim_batch(getattr(settings, 'OUTBOX_EMAIL_BATCH_SIZE', 50), EMAILS)
+    others = _claim_batch(slots - 1 if emails else slots, ~EMAILS)
+    batch = others + emails
+    if not batch:
+        return 0
+
+    message_ids = {}
+    email_errors = {}
+    by_id = {str(notification.id): notification for notification in others}
+
+    def on_late(name, result):
+        if name == EMAIL_BATCH:
+            for notification in emails:
+                _record_late(notification, _email_result(notification, result, email_errors), message_ids)
+        else:
+            _record_late(by_id[name], result, message_ids)
+
+    channels = [
+        (str(notification.id), _sender(notification, message_ids), notification.channel or 'sms')
+        for notification in others
+    ]
+    if emails:
+        channels.append((EMAIL_BATCH, _email_sender(emails, email_errors), 'email_batch'))
+    results = dispatch_channels(channels, on_late=on_late)
+
+    retry_at = None
+    outcomes = {}
+    for notification in batch:
+        if notification.notification_type == 'EMAIL':
+            result = _email_result(notification, results[EMAIL_BATCH], email_errors)
+        else:
+            result = results[str(notification.id)]
+        if result['outcome'] == 'timeout':
+            logger.warning(f"Notification #{notification.id} is still sending past its deadline; leaving it claimed")
+            continue
+        result, next_attempt = _record_outcome(notification, result, message_ids)
+        if next_attempt and (retry_at is None or next_attempt < retry_at):
+            retry_at = next_attempt
+        outcomes.setdefault(notification.request_id, {})[notification.channel] = result
+
+    _update_requests(outcomes)
+    if retry_at:
+        schedule_dispatch(delay=max(retry_at - timezone.now(), timedelta(0)))
+    return len(batch)
+
+
+def _record_outcome(notification, result, message_ids):
+    """Mark the notification sent or schedule its retry; returns (result, retry time)"""
+    if result['outcome'] == 'sent':
+        _record_sent(notification, message_ids.get(notification.id, ''))
+        return result, None
+    if result['outcome'] == 'not_started':
+        # Never handed to a provider, so it doesn't count as an attempt
+        EmergencyNotification.objects.filter(id=notification.id).update(claimed_by='', claimed_at=None)
+        return {**result, 'attempts': notification.attempts}, timezone.now()
+    next_attempt = _record_failure(notification, result)
+    return {**result, 'attempts': notification.attempts + 1}, next_attempt
+
+
+def _record_late(notification, result, message_ids):
+    """Record a send that finished after its deadline; runs on the fan-out thread"""
+    try:
+        result, next_attempt = _record_outcome(notification, result, message_ids)
+        _update_requests({notification.request_id: {notification.channel: result}})
+        if next_attempt:
+            schedule_dispatch(delay=max(next_attempt - timezone.now(), timedelta(0)))
+    except Exception as e:
+        logger.error(f"Could not record the late outcome of notification #{notification.id}: {e}")
+    finally:
+        close_old_connections()
+
+
+def _record_sent(notification, message_id):
+    EmergencyNotification.objects.filter(id=notification.id).update(
+        status='SENT',
+        sent_at=timezone.now(),
+        attempts=notification.attempts + 1,
+        provider_response=message_id,
+        provider_message_id='' if message_id == 'SIMULATED' else message_id,
+        error_message='',
+        claimed_by='',
+        claimed_at=None,
+    )
+
+
+def _record_failure(notification, result):
+    """Schedule a retry, or fail the notification for good; returns the retry time"""
+    attempts = notification.attempts + 1
+    error = result.get('error') or result['outcome']
+    if attempts >= getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5):
+        EmergencyNotification.objects.filter(id=notification.id).update(
+            status='FAILED', attempts=attempts, error_message=error[:500], claimed_by='', claimed_at=None
+        )
+        logger.error(f"Notification #{notification.id} to {notification.recipient} failed after {attempts} attempts: {error}")
+        return None
+
+    next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(attempts))
+    EmergencyNotification.objects.filter(id=notification.id).update(
+        attempts=attempts, next_attempt_at=next_attempt_at, error_message=error[:500], claimed_by='', claimed_at=None
+    )
+    logger.warning(f"Notification #{notification.id} to {notification.recipient} failed (attempt {attempts}), retrying: {error}")
+    return next_attempt_at
+
+
+def _update_requests(outcomes):
+    """
+    Fold channel outcomes into each request's notification_results and sent flags
+    A request whose hospitals were found becomes NOTIFIED once the requester's
+    SMS or email has actually gone out
+    """
+    for request_id, channel_results in outcomes.items():
+        if request_id is None:
+            continue
+        with transaction.atomic():
+            emergency_request = EmergencyRequest.objects.select_for_update().only(
+                'id', 'request_id', 'status', 'notification_results', 'sms_sent', 'email_sent', 'notified_at'
+            ).get(id=request_id)
+            fields = ['notification_results', 'sms_sent', 'email_sent']
+            emergency_request.notification_results = {**emergency_request.notification_results, **channel_results}
+            if channel_results.get('sms', {}).get('outcome') == 'sent':
+                emergency_request.sms_sent = True
+            if channel_results.get('email', {}).get('outcome') == 'sent':
+                emergency_request.email_sent = True
+            if emergency_request.status == 'FOUND' and (emergency_request.sms_sent or emergency_request.email_sent):
+                fields += emergency_request.transition_to('NOTIFIED', save=False)
+            emergency_request.save(update_fields=fields)
+
+
+def dispatch_outbox(max_batches=None):
+    """Drain ready notifications batch by batch; returns the number handled"""
+    max_batches = max_batches or getattr(settings, 'OUTBOX_MAX_BATCHES_PER_RUN', 20)
+    handled = 0
+    for _ in range(max_batches):
+        count = dispatch_batch()
+        if not count:
+            break
+        handled += count
+    return handled
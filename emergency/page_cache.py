@@ -0,0 +1,93 @@
+"""
+Whole-page caching for anonymous visitors
+Public pages look the same to every anonymous visitor, so their GETs are served
+from a rendered copy. Pages built from data are cached under its version
+counters - a stock or hospital change makes the next visit render afresh - and
+only for PAGE_CACHE_SECONDS; pages without data for STATIC_PAGE_CACHE_SECONDS.
+Signed-in users, query strings and responses carrying cookies or a CSRF token
+always go to the view
+"""
+
+import logging
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from . import cache_stats
+from .versions import get_versions
+
+logger = logging.getLogger(__name__)
+
+
+def _cacheable_request(request):
+    if not getattr(settings, 'PAGE_CACHE_ENABLED', True):
+        return False
+    if request.method not in ('GET', 'HEAD') or request.GET:
+        return False
+    if 'messages' in request.COOKIES:
+        return False  # A flash message is waiting to be shown
+    user = getattr(request, 'user', None)
+    return user is None or not user.is_authenticated
+
+
+def _cacheable_response(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and 'no-store' not in response.get('Cache-Control', '')
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+
+
+def _page_key(name, request, versions):
+    """Cache key for the page, or None when its version counters are unavailable"""
+    key = f"page:{name}:{request.path}"
+    if versions:
+        try:
+            key += ':' + '-'.join(str(version) for version in get_versions(*versions))
+        except Exception as e:
+            logger.warning(f"Version counters unavailable, page {name} served uncached: {e}")
+            return None
+    return key
+
+
+def cache_anonymous_page(name, versions=()):
+    """Decorator caching a public view's page for anonymous GETs under the given version counters"""
+    stats_name = cache_stats.track(f"page:{name}")
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if not _cacheable_request(request):
+                return view(request, *args, **kwargs)
+            key = _page_key(name, request, versions)
+            if key is None:
+                return view(request, *args, **kwargs)
+
+            try:
+                cached = cache.get(key)
+            except Exception as e:
+                logger.warning(f"Page cache unavailable for {name}: {e}")
+                return view(request, *args, **kwargs)
+            cache_stats.record(stats_name, cached is not None)
+            if cached is not None:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+                response['X-Page-Cache'] = 'HIT'
+                return response
+
+            response = view(request, *args, **kwargs)
+            if _cacheable_response(request, response):
+                seconds = (
+                    getattr(settings, 'PAGE_CACHE_SECONDS', 60) if versions
+                    else getattr(settings, 'STATIC_PAGE_CACHE_SECONDS', 600)
+                )
+                try:
+                    cache.set(key, (response.content, response['Content-Type']), seconds)
+                except Exception as e:
+                    logger.warning(f"Could not cache page {name}: {e}")
+                response['X-Page-Cache'] = 'MISS'
+            return response
+        return wrapped
+    return decorator
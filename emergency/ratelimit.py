@@ -0,0 +1,258 @@
+"""
+Token-bucket admission control for the public, unauthenticated endpoints
+Each request draws one token from a bucket per identity (client IP, phone,
+session). Buckets live in Redis when REDIS_URL is set - updated atomically by a
+Lua script - and in the database otherwise, so every worker shares them either
+way. CRITICAL requests draw from their own buckets so a flood of routine
+traffic can't lock out a life-threatening one. Each route decides urgency on the
+server with its own resolver, and identities come from the connection and the
+server-side session, so a client can't pick its own budget or buckets
+"""
+
+import json
+import logging
+import math
+import threading
+import time
+from functools import wraps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Greatest, Least
+from django.db.models.lookups import GreaterThanOrEqual
+from django.http import JsonResponse
+from .intake import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'10/m' -> (capacity 10, refill 10 tokens per minute as tokens/second)"""
+    count, period = rate.split('/')
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period.strip()[0].lower()]
+
+
+def _client_ip(request):
+    """
+    The address of whoever connected to the first trusted proxy
+    Hops further left in X-Forwarded-For are written by the client and ignored
+    """
+    trusted = getattr(settings, 'RATE_LIMIT_TRUSTED_PROXIES', 0)
+    if trusted:
+        hops = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+        if len(hops) >= trusted:
+            return hops[-trusted]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _request_data(request):
+    """Form or JSON fields of the request, without disturbing the view's own parsing"""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+    return request.POST
+
+
+def _phone(request, data):
+    phone = data.get('phone') or data.get('contact_phone') or data.get('From')
+    return normalize_phone(str(phone)) if phone else None
+
+
+def _session(request, data):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    session = getattr(request, 'session', None)
+    return session.session_key if session is not None else None
+
+
+IDENTITIES = {
+    'ip': lambda request, data: _client_ip(request) or None,
+    'phone': _phone,
+    'session': _session,
+}
+
+
+def no_urgency(request, data):
+    """Resolver for routes without a critical budget"""
+    return ''
+
+
+class DatabaseBuckets:
+    """
+    Buckets shared by every worker through the database, for setups without Redis
+    Each bucket is refilled and drawn in one conditional UPDATE, so concurrent
+    workers can't both spend its last token. A request's buckets are drawn in one
+    transaction and all rolled back when any of them is empty
+    """
+
+    PURGE_INTERVAL = 3600
+    IDLE_SECONDS = 86400  # Longer than any refill period, so idle buckets are full
+
+    def __init__(self):
+        self._last_purge = 0.0
+
+    def consume(self, limits, now=None):
+        """
+        Take one token from every (key, capacity, rate) bucket, or from none
+        Returns 0 when admitted, else the seconds until a token frees up
+        """
+        from .models import RateLimitBucket
+        now = time.time() if now is None else now
+        self._purge(now)
+        RateLimitBucket.objects.bulk_create(
+            [RateLimitBucket(key=key, tokens=capacity, updated_at=now) for key, capacity, _ in limits],
+            ignore_conflicts=True,
+        )
+
+        wait = 0
+        with transaction.atomic():
+            for key, capacity, rate in limits:
+                level = Least(
+                    Value(float(capacity)),
+                    F('tokens') + Greatest(Value(0.0), Value(now) - F('updated_at')) * Value(rate),
+                    output_field=FloatField(),
+                )
+                buckets = RateLimitBucket.objects.filter(key=key)
+                if not buckets.filter(GreaterThanOrEqual(level, 1)).update(tokens=level - 1, updated_at=now):
+                    tokens = buckets.annotate(level=level).values_list('level', flat=True).first() or 0
+                    wait = max(wait, (1 - tokens) / rate)
+            if wait:
+                transaction.set_rollback(True)
+        return wait
+
+    def _purge(self, now):
+        if now - self._last_purge < self.PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        from .models import RateLimitBucket
+        RateLimitBucket.objects.filter(updated_at__lt=now - self.IDLE_SECONDS).delete()
+
+
+class RedisBuckets:
+    """Buckets shared by every worker through Redis"""
+
+    # Check every bucket first so a rejection doesn't drain the others
+    SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local wait = 0
+    local levels = {}
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[i * 2])
+        local rate = tonumber(ARGV[i * 2 + 1])
+        local state = redis.call('HMGET', key, 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or capacity
+        local ts = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+        if tokens < 1 then
+            wait = math.max(wait, (1 - tokens) / rate)
+        end
+        levels[i] = tokens
+    end
+    if wait > 0 then
+        return tostring(wait)
+    end
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[i * 2])
+        local rate = tonumber(ARGV[i * 2 + 1])
+        redis.call('HSET', key, 'tokens', levels[i] - 1, 'ts', now)
+        redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+    end
+    return '0'
+    """
+
+    def __init__(self, url):
+        import redis
+        self._script = redis.Redis.from_url(url).register_script(self.SCRIPT)
+
+    def consume(self, limits, now=None):
+        now = time.time() if now is None else now
+        args = [now]
+        for _, capacity, rate in limits:
+            args.extend([capacity, rate])
+        return float(self._script(keys=[key for key, _, _ in limits], args=args))
+
+
+_buckets = None
+_buckets_lock = threading.Lock()
+
+
+def get_buckets():
+    global _buckets
+    with _buckets_lock:
+        if _buckets is None:
+            redis_url = getattr(settings, 'REDIS_URL', '')
+            _buckets = RedisBuckets(redis_url) if redis_url else DatabaseBuckets()
+        return _buckets
+
+
+def reset_buckets():
+    global _buckets
+    with _buckets_lock:
+        _buckets = None
+
+
+def check_rate_limit(route, request, urgency, data=None):
+    """Draw tokens for this request; returns 0 when admitted, else seconds to wait"""
+    if not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+        return 0
+    config = getattr(settings, 'RATE_LIMITS', {}).get(route)
+    if not config:
+        return 0
+
+    data = _request_data(request) if data is None else data
+    budget = 'default'
+    if urgency(request, data) == 'CRITICAL' and 'critical' in config:
+        config, budget = config['critical'], 'critical'
+
+    limits = []
+    for identity, rate in config.items():
+        if identity not in IDENTITIES:
+            continue
+        value = IDENTITIES[identity](request, data)
+        if value:
+            capacity, refill = parse_rate(rate)
+            limits.append((f"ratelimit:{route}:{budget}:{identity}:{value}", capacity, refill))
+    if not limits:
+        return 0
+
+    try:
+        return get_buckets().consume(limits)
+    except Exception as e:
+        # Failing open: a broken limiter must never block an emergency request
+        logger.warning(f"Rate limiter unavailable for {route}, admitting request: {e}")
+        return 0
+
+
+def too_many_requests(request, wait):
+    response = JsonResponse({
+        'success': False,
+        'error': 'Too many requests. Please wait a moment and try again. In a life-threatening emergency call 108.'
+    }, status=429)
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def rate_limit(route, urgency, rejected=too_many_requests):
+    """
+    Decorator applying the RATE_LIMITS[route] buckets to a view
+    urgency(request, data) resolves the request's urgency on the server; CRITICAL
+    draws from the route's 'critical' budget. Rejected requests get
+    rejected(request, wait), by default a JSON 429 with Retry-After
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            wait = check_rate_limit(route, request, urgency=urgency)
+            if wait:
+                logger.warning(f"Rate limited {route} request from {_client_ip(request)}")
+                return rejected(request, wait)
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,72 @@
+"""
+Real-time push for the Emergency Blood Bank System
+Request status transitions and stock changes are broadcast over the channel
+layer to WebSocket subscribers, so open pages don't have to poll the database
+"""
+
+import logging
+from asgiref.sync import async_to_sync
+from django.db import transaction
+from django.utils.text import slugify
+
+logger = logging.getLogger(__name__)
+
+IN_PROGRESS_STATUSES = ('PENDING', 'SEARCHING', 'FOUND')
+
+
+def request_group(request_id):
+    """Channel group for one emergency request"""
+    return f"emergency_request.{str(request_id).replace('-', '')}"
+
+
+def inventory_group(city=None):
+    """Channel group for stock changes - everything, or one city"""
+    if city:
+        return f"inventory.{slugify(city)[:80]}"
+    return 'inventory'
+
+
+def _group_send(groups, event):
+    from channels.layers import get_channel_layer
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    for group in groups:
+        try:
+            async_to_sync(channel_layer.group_send)(group, event)
+        except Exception as e:
+            # Push is best effort - clients fall back to polling
+            logger.warning(f"Could not publish {event['type']} to {group}: {e}")
+
+
+def request_status_event(emergency_request):
+    return {
+        'type': 'request.status',
+        'request_id': str(emergency_request.request_id),
+        'status': emergency_request.status,
+        'in_progress': emergency_request.status in IN_PROGRESS_STATUSES,
+    }
+
+
+def publish_request_status(emergency_request):
+    """Broadcast the request's current status once the surrounding transaction commits"""
+    event = request_status_event(emergency_request)
+    group = request_group(emergency_request.request_id)
+    transaction.on_commit(lambda: _group_send([group], event))
+
+
+def publish_stock_change(stock):
+    """Broadcast a single hospital/blood group stock cell once the transaction commits"""
+    hospital = stock.hospital
+    event = {
+        'type': 'inventory.delta',
+        'hospital_id': hospital.id,
+        'hospital_name': hospital.name,
+        'city': hospital.city,
+        'blood_group': stock.blood_group,
+        'units_available': stock.units_available,
+    }
+    groups = [inventory_group(), inventory_group(hospital.city)]
+    transaction.on_commit(lambda: _group_send(groups, event))
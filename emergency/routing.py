@@ -0,0 +1,7 @@
+from django.urls import path
+from . import consumers
+
+websocket_urlpatterns = [
+    path('ws/emergency/status/<uuid:request_id>/', consumers.RequestStatusConsumer.as_asgi()),
+    path('ws/emergency/inventory/', consumers.InventoryConsumer.as_asgi()),
+]
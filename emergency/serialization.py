@@ -0,0 +1,87 @@
+"""
+Fast JSON for the hot emergency endpoints
+Rows are small slotted dataclasses filled straight from values() tuples, so no
+model instances are built and numbers stay numbers (distance is a float in km,
+not a preformatted string). orjson encodes the dataclasses natively; without it
+the standard library encoder is used with the same output shape
+"""
+
+import dataclasses
+import json
+from decimal import Decimal
+from typing import Optional
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Column order of the values_list() queries the rows are built from
+HOSPITAL_ROW_FIELDS = ('id', 'name', 'address', 'city', 'phone', 'emergency_phone')
+INVENTORY_HOSPITAL_FIELDS = ('id', 'name', 'city', 'address', 'phone', 'emergency_phone', 'operates_24x7')
+
+
+@dataclasses.dataclass(slots=True)
+class HospitalRow:
+    """A hospital in search and status results"""
+    id: int
+    name: str
+    address: str
+    city: str
+    phone: str
+    emergency_phone: str
+    distance: Optional[float] = None
+
+
+@dataclasses.dataclass(slots=True)
+class InventoryHospitalRow:
+    """A hospital with its stock on the live inventory API"""
+    id: int
+    name: str
+    city: str
+    address: str
+    phone: str
+    emergency_phone: str
+    operates_24x7: bool
+    inventory: dict
+    total_units: int
+    distance: Optional[float] = None
+
+
+def km(distance):
+    """Distance rounded for display, or None when it couldn't be computed"""
+    if distance is None or distance == float('inf'):
+        return None
+    return round(distance, 1)
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type {type(value).__name__} is not JSON serializable")
+
+
+class _FallbackEncoder(DjangoJSONEncoder):
+    def default(self, value):
+        if dataclasses.is_dataclass(value):
+            return {field.name: getattr(value, field.name) for field in dataclasses.fields(value)}
+        if isinstance(value, Decimal):
+            return float(value)
+        return super().default(value)
+
+
+def dumps(data):
+    """Encode data to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, cls=_FallbackEncoder, separators=(',', ':')).encode()
+
+
+class FastJsonResponse(HttpResponse):
+    """JsonResponse counterpart encoded with dumps()"""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
@@ -1,9 +1,7 @@
 from django.conf import settings
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from django.utils import timezone
 from .models import EmergencyNotification
+from .twilio_client import get_twilio_client
+from .sms_providers import get_sms_router
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,107 +10,28 @@ class NotificationService:
     """Simple notification service - back to basics"""
     
     def __init__(self):
-        self.twilio_configured = bool(
-            getattr(settings, 'TWILIO_ACCOUNT_SID', '') and
-            getattr(settings, 'TWILIO_AUTH_TOKEN', '') and
-            getattr(settings, 'TWILIO_PHONE_NUMBER', '')
+        self.sms_router = get_sms_router()
+        self.sms_configured = self.sms_router.is_configured()
+    
+    def queue_emergency_sms(self, emergency_request, hospitals):
+        """Stage the patient SMS in the notification outbox; call inside the request's transaction"""
+        from .outbox import stage_notification
+        return stage_notification(
+            emergency_request, 'sms', 'SMS', emergency_request.contact_phone,
+            self._create_simple_sms_message(emergency_request, hospitals)
         )
     
-    def send_emergency_sms(self, emergency_request, hospitals):
-        """Send professional emergency SMS notification with distance information"""
-        if not self.twilio_configured:
-            logger.warning("Twilio not configured. SMS will be simulated.")
-            return self._simulate_sms(emergency_request, hospitals)
-        
-        # Check if we've hit limits recently
-        if self._check_recent_failures():
-            logger.warning("Recent SMS failures detected. Checking account status...")
-            return self._simulate_sms(emergency_request, hospitals)
-        
-        try:
-            from twilio.rest import Client
-            
-            client = Client(
-                settings.TWILIO_ACCOUNT_SID,
-                settings.TWILIO_AUTH_TOKEN
-            )
-            
-            # Create simple message
-            message = self._create_simple_sms_message(emergency_request, hospitals)
-            
-            # Send SMS - try phone number first, fallback to verified caller ID
-            from_number = settings.TWILIO_PHONE_NUMBER
-            if not from_number:
-                # Try to use verified caller ID as fallback
-                try:
-                    caller_ids = client.outgoing_caller_ids.list(limit=1)
-                    if caller_ids:
-                        from_number = caller_ids[0].phone_number
-                        logger.info(f"Using verified caller ID as from number: {from_number}")
-                except:
-                    pass
-            
-            if not from_number:
-                raise Exception("No Twilio phone number or verified caller ID available")
-            
-            message_response = client.messages.create(
-                body=message,
-                from_=from_number,
-                to=emergency_request.contact_phone
-            )
-            
-            # Log notification
-            EmergencyNotification.objects.create(
-                request=emergency_request,
-                notification_type='SMS',
-                recipient=emergency_request.contact_phone,
-                message=message,
-                status='SENT',
-                provider_response=message_response.sid
-            )
-            
-            logger.info(f"SMS sent successfully to {emergency_request.contact_phone}")
-            return True
-            
-        except ImportError:
-            logger.warning("Twilio library not installed. SMS simulated.")
-            return self._simulate_sms(emergency_request, hospitals)
-        except Exception as e:
-            error_message = str(e)
-            logger.error(f"Error sending SMS: {error_message}")
-            
-            # Enhanced error handling for common Twilio issues
-            if "exceeded" in error_message.lower():
-                if "daily" in error_message.lower():
-                    logger.warning("Twilio daily SMS limit reached. This is common with Trial accounts.")
-                    print("\n*** TWILIO DAILY LIMIT REACHED ***")
-                    print("Your Twilio Trial account has reached its daily SMS limit.")
-                    print("Solutions:")
-                    print("1. Wait for daily limit to reset (usually at midnight UTC)")
-                    print("2. Upgrade to a paid Twilio account for higher limits")
-                    print("3. Check Twilio Console for spending limits")
-                    print("4. The system will continue to work, but SMS notifications are paused")
-                    print("Current balance: Check your Twilio Console for balance info")
-                else:
-                    logger.warning("Twilio account limit exceeded (not daily limit)")
-            elif "authentication" in error_message.lower():
-                logger.error("Twilio authentication failed. Check credentials.")
-            elif "phone number" in error_message.lower():
-                logger.error("Phone number issue in Twilio request")
-            else:
-                logger.error(f"Unexpected Twilio error: {error_message}")
-            
-            # Log failed notification with enhanced error info
-            EmergencyNotification.objects.create(
-                request=emergency_request,
-                notification_type='SMS',
-                recipient=emergency_request.contact_phone,
-                message=self._create_simple_sms_message(emergency_request, hospitals),
-                status='FAILED',
-                error_message=error_message[:500]  # Truncate very long error messages
-            )
-            
-            return False
+    def queue_emergency_email(self, emergency_request, hospitals):
+        """Stage the patient email in the notification outbox; call inside the request's transaction"""
+        from .outbox import stage_notification
+        subject = f"🚨 URGENT: Emergency Blood Request - {emergency_request.blood_group} ({emergency_request.quantity_needed} bags)"
+        if not hospitals:
+            message = self._create_no_hospitals_email(emergency_request)
+        else:
+            message = self._create_professional_email(emergency_request, hospitals)
+        return stage_notification(
+            emergency_request, 'email', 'EMAIL', emergency_request.contact_email, message, subject=subject
+        )
     
     def _create_simple_sms_message(self, emergency_request, hospitals):
         """Create SMS message matching user's exact format"""
@@ -190,40 +109,6 @@ class NotificationService:
         else:
             return "your area"
     
-    def send_emergency_email(self, emergency_request, hospitals):
-        """Send professional emergency email notification with distance information"""
-        try:
-            subject = f"🚨 URGENT: Emergency Blood Request - {emergency_request.blood_group} ({emergency_request.quantity_needed} bags)"
-            
-            if not hospitals:
-                message = self._create_no_hospitals_email(emergency_request)
-            else:
-                message = self._create_professional_email(emergency_request, hospitals)
-            
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'emergency@bloodbank.com'),
-                recipient_list=[emergency_request.contact_email],
-                fail_silently=False,
-            )
-            
-            # Log notification
-            EmergencyNotification.objects.create(
-                request=emergency_request,
-                notification_type='EMAIL',
-                recipient=emergency_request.contact_email,
-                subject=subject,
-                message=message,
-                status='SENT'
-            )
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error sending email: {e}")
-            return False
-    
     def _create_professional_email(self, emergency_request, hospitals):
         """Create professional email content with distance information"""
         # Calculate distances for hospitals
@@ -347,86 +232,14 @@ Request ID: {emergency_request.request_id}
 ═══════════════════════════════════════════════════
 """
     
-    def find_nearby_hospitals(self, latitude, longitude, blood_group):
-        """Find nearby hospitals with required blood group"""
-        from .models import EmergencyHospital
-        
-        hospitals = []
-        all_hospitals = EmergencyHospital.objects.filter(
-            is_active=True, 
-            is_emergency_partner=True
-        ).prefetch_related('hospital_blood_stock')
-        
-        for hospital in all_hospitals:
-            # Check if hospital has the required blood type
-            if hospital.has_sufficient_blood(blood_group, 1):
-                distance = hospital.calculate_distance(latitude, longitude)
-                hospitals.append({
-                    'hospital': hospital,
-                    'distance': distance,
-                    'name': hospital.name,
-                    'phone': hospital.phone,
-                    'emergency_phone': hospital.emergency_phone,
-                    'address': hospital.address,
-                    'city': hospital.city
-                })
-        
-        # Sort by distance and return top results
-        hospitals.sort(key=lambda x: x['distance'])
-        return hospitals
-    
-    def _simulate_sms(self, emergency_request, hospitals):
-        """Simulate SMS sending for development"""
-        message = self._create_simple_sms_message(emergency_request, hospitals)
-        
-        # Log as if sent successfully
-        EmergencyNotification.objects.create(
-            request=emergency_request,
-            notification_type='SMS',
-            recipient=emergency_request.contact_phone,
-            message=message,
-            status='SENT',
-            provider_response='SIMULATED'
-        )
-        
-        logger.info(f"SMS SIMULATED for {emergency_request.contact_phone}")
-        print(f"\n=== SIMULATED SMS ===\nTo: {emergency_request.contact_phone}\n{message}\n=== END ===\n")
-        return True
-    
-    def _check_recent_failures(self):
-        """Check if there have been recent SMS failures due to limits"""
-        try:
-            from datetime import datetime, timedelta
-            
-            # Check last 3 failed notifications in the past hour
-            one_hour_ago = datetime.now() - timedelta(hours=1)
-            recent_failures = EmergencyNotification.objects.filter(
-                notification_type='SMS',
-                status='FAILED',
-                created_at__gte=one_hour_ago,
-                error_message__icontains='exceeded'
-            ).count()
-            
-            if recent_failures >= 3:
-                logger.warning(f"Found {recent_failures} recent SMS failures due to limits")
-                return True
-                
-            return False
-            
-        except Exception as e:
-            logger.error(f"Error checking recent failures: {e}")
-            return False
-    
     def get_sms_status_info(self):
         """Get SMS status and diagnostics info"""
         try:
-            from twilio.rest import Client
             from datetime import datetime
             
-            client = Client(
-                settings.TWILIO_ACCOUNT_SID,
-                settings.TWILIO_AUTH_TOKEN
-            )
+            client = get_twilio_client()
+            if client is None:
+                return {'error': 'Twilio is not configured'}
             
             # Get account info
             account = client.api.accounts(settings.TWILIO_ACCOUNT_SID).fetch()
@@ -445,7 +258,8 @@ Request ID: {emergency_request.request_id}
                 'balance': f"${balance.balance} {balance.currency}",
                 'sms_sent_today': today_notifications.filter(status='SENT').count(),
                 'sms_failed_today': today_notifications.filter(status='FAILED').count(),
-                'last_failure': today_notifications.filter(status='FAILED').order_by('-created_at').first()
+                'last_failure': today_notifications.filter(status='FAILED').order_by('-created_at').first(),
+                'providers': self.sms_router.health_report()
             }
             
         except Exception as e:
@@ -485,6 +299,30 @@ class LocationService:
             
         except (ValueError, TypeError):
             return 0
+    
+    @staticmethod
+    def find_nearby_hospitals(latitude, longitude, blood_group):
+        """Find nearby hospitals with required blood group, nearest first, as HospitalRows"""
+        from .location_utils import DistanceCalculator
+        from .models import EmergencyHospital
+        from .serialization import HOSPITAL_ROW_FIELDS, HospitalRow, km
+        
+        # One query: hospitals holding at least a bag of the blood group
+        rows = EmergencyHospital.objects.filter(
+            is_active=True,
+            is_emergency_partner=True,
+            hospital_blood_stock__blood_group=blood_group,
+            hospital_blood_stock__units_available__gte=1
+        ).values_list(*HOSPITAL_ROW_FIELDS, 'latitude', 'longitude')
+        
+        ranked = []
+        for *values, hospital_lat, hospital_lng in rows:
+            distance = DistanceCalculator.haversine_distance(float(hospital_lat), float(hospital_lng), latitude, longitude)
+            ranked.append((distance, HospitalRow(*values, distance=km(distance))))
+        
+        # Sort by distance and return top results
+        ranked.sort(key=lambda item: item[0])
+        return [row for _, row in ranked]
 
 
 # Simple factory functions
@@ -0,0 +1,57 @@
+"""
+Model signal handlers for the emergency app
+"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .models import EmergencyBloodStock, EmergencyHospital, EmergencyRequest
+from .realtime import publish_request_status, publish_stock_change
+from .versions import EMERGENCY_REQUESTS, HOSPITALS, bump_inventory, bump_version, request_key
+
+
+@receiver(post_save, sender=EmergencyRequest)
+def emergency_request_saved(sender, instance, update_fields=None, **kwargs):
+    bump_version(request_key(instance.request_id), EMERGENCY_REQUESTS)
+    if update_fields is None or 'status' in update_fields:
+        publish_request_status(instance)
+
+
+@receiver(post_delete, sender=EmergencyRequest)
+def emergency_request_deleted(sender, instance, **kwargs):
+    bump_version(EMERGENCY_REQUESTS)
+
+
+@receiver(m2m_changed, sender=EmergencyRequest.hospitals_found.through)
+def emergency_request_hospitals_changed(sender, instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, EmergencyRequest):
+        bump_version(request_key(instance.request_id))
+
+
+@receiver(post_save, sender=EmergencyBloodStock)
+def blood_stock_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'units_available' in update_fields:
+        bump_inventory(instance.hospital.city)
+        publish_stock_change(instance)
+
+
+@receiver(post_delete, sender=EmergencyBloodStock)
+def blood_stock_deleted(sender, instance, **kwargs):
+    try:
+        city = instance.hospital.city
+    except EmergencyHospital.DoesNotExist:
+        city = None  # Cascading from the hospital, which bumps the city itself
+    bump_inventory(city)
+
+
+@receiver(pre_save, sender=EmergencyHospital)
+def hospital_saving(sender, instance, **kwargs):
+    # A move takes the hospital's stock out of its old city as well as into the new one
+    instance._previous_city = None
+    if instance.pk:
+        instance._previous_city = sender.objects.filter(pk=instance.pk).values_list('city', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=EmergencyHospital)
+def hospital_changed(sender, instance, **kwargs):
+    bump_version(HOSPITALS)
+    bump_inventory(instance.city, getattr(instance, '_previous_city', None))
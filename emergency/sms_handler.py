@@ -9,10 +9,15 @@ from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
-from .models import EmergencyRequest
-from .location_utils import get_location_service, get_hospital_finder
-from .services import NotificationService
-from .views import search_hospitals_and_notify
+from django.db import transaction
+from .models import InboundSMS
+from .location_utils import get_location_service
+from .jobs import enqueue, wake_local_runner
+from .outbox import stage_notification
+from .tasks import urgency_priority
+from .intake import create_request_once, find_duplicate_request, make_idempotency_key, normalize_phone
+from .delivery_status import record_status
+from .ratelimit import no_urgency, rate_limit
 
 logger = logging.getLogger(__name__)
 
@@ -174,82 +179,55 @@ class SMSMessageParser:
         return 'URGENT'  # default
 
 
+def _sms_rate_limited(request, wait):
+    # Twilio treats non-2xx as a failed webhook; answer with an empty TwiML reply
+    return _send_sms_response(None)
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('sms_webhook', urgency=no_urgency, rejected=_sms_rate_limited)
 def sms_webhook(request):
     """
     Webhook endpoint for Twilio SMS messages
-    Handles incoming SMS requests for blood
+    Stores the message and acknowledges straight away; parsing, geocoding, the
+    hospital search and the reply SMS all happen in the background
     """
     try:
         # Extract Twilio parameters
         message_body = request.POST.get('Body', '').strip()
         from_number = request.POST.get('From', '')
-        to_number = request.POST.get('To', '')
-        message_sid = request.POST.get('MessageSid', '')
+        message_sid = request.POST.get('MessageSid', '') or None
         
         logger.info(f"Received SMS from {from_number}: {message_body}")
         
-        if not message_body:
-            return _send_sms_response("Please send a blood request. Example: 'A+ 2 near Andheri'")
-        
-        # Check for help requests
-        if any(word in message_body.upper() for word in ['HELP', 'INFO', 'FORMAT', 'HOW']):
-            help_message = (
-                "🩸 Emergency Blood Request Help:\n\n"
-                "Format: [Blood Group] [Quantity] [Location]\n"
-                "Examples:\n"
-                "• A+ 2 near Andheri\n"
-                "• O- urgent 1 bag Bandra\n"
-                "• AB+ 3 at Dadar station\n\n"
-                "Add 'urgent' or 'critical' for priority."
-            )
-            return _send_sms_response(help_message)
-        
-        # Parse the SMS message
-        parser = SMSMessageParser()
-        parsed = parser.parse_message(message_body, from_number)
-        
-        if not parsed['success']:
-            error_response = (
-                f"❌ {parsed['error']}\n\n"
-                "Format: [Blood Group] [Quantity] [Location]\n"
-                "Example: 'A+ 2 near Andheri'\n"
-                "Send 'HELP' for more info."
-            )
-            return _send_sms_response(error_response)
-        
-        # Create emergency request
-        emergency_request = _create_emergency_from_sms(parsed, request)
-        
-        if not emergency_request:
-            return _send_sms_response(
-                "❌ Could not create emergency request. Please try again or call 108 for immediate help."
-            )
-        
-        # Send immediate confirmation
-        confirmation_message = (
-            f"✅ Emergency Request Created!\n"
-            f"🩸 {parsed['blood_group']} - {parsed['quantity']} bag(s)\n"
-            f"📍 {parsed.get('location', 'Location detecting...')}\n"
-            f"🆔 ID: {str(emergency_request.request_id)[:8]}\n\n"
-            f"🔍 Searching hospitals... You'll receive results shortly."
-        )
+        fields = {
+            'from_number': from_number,
+            'to_number': request.POST.get('To', ''),
+            'body': message_body,
+            'ip_address': _get_client_ip(request) or None,
+        }
         
-        # Start hospital search in background
-        try:
-            search_hospitals_and_notify(emergency_request.id)
-        except Exception as e:
-            logger.error(f"Error in hospital search for SMS request: {e}")
-            # Send fallback message
-            fallback_message = (
-                f"⚠️ Search in progress. If no response in 2 minutes, "
-                f"call 108 or visit nearest hospital.\n"
-                f"Request ID: {str(emergency_request.request_id)[:8]}"
-            )
-            return _send_sms_response(fallback_message)
+        with transaction.atomic():
+            # Twilio retries reuse the MessageSid - only the first delivery is queued
+            if message_sid:
+                inbound, created = InboundSMS.objects.get_or_create(message_sid=message_sid, defaults=fields)
+            else:
+                inbound, created = InboundSMS.objects.create(**fields), True
+            
+            if created:
+                # One sender's messages are handled strictly in the order they arrived
+                urgency = SMSMessageParser()._extract_urgency(message_body)
+                priority = urgency_priority(urgency)
+                enqueue(
+                    'emergency.process_inbound_sms',
+                    {'inbound_id': inbound.id},
+                    priority=priority,
+                    ordering_key=f"sms:{normalize_phone(from_number)}"
+                )
+                wake_local_runner(min_priority=priority if urgency == 'CRITICAL' else None)
         
-        return _send_sms_response(confirmation_message)
+        return _send_sms_response(None)
         
     except Exception as e:
         logger.error(f"Error in SMS webhook: {e}")
@@ -258,43 +236,159 @@ def sms_webhook(request):
         )
 
 
-def _create_emergency_from_sms(parsed_data: dict, request) -> 'EmergencyRequest':
-    """Create emergency request from parsed SMS data"""
-    try:
-        # Get location service for enhanced location detection
-        location_service = get_location_service()
-        
-        # Try to get location details
-        location_info = location_service.get_location_details(
-            request, 
-            location_text=parsed_data.get('location')
+def process_inbound_sms(inbound_id):
+    """Handle a stored inbound SMS: reply, and create and search for blood requests"""
+    inbound = InboundSMS.objects.get(id=inbound_id)
+    if inbound.status == 'PROCESSED':
+        return
+    
+    if not inbound.reply:
+        reply, emergency_request, created = _handle_sms_request(inbound)
+        inbound.reply = reply
+        inbound.emergency_request = emergency_request
+        inbound.save(update_fields=['reply', 'emergency_request'])
+    else:
+        # Retry after a failure further down - don't parse or create again, but
+        # finish the search for a request this message created
+        emergency_request = inbound.emergency_request
+        key = make_idempotency_key('sms', inbound.message_sid)
+        created = bool(emergency_request and key and emergency_request.idempotency_key == key)
+    
+    if not inbound.reply_sent:
+        with transaction.atomic():
+            _queue_sms_reply(inbound)
+            inbound.reply_sent = True
+            inbound.save(update_fields=['reply_sent'])
+    
+    if created:
+        # Searched inline so the results go out before this sender's next message is
+        # handled; raising lets the job retry, skipping the reply already queued
+        from .views import search_hospitals_and_notify
+        if not search_hospitals_and_notify(emergency_request.id):
+            raise RuntimeError(f"Processing failed for emergency request {emergency_request.id}")
+    
+    inbound.status = 'PROCESSED'
+    inbound.processed_at = timezone.now()
+    inbound.save(update_fields=['status', 'processed_at'])
+
+
+def _handle_sms_request(inbound) -> tuple:
+    """Work out the reply for an inbound SMS; returns (reply, emergency_request, created)"""
+    message_body = inbound.body
+    from_number = inbound.from_number
+    
+    if not message_body:
+        return "Please send a blood request. Example: 'A+ 2 near Andheri'", None, False
+    
+    # Check for help requests
+    if any(word in message_body.upper() for word in ['HELP', 'INFO', 'FORMAT', 'HOW']):
+        help_message = (
+            "🩸 Emergency Blood Request Help:\n\n"
+            "Format: [Blood Group] [Quantity] [Location]\n"
+            "Examples:\n"
+            "• A+ 2 near Andheri\n"
+            "• O- urgent 1 bag Bandra\n"
+            "• AB+ 3 at Dadar station\n\n"
+            "Add 'urgent' or 'critical' for priority."
         )
+        return help_message, None, False
+    
+    # Parse the SMS message
+    parser = SMSMessageParser()
+    parsed = parser.parse_message(message_body, from_number)
+    
+    if not parsed['success']:
+        error_response = (
+            f"❌ {parsed['error']}\n\n"
+            "Format: [Blood Group] [Quantity] [Location]\n"
+            "Example: 'A+ 2 near Andheri'\n"
+            "Send 'HELP' for more info."
+        )
+        return error_response, None, False
+    
+    # Repeat texts attach to the open request
+    idempotency_key = make_idempotency_key('sms', inbound.message_sid)
+    existing_request = find_duplicate_request(
+        normalize_phone(from_number), parsed['blood_group'], idempotency_key
+    )
+    if existing_request:
+        return _duplicate_sms_message(existing_request), existing_request, False
+    
+    # Create emergency request
+    emergency_request, created = _create_emergency_from_sms(parsed, inbound, idempotency_key)
+    
+    if not emergency_request:
+        return "❌ Could not create emergency request. Please try again or call 108 for immediate help.", None, False
+    if not created:
+        return _duplicate_sms_message(emergency_request), emergency_request, False
+    
+    confirmation_message = (
+        f"✅ Emergency Request Created!\n"
+        f"🩸 {parsed['blood_group']} - {parsed['quantity']} bag(s)\n"
+        f"📍 {parsed.get('location', 'Location detecting...')}\n"
+        f"🆔 ID: {str(emergency_request.request_id)[:8]}\n\n"
+        f"🔍 Searching hospitals... You'll receive results shortly."
+    )
+    return confirmation_message, emergency_request, True
+
+
+def _create_emergency_from_sms(parsed_data: dict, inbound, idempotency_key: str = None) -> tuple:
+    """Create emergency request from parsed SMS data; returns (request, created)"""
+    try:
+        # Geocode the free-text location; the webhook caller's IP is Twilio's, so no IP fallback
+        location_info = {}
+        if parsed_data.get('location'):
+            location_info = get_location_service().get_location_details(
+                None,
+                location_text=parsed_data.get('location')
+            )
         
         # Create emergency request
-        emergency_request = EmergencyRequest.objects.create(
+        emergency_request, created = create_request_once(
+            idempotency_key=idempotency_key,
             blood_group=parsed_data['blood_group'],
             quantity_needed=parsed_data['quantity'],
             urgency=parsed_data['urgency'],
             user_latitude=location_info.get('latitude'),
             user_longitude=location_info.get('longitude'),
             user_location_text=location_info.get('address') or parsed_data.get('location', ''),
-            contact_phone=parsed_data['from_number'],
+            contact_phone=normalize_phone(parsed_data['from_number']),
             contact_name=f"SMS User {parsed_data['from_number'][-4:]}",  # Last 4 digits
-            ip_address=_get_client_ip(request),
-            user_agent=f"SMS via {request.META.get('HTTP_USER_AGENT', 'Twilio')}",
-            session_id=f"sms_{parsed_data.get('message_sid', 'unknown')}"
+            ip_address=inbound.ip_address,
+            user_agent="SMS via Twilio",
+            session_id=f"sms_{inbound.message_sid or inbound.id}"
         )
         
-        logger.info(f"Created emergency request {emergency_request.request_id} from SMS")
-        return emergency_request
+        if created:
+            logger.info(f"Created emergency request {emergency_request.request_id} from SMS")
+        return emergency_request, created
         
     except Exception as e:
         logger.error(f"Error creating emergency request from SMS: {e}")
-        return None
+        return None, False
+
+
+def _queue_sms_reply(inbound):
+    """Stage the reply that used to go back inline as TwiML in the notification outbox"""
+    stage_notification(inbound.emergency_request, 'sms_reply', 'SMS', inbound.from_number, inbound.reply)
+
+
+def _duplicate_sms_message(emergency_request) -> str:
+    """Reply for a retried or repeated SMS request"""
+    return (
+        f"✅ Your {emergency_request.blood_group} request is already being processed.\n"
+        f"🆔 ID: {str(emergency_request.request_id)[:8]}\n\n"
+        f"🔍 You'll receive results shortly."
+    )
 
 
 def _send_sms_response(message: str) -> HttpResponse:
-    """Send SMS response using TwiML"""
+    """Send SMS response using TwiML; no message just acknowledges receipt"""
+    if not message:
+        twiml_response = '''<?xml version="1.0" encoding="UTF-8"?>
+<Response></Response>'''
+        return HttpResponse(twiml_response, content_type='text/xml')
+    
     twiml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
 <Response>
     <Message>{message}</Message>
@@ -329,28 +423,8 @@ class SMSStatusHandler:
             
             logger.info(f"SMS Status Update: {message_sid} -> {status} (to {to_number})")
             
-            # Update notification status in database
-            from .models import EmergencyNotification
-            try:
-                notification = EmergencyNotification.objects.get(
-                    provider_response=message_sid
-                )
-                
-                status_mapping = {
-                    'sent': 'SENT',
-                    'delivered': 'DELIVERED',
-                    'failed': 'FAILED',
-                    'undelivered': 'FAILED'
-                }
-                
-                if status in status_mapping:
-                    notification.status = status_mapping[status]
-                    if status == 'delivered':
-                        notification.delivered_at = timezone.now()
-                    notification.save()
-                    
-            except EmergencyNotification.DoesNotExist:
-                logger.warning(f"Notification not found for SMS SID: {message_sid}")
+            # Stored before acknowledging, then applied in bulk with other callbacks
+            record_status(message_sid, status)
             
             return HttpResponse('OK')
             
@@ -359,46 +433,48 @@ class SMSStatusHandler:
             return HttpResponse('Error', status=500)
 
 
-def send_follow_up_sms(emergency_request, message_type='update'):
-    """Send follow-up SMS messages"""
+def send_follow_up_sms(emergency_request, message_type='update', minutes_elapsed=None):
+    """Stage a follow-up SMS in the notification outbox"""
     if not emergency_request.contact_phone:
         return False
     
     try:
-        notification_service = NotificationService()
+        request_ref = str(emergency_request.request_id)[:8]
+        hospitals_count = emergency_request.hospitals_found.count()
+        elapsed = f"{minutes_elapsed}min " if minutes_elapsed else ""
         
         if message_type == 'update':
             # Send status update
-            hospitals_count = emergency_request.hospitals_found.count()
             if hospitals_count > 0:
                 message = (
-                    f"🔄 Update for Request {str(emergency_request.request_id)[:8]}:\n"
+                    f"🔄 {elapsed}Update for Request {request_ref}:\n"
                     f"{hospitals_count} hospitals found with {emergency_request.blood_group}.\n"
                     f"Check your messages for details or call the hospitals directly."
                 )
             else:
                 message = (
-                    f"🔄 Update for Request {str(emergency_request.request_id)[:8]}:\n"
+                    f"🔄 {elapsed}Update for Request {request_ref}:\n"
                     f"Still searching for {emergency_request.blood_group}. "
                     f"Consider expanding search area or calling 108."
                 )
         
         elif message_type == 'reminder':
             # Send reminder to contact hospitals
+            hospitals = f"{hospitals_count} hospitals" if hospitals_count else "hospitals"
             message = (
-                f"⏰ Reminder: Request {str(emergency_request.request_id)[:8]}\n"
-                f"Have you contacted the hospitals? Time is critical for {emergency_request.blood_group}.\n"
+                f"⏰ {elapsed}Reminder: Request {request_ref}\n"
+                f"Have you contacted the {hospitals}? Time is critical for {emergency_request.blood_group}.\n"
                 f"Call 108 if still needed."
             )
         
         else:
             return False
         
-        # This would integrate with your existing SMS sending logic
-        # For now, just log it
-        logger.info(f"Follow-up SMS to {emergency_request.contact_phone}: {message}")
+        with transaction.atomic():
+            stage_notification(emergency_request, 'follow_up', 'SMS', emergency_request.contact_phone, message)
+        logger.info(f"Follow-up SMS ({message_type}) queued for {emergency_request.contact_phone}")
         return True
         
     except Exception as e:
-        logger.error(f"Error sending follow-up SMS: {e}")
-        return False
\ No newline at end of file
+        logger.error(f"Error queueing follow-up SMS: {e}")
+        return False
@@ -0,0 +1,300 @@
+"""
+SMS provider router for the Emergency Blood Bank System
+Common interface over Twilio, Fast2SMS and MSG91 with health-based routing
+and failover within a single send
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from .circuit_breaker import CircuitBreaker
+from .twilio_client import get_twilio_client, twilio_configured
+
+logger = logging.getLogger(__name__)
+
+
+class SMSDeliveryError(Exception):
+    """Raised when a provider (or every provider) fails to accept a message"""
+
+
+class SMSProvider:
+    """Base class for SMS providers; subclasses implement is_configured() and send()"""
+
+    name = ''
+
+    def is_configured(self):
+        raise NotImplementedError
+
+    def send(self, to, body):
+        """Send a message and return the provider's message ID; raise SMSDeliveryError on failure"""
+        raise NotImplementedError
+
+
+class TwilioProvider(SMSProvider):
+    name = 'twilio'
+
+    def is_configured(self):
+        return twilio_configured()
+
+    def send(self, to, body):
+        client = get_twilio_client()
+        if client is None:
+            raise SMSDeliveryError("Twilio client unavailable")
+
+        from_number = getattr(settings, 'TWILIO_PHONE_NUMBER', '')
+        if not from_number:
+            # Try to use verified caller ID as fallback
+            try:
+                caller_ids = client.outgoing_caller_ids.list(limit=1)
+                if caller_ids:
+                    from_number = caller_ids[0].phone_number
+                    logger.info(f"Using verified caller ID as from number: {from_number}")
+            except Exception:
+                pass
+
+        if not from_number:
+            raise SMSDeliveryError("No Twilio phone number or verified caller ID available")
+
+        message = client.messages.create(body=body, from_=from_number, to=to)
+        return message.sid
+
+
+class _HTTPProvider(SMSProvider):
+    """Shared plumbing for the HTTP-form based Indian SMS gateways"""
+
+    def __init__(self, api_url=None, api_key=None):
+        import requests
+        self.api_url = api_url
+        self.api_key = api_key
+        self.session = requests.Session()
+
+    @property
+    def timeout(self):
+        return (
+            getattr(settings, 'SMS_HTTP_CONNECT_TIMEOUT', 3.05),
+            getattr(settings, 'SMS_HTTP_READ_TIMEOUT', 10),
+        )
+
+    def is_configured(self):
+        return bool(self.api_key and self.api_url)
+
+    @staticmethod
+    def _local_number(phone_number):
+        """Strip the +91 prefix and separators - these gateways expect 10 digits"""
+        number = phone_number.replace('-', '').replace(' ', '')
+        if number.startswith('+91'):
+            number = number[3:]
+        elif number.startswith('91') and len(number) == 12:
+            number = number[2:]
+        return number
+
+
+class Fast2SMSProvider(_HTTPProvider):
+    name = 'fast2sms'
+
+    def __init__(self, api_url=None, api_key=None):
+        super().__init__(
+            api_url or getattr(settings, 'FAST2SMS_API_URL', ''),
+            api_key or getattr(settings, 'FAST2SMS_API_KEY', '')
+        )
+
+    def send(self, to, body):
+        response = self.session.post(
+            self.api_url,
+            data={
+                'sender_id': 'FSTSMS',
+                'message': body,
+                'language': 'english',
+                'route': 'p',
+                'numbers': self._local_number(to),
+            },
+            headers={'authorization': self.api_key},
+            timeout=self.timeout
+        )
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+
+        if response.status_code != 200 or not data.get('return', False):
+            raise SMSDeliveryError(f"Fast2SMS rejected message: HTTP {response.status_code} {data or response.text[:200]}")
+        return str(data.get('request_id', ''))
+
+
+class MSG91Provider(_HTTPProvider):
+    name = 'msg91'
+
+    def __init__(self, api_url=None, api_key=None):
+        super().__init__(
+            api_url or getattr(settings, 'MSG91_API_URL', ''),
+            api_key or getattr(settings, 'MSG91_AUTH_KEY', '')
+        )
+
+    def send(self, to, body):
+        response = self.session.post(
+            self.api_url,
+            data={
+                'route': '4',
+                'sender': getattr(settings, 'MSG91_SENDER_ID', 'MSGIND'),
+                'mobiles': f"91{self._local_number(to)}",
+                'authkey': self.api_key,
+                'message': body,
+                'country': '91',
+            },
+            timeout=self.timeout
+        )
+        text = response.text.strip()
+
+        # On success MSG91 answers with a bare request ID
+        if response.status_code != 200 or not text or ' ' in text or 'error' in text.lower():
+            raise SMSDeliveryError(f"MSG91 rejected message: HTTP {response.status_code} {text[:200]}")
+        return text
+
+
+PROVIDER_CLASSES = {
+    'twilio': TwilioProvider,
+    'fast2sms': Fast2SMSProvider,
+    'msg91': MSG91Provider,
+}
+
+
+class ProviderHealth:
+    """Rolling success rate and latency for one provider"""
+
+    def __init__(self, window=None, ttl=None):
+        self.window = window or getattr(settings, 'SMS_PROVIDER_HEALTH_WINDOW', 50)
+        # Old samples expire so a provider that failed earlier gets traffic again
+        self.ttl = ttl or getattr(settings, 'SMS_PROVIDER_HEALTH_TTL', 300)
+        self.samples = deque(maxlen=self.window)
+        self.lock = threading.Lock()
+
+    def record(self, success, latency_ms):
+        with self.lock:
+            self.samples.append((time.monotonic(), success, latency_ms))
+
+    def _recent(self):
+        cutoff = time.monotonic() - self.ttl
+        return [sample for sample in self.samples if sample[0] >= cutoff]
+
+    def snapshot(self):
+        with self.lock:
+            recent = self._recent()
+        if not recent:
+            return {'samples': 0, 'success_rate': 1.0, 'avg_latency_ms': 0.0}
+        successes = sum(1 for _, success, _ in recent if success)
+        return {
+            'samples': len(recent),
+            'success_rate': successes / len(recent),
+            'avg_latency_ms': sum(latency for _, _, latency in recent) / len(recent),
+        }
+
+    def score(self):
+        """Higher is healthier: success rate dominates, latency breaks near-ties"""
+        stats = self.snapshot()
+        return stats['success_rate'] * 100 - stats['avg_latency_ms'] / 100
+
+
+class SMSRouter:
+    """
+    Route each message to the healthiest configured provider, failing over on error
+    Providers whose circuit breaker is open are skipped without being called
+    """
+
+    def __init__(self, providers):
+        self.providers = list(providers)
+        self.health = {provider.name: ProviderHealth() for provider in self.providers}
+        self.breakers = {provider.name: CircuitBreaker(provider.name) for provider in self.providers}
+
+    def configured_providers(self):
+        return [provider for provider in self.providers if provider.is_configured()]
+
+    def is_configured(self):
+        return bool(self.configured_providers())
+
+    def is_available(self):
+        """True if at least one configured provider's circuit is not open"""
+        return any(not self.breakers[provider.name].is_open() for provider in self.configured_providers())
+
+    def ranked_providers(self):
+        """Configured providers ordered by health score, configured order breaking ties"""
+        configured = self.configured_providers()
+        return sorted(
+            configured,
+            key=lambda provider: (-self.health[provider.name].score(), configured.index(provider))
+        )
+
+    def send(self, to, body):
+        """
+        Send through the healthiest provider, trying the next one on failure
+        Returns {'success', 'provider', 'message_id', 'errors'}
+        """
+        errors = []
+        for provider in self.ranked_providers():
+            breaker = self.breakers[provider.name]
+            if not breaker.allow_request():
+                errors.append(f"{provider.name}: circuit open")
+                continue
+
+            started = time.monotonic()
+            try:
+                message_id = provider.send(to, body)
+            except Exception as e:
+                latency_ms = (time.monotonic() - started) * 1000
+                self.health[provider.name].record(False, latency_ms)
+                breaker.record_failure()
+                errors.append(f"{provider.name}: {e}")
+                logger.warning(f"SMS via {provider.name} failed, failing over: {e}")
+                continue
+
+            latency_ms = (time.monotonic() - started) * 1000
+            self.health[provider.name].record(True, latency_ms)
+            breaker.record_success()
+            return {
+                'success': True,
+                'provider': provider.name,
+                'message_id': message_id,
+                'errors': errors,
+            }
+
+        if not errors:
+            errors.append("No SMS provider configured")
+        return {
+            'success': False,
+            'provider': None,
+            'message_id': None,
+            'errors': errors,
+        }
+
+    def health_report(self):
+        return {
+            provider.name: dict(
+                self.health[provider.name].snapshot(),
+                configured=provider.is_configured(),
+                circuit=self.breakers[provider.name].snapshot()
+            )
+            for provider in self.providers
+        }
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_sms_router():
+    """Get the process-wide SMS router built from SMS_PROVIDERS"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                names = getattr(settings, 'SMS_PROVIDERS', ['twilio'])
+                _router = SMSRouter([PROVIDER_CLASSES[name]() for name in names])
+    return _router
+
+
+def reset_sms_router():
+    """Drop the cached router so it is rebuilt from current settings"""
+    global _router
+    with _router_lock:
+        _router = None
@@ -0,0 +1,110 @@
+"""
+Local stub SMS gateway for tests and offline development
+Speaks just enough of the Fast2SMS and MSG91 HTTP APIs for the provider router
+
+Run standalone with: python -m emergency.sms_stub 8025
+"""
+
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass  # Keep test output quiet
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+        stub = self.server.stub
+
+        if stub.delay:
+            time.sleep(stub.delay)
+
+        gateway = self.path.strip('/').split('/')[0]
+        stub.record(gateway, form)
+        failing = gateway in stub.failing
+
+        if gateway == 'fast2sms':
+            if failing:
+                self._reply(500, json.dumps({'return': False, 'message': 'Stub failure'}), 'application/json')
+            else:
+                self._reply(200, json.dumps({'return': True, 'request_id': uuid.uuid4().hex[:12]}), 'application/json')
+        elif gateway == 'msg91':
+            if failing:
+                self._reply(200, 'Authentication failure error', 'text/plain')
+            else:
+                self._reply(200, uuid.uuid4().hex[:24], 'text/plain')
+        else:
+            self._reply(404, 'Unknown gateway', 'text/plain')
+
+    def _reply(self, status, body, content_type):
+        payload = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class StubSMSServer:
+    """
+    Threaded local HTTP server standing in for the SMS gateways
+
+    Usage:
+        with StubSMSServer() as stub:
+            Fast2SMSProvider(api_url=stub.url('fast2sms'), api_key='test')
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.failing = set()
+        self.delay = 0
+        self.messages = []
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), _StubHandler)
+        self.httpd.stub = self
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def url(self, gateway):
+        return f"http://{self.httpd.server_address[0]}:{self.port}/{gateway}/"
+
+    def record(self, gateway, form):
+        with self._lock:
+            self.messages.append((gateway, form))
+
+    def sent_via(self, gateway):
+        with self._lock:
+            return [form for name, form in self.messages if name == gateway]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == '__main__':
+    import sys
+    server = StubSMSServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8025)
+    print(f"Stub SMS gateway on {server.url('fast2sms')} and {server.url('msg91')}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
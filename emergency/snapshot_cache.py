@@ -0,0 +1,65 @@
+"""
+Short-lived cached snapshots with single-flight recompute
+Polled dashboards read a computed snapshot from the cache. When it goes stale
+exactly one caller - whoever takes the recompute lock - rebuilds it while the
+rest keep serving the previous snapshot, so an expiry under load costs one
+rebuild instead of one per poller
+"""
+
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+from . import cache_stats
+
+logger = logging.getLogger(__name__)
+
+
+def _lock_key(key):
+    return f"{key}:lock"
+
+
+def _store(key, value, ttl):
+    # Kept past its freshness so there is something to serve during the next rebuild
+    grace = getattr(settings, 'SNAPSHOT_STALE_GRACE_SECONDS', 60)
+    cache.set(key, (time.time() + ttl, value), ttl + grace)
+
+
+def cached_snapshot(key, compute, ttl):
+    """
+    Return compute()'s result cached under key for ttl seconds
+    Only one caller recomputes an expired snapshot; the others get the stale
+    one, or on a cold start wait up to SNAPSHOT_LOCK_WAIT_SECONDS for it
+    """
+    try:
+        entry = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Snapshot cache unavailable for {key}, computing directly: {e}")
+        return compute()
+
+    fresh = entry is not None and entry[0] > time.time()
+    cache_stats.record(key.split(':', 1)[0], fresh)
+    if fresh:
+        return entry[1]
+
+    lock_timeout = getattr(settings, 'SNAPSHOT_LOCK_TIMEOUT_SECONDS', 30)
+    if cache.add(_lock_key(key), 1, timeout=lock_timeout):
+        try:
+            value = compute()
+            _store(key, value, ttl)
+            return value
+        finally:
+            cache.delete(_lock_key(key))
+
+    if entry is not None:
+        return entry[1]  # Someone else is rebuilding it
+
+    deadline = time.time() + getattr(settings, 'SNAPSHOT_LOCK_WAIT_SECONDS', 5)
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[1]
+
+    logger.warning(f"Timed out waiting for snapshot {key}, computing it here")
+    return compute()
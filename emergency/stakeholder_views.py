@@ -6,8 +6,10 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import authenticate, login
 from django.contrib import messages
 from django.utils import timezone
+from django.conf import settings
 from django.db.models import Sum, Count, Q, Avg
 from django.db import transaction
+from django.utils.cache import add_never_cache_headers
 from datetime import datetime, timedelta
 import json
 import logging
@@ -17,9 +19,16 @@ from .models import (
     HospitalRegistration, BloodInventoryUpdate, CriticalStockAlert, 
     SocialImpactMetrics, EmergencyAnalytics
 )
+from . import cache_stats
+from .page_cache import cache_anonymous_page
+from .ratelimit import no_urgency, rate_limit
+from .snapshot_cache import cached_snapshot
+from .versions import EMERGENCY_REQUESTS, HOSPITALS, INVENTORY, get_versions
 
 logger = logging.getLogger(__name__)
 
+cache_stats.track('stakeholder-analytics')
+
 def is_hospital_staff(user):
     """Check if user is hospital staff"""
     return user.is_authenticated and (
@@ -193,112 +202,113 @@ def check_and_create_alerts(hospital, blood_group, current_stock):
                 # TODO: Send notifications to authorities
                 logger.warning(f"CRITICAL ALERT: {hospital.name} - {blood_group} stock at {current_stock} bags")
 
+def build_stakeholder_analytics(days):
+    """Stakeholder analytics for the last `days` days, from a handful of grouped queries"""
+    end_date = timezone.now().date()
+    start_date = end_date - timedelta(days=days)
+    
+    # City-wise distribution of active hospitals (also gives the hospital total)
+    city_stats = list(EmergencyHospital.objects.filter(is_active=True).values('city').annotate(
+        hospital_count=Count('id', distinct=True),
+        total_inventory=Sum('hospital_blood_stock__units_available')
+    ).order_by('-total_inventory'))
+    
+    # Available units and request demand per blood group
+    available = dict(EmergencyBloodStock.objects.filter(hospital__is_active=True).values_list(
+        'blood_group'
+    ).annotate(total=Sum('units_available')).order_by())
+    
+    demand = {}
+    successful = 0
+    for row in EmergencyRequest.objects.filter(created_at__date__gte=start_date).values('blood_group').annotate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(status='COMPLETED'))
+    ).order_by():
+        demand[row['blood_group']] = row['total']
+        successful += row['completed']
+    total_requests = sum(demand.values())
+    
+    blood_demand = {}
+    for blood_group, _ in EmergencyBloodStock.BLOOD_GROUPS:
+        blood_demand[blood_group] = {
+            'demand': demand.get(blood_group, 0),
+            'available': available.get(blood_group) or 0,
+            'ratio': (available.get(blood_group) or 0) / max(demand.get(blood_group, 0), 1)
+        }
+    
+    # Social impact metrics
+    social_metrics = SocialImpactMetrics.objects.filter(
+        date__gte=start_date
+    ).aggregate(
+        total_lives_saved=Sum('lives_saved'),
+        avg_response_time=Avg('response_time_avg'),
+        total_free_treatments=Sum('free_treatments'),
+        total_emergency_cases=Sum('emergency_cases')
+    )
+    
+    critical_alerts = list(
+        CriticalStockAlert.objects.filter(status='ACTIVE').values(
+            'hospital__name', 'hospital__city', 'blood_group', 
+            'current_stock', 'alert_level', 'created_at'
+        )
+    )
+    
+    registrations = HospitalRegistration.objects.aggregate(
+        verified=Count('id', filter=Q(registration_status='VERIFIED')),
+        pending=Count('id', filter=Q(registration_status='PENDING'))
+    )
+    
+    return {
+        'system_overview': {
+            'total_hospitals': sum(city['hospital_count'] for city in city_stats),
+            'total_inventory': sum(value or 0 for value in available.values()),
+            'active_alerts': len(critical_alerts),
+            'success_rate': round(successful / total_requests * 100, 1) if total_requests else 0,
+            'total_requests': total_requests,
+        },
+        'blood_demand_analysis': blood_demand,
+        'social_impact': {
+            'lives_saved': social_metrics['total_lives_saved'] or 0,
+            'avg_response_time': round(social_metrics['avg_response_time'] or 0, 1),
+            'free_treatments': social_metrics['total_free_treatments'] or 0,
+            'emergency_cases': social_metrics['total_emergency_cases'] or 0,
+        },
+        'city_distribution': city_stats,
+        'critical_alerts': critical_alerts,
+        'recent_updates': list(
+            BloodInventoryUpdate.objects.filter(
+                timestamp__date__gte=start_date
+            ).values(
+                'hospital__name', 'blood_group', 'previous_count',
+                'new_count', 'change_reason', 'timestamp'
+            )[:50]
+        ),
+        'transparency_metrics': {
+            'verified_hospitals': registrations['verified'],
+            'pending_verifications': registrations['pending'],
+            'inventory_updates_today': BloodInventoryUpdate.objects.filter(
+                timestamp__date=end_date
+            ).count(),
+        },
+        'last_updated': timezone.now().isoformat(),
+    }
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def stakeholder_analytics_api(request):
     """Real-time analytics API for stakeholders"""
     try:
-        # Get date range
-        days = int(request.GET.get('days', 30))
-        end_date = timezone.now().date()
-        start_date = end_date - timedelta(days=days)
-        
-        # System-wide statistics
-        total_hospitals = EmergencyHospital.objects.filter(is_active=True).count()
-        total_inventory = EmergencyBloodStock.objects.aggregate(
-            total=Sum('units_available')
-        )['total'] or 0
-        
-        active_alerts = CriticalStockAlert.objects.filter(status='ACTIVE').count()
-        
-        # Recent requests statistics
-        recent_requests = EmergencyRequest.objects.filter(
-            created_at__date__gte=start_date
-        )
-        
-        success_rate = 0
-        if recent_requests.count() > 0:
-            successful = recent_requests.filter(status='COMPLETED').count()
-            success_rate = (successful / recent_requests.count()) * 100
-        
-        # Blood group demand analysis
-        blood_demand = {}
-        for blood_group, _ in EmergencyBloodStock.BLOOD_GROUPS:
-            demand = recent_requests.filter(blood_group=blood_group).count()
-            available = EmergencyBloodStock.objects.filter(
-                blood_group=blood_group
-            ).aggregate(total=Sum('units_available'))['total'] or 0
-            
-            blood_demand[blood_group] = {
-                'demand': demand,
-                'available': available,
-                'ratio': available / max(demand, 1)
-            }
-        
-        # Social impact metrics
-        social_metrics = SocialImpactMetrics.objects.filter(
-            date__gte=start_date
-        ).aggregate(
-            total_lives_saved=Sum('lives_saved'),
-            avg_response_time=Avg('response_time_avg'),
-            total_free_treatments=Sum('free_treatments'),
-            total_emergency_cases=Sum('emergency_cases')
+        # Get date range (bounded, since each window is cached separately)
+        days = min(max(int(request.GET.get('days', 30)), 1), 365)
+        
+        # Dashboards poll this; one recompute per window per TTL serves them all
+        data = cached_snapshot(
+            f"stakeholder-analytics:{days}",
+            lambda: build_stakeholder_analytics(days),
+            getattr(settings, 'STAKEHOLDER_ANALYTICS_CACHE_SECONDS', 30)
         )
         
-        # City-wise distribution
-        city_stats = EmergencyHospital.objects.values('city').annotate(
-            hospital_count=Count('id'),
-            total_inventory=Sum('hospital_blood_stock__units_available')
-        ).order_by('-total_inventory')
-        
-        response_data = {
-            'success': True,
-            'data': {
-                'system_overview': {
-                    'total_hospitals': total_hospitals,
-                    'total_inventory': total_inventory,
-                    'active_alerts': active_alerts,
-                    'success_rate': round(success_rate, 1),
-                    'total_requests': recent_requests.count(),
-                },
-                'blood_demand_analysis': blood_demand,
-                'social_impact': {
-                    'lives_saved': social_metrics['total_lives_saved'] or 0,
-                    'avg_response_time': round(social_metrics['avg_response_time'] or 0, 1),
-                    'free_treatments': social_metrics['total_free_treatments'] or 0,
-                    'emergency_cases': social_metrics['total_emergency_cases'] or 0,
-                },
-                'city_distribution': list(city_stats),
-                'critical_alerts': list(
-                    CriticalStockAlert.objects.filter(status='ACTIVE').values(
-                        'hospital__name', 'hospital__city', 'blood_group', 
-                        'current_stock', 'alert_level', 'created_at'
-                    )
-                ),
-                'recent_updates': list(
-                    BloodInventoryUpdate.objects.filter(
-                        timestamp__date__gte=start_date
-                    ).select_related('hospital', 'updated_by').values(
-                        'hospital__name', 'blood_group', 'previous_count',
-                        'new_count', 'change_reason', 'timestamp'
-                    )[:50]
-                ),
-                'transparency_metrics': {
-                    'verified_hospitals': HospitalRegistration.objects.filter(
-                        registration_status='VERIFIED'
-                    ).count(),
-                    'pending_verifications': HospitalRegistration.objects.filter(
-                        registration_status='PENDING'
-                    ).count(),
-                    'inventory_updates_today': BloodInventoryUpdate.objects.filter(
-                        timestamp__date=end_date
-                    ).count(),
-                },
-                'last_updated': timezone.now().isoformat(),
-            }
-        }
-        
-        return JsonResponse(response_data)
+        return JsonResponse({'success': True, 'data': data})
         
     except Exception as e:
         logger.error(f"Error in stakeholder analytics API: {e}")
@@ -307,6 +317,7 @@ def stakeholder_analytics_api(request):
             'error': 'Failed to fetch analytics data'
         }, status=500)
 
+@cache_anonymous_page('transparency', versions=(INVENTORY, HOSPITALS, EMERGENCY_REQUESTS))
 def public_transparency_dashboard(request):
     """Public transparency dashboard for social impact"""
     try:
@@ -347,6 +358,12 @@ def public_transparency_dashboard(request):
                 ).count()
             }
         
+        try:
+            inventory_version, = get_versions(INVENTORY)
+        except Exception as e:
+            logger.warning(f"Version counters unavailable, transparency fragments rendered uncached: {e}")
+            inventory_version = None
+        
         # Success stories (anonymized)
         success_stories = recent_requests.filter(
             status='COMPLETED'
@@ -363,20 +380,26 @@ def public_transparency_dashboard(request):
             'blood_availability': blood_availability,
             'success_stories': success_stories,
             'last_updated': timezone.now(),
-            'page_title': 'Public Transparency Dashboard'
+            'page_title': 'Public Transparency Dashboard',
+            # Fragments are cached per inventory version (0 disables it)
+            'inventory_version': inventory_version,
+            'fragment_cache_seconds': getattr(settings, 'PAGE_CACHE_SECONDS', 60) if inventory_version else 0,
         }
         
         return render(request, 'emergency/transparency_dashboard.html', context)
         
     except Exception as e:
         logger.error(f"Error in transparency dashboard: {e}")
-        return render(request, 'emergency/transparency_dashboard.html', {
+        response = render(request, 'emergency/transparency_dashboard.html', {
             'error': 'Unable to load transparency data'
         })
+        add_never_cache_headers(response)  # Keep the error page out of the page cache
+        return response
 
 # Quick emergency access - no form version
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('quick_request', urgency=no_urgency)
 def quick_emergency_request(request):
     """Ultra-quick emergency request with minimal input"""
     try:
@@ -397,8 +420,20 @@ def quick_emergency_request(request):
                 'error': 'Blood group and phone number required'
             }, status=400)
         
+        # Retries and repeat submissions attach to the request already in progress
+        from .intake import (
+            create_request_once, duplicate_request_response, find_duplicate_request,
+            get_request_idempotency_key, normalize_phone
+        )
+        phone = normalize_phone(phone)
+        idempotency_key = get_request_idempotency_key(request)
+        existing_request = find_duplicate_request(phone, blood_group, idempotency_key)
+        if existing_request:
+            return duplicate_request_response(existing_request)
+        
         # Create quick request
-        emergency_request = EmergencyRequest.objects.create(
+        emergency_request, created = create_request_once(
+            idempotency_key=idempotency_key,
             blood_group=blood_group,
             quantity_needed=quantity,
             contact_phone=phone,
@@ -408,15 +443,18 @@ def quick_emergency_request(request):
             urgency='CRITICAL',  # All quick requests are critical
             ip_address=get_client_ip(request),
         )
+        if not created:
+            return duplicate_request_response(emergency_request)
         
-        # Immediate processing
-        from .views import search_hospitals_and_notify
-        search_hospitals_and_notify(emergency_request.id)
+        # Process in the background so the caller gets the request ID straight away
+        from .tasks import enqueue_emergency_request
+        enqueue_emergency_request(emergency_request.id, emergency_request.urgency)
         
         return JsonResponse({
             'success': True,
             'request_id': str(emergency_request.request_id),
-            'message': 'Emergency request processed immediately',
+            'message': 'Emergency request received and is being processed',
+            'status': 'searching',
             'sms_sent': True  # Quick requests always attempt SMS
         })
         
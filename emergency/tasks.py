@@ -0,0 +1,116 @@
+"""
+Background processing for emergency requests
+Moves hospital search and notifications off the HTTP request path
+"""
+
+import logging
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from .jobs import register_task, enqueue, wake_local_runner, wake_local_timer
+from .models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+
+def process_emergency_request(request_id):
+    """Run hospital search and notifications for a stored request"""
+    # Worker threads hold their own DB connection; drop stale ones around each job
+    close_old_connections()
+    try:
+        from .views import search_hospitals_and_notify
+        return search_hospitals_and_notify(request_id)
+    except Exception as e:
+        logger.error(f"Background processing failed for request {request_id}: {e}")
+        return False
+    finally:
+        close_old_connections()
+
+
+@register_task('emergency.process_request', max_attempts=3)
+def process_request_job(request_id):
+    """Queue task wrapper; raising lets the queue retry with backoff"""
+    from .views import search_hospitals_and_notify
+    if not search_hospitals_and_notify(request_id):
+        raise RuntimeError(f"Processing failed for emergency request {request_id}")
+
+
+@register_task('emergency.process_inbound_sms', max_attempts=3)
+def process_inbound_sms_job(inbound_id):
+    """Parse, geocode and answer an inbound SMS stored by the webhook"""
+    from .sms_handler import process_inbound_sms
+    process_inbound_sms(inbound_id)
+
+
+@register_task('emergency.apply_delivery_statuses')
+def apply_delivery_statuses_job():
+    """Apply stored SMS delivery-status callbacks in bulk"""
+    from .delivery_status import flush_status_updates
+    flush_status_updates()
+
+
+@register_task('emergency.send_follow_up', max_attempts=3)
+def send_follow_up_job(timer_id):
+    """Send the SMS for a fired follow-up timer, unless the request has finished since"""
+    from .models import FollowUpTimer
+    from .sms_handler import send_follow_up_sms
+
+    timer = FollowUpTimer.objects.select_related('request').get(id=timer_id)
+    if timer.request.status in timer.request.FINISHED_STATUSES:
+        FollowUpTimer.objects.filter(id=timer_id).update(status='SKIPPED')
+        return
+    if not send_follow_up_sms(timer.request, timer.message_type, minutes_elapsed=timer.offset_minutes):
+        raise RuntimeError(f"Follow-up SMS failed for timer {timer_id}")
+
+
+@register_task('emergency.dispatch_outbox')
+def dispatch_outbox_job():
+    """Send staged notifications; failed sends reschedule themselves"""
+    from .outbox import dispatch_outbox
+    dispatch_outbox()
+
+
+@register_task('emergency.purge_finished_jobs')
+def purge_finished_jobs(days=7):
+    """Sweep: delete succeeded jobs older than the given number of days"""
+    from datetime import timedelta
+
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = BackgroundJob.objects.filter(status='SUCCEEDED', finished_at__lt=cutoff).delete()
+    logger.info(f"Purged {deleted} finished background jobs")
+
+
+def urgency_priority(urgency):
+    """Queue priority for an emergency request's urgency level"""
+    priorities = getattr(settings, 'EMERGENCY_URGENCY_PRIORITIES', {})
+    return priorities.get(urgency, priorities.get('URGENT', 0))
+
+
+def _routine_delay():
+    """Hold back ROUTINE requests while the ready backlog is deep"""
+    threshold = getattr(settings, 'EMERGENCY_ROUTINE_DEFER_DEPTH', 20)
+    backlog = BackgroundJob.objects.filter(status='QUEUED', run_at__lte=timezone.now()).count()
+    if backlog < threshold:
+        return None
+    logger.info(f"Deferring routine request: {backlog} jobs waiting")
+    return getattr(settings, 'EMERGENCY_ROUTINE_DEFER_SECONDS', 60)
+
+
+def enqueue_emergency_request(request_id, urgency='URGENT'):
+    """
+    Queue background processing of an emergency request
+    The job is stored durably and picked up by a job worker or the in-process runner.
+    CRITICAL requests jump the queue and get the reserved priority lane; ROUTINE
+    requests are deferred under load
+    """
+    if getattr(settings, 'EMERGENCY_PROCESS_INLINE', False):
+        return process_emergency_request(request_id)
+
+    priority = urgency_priority(urgency)
+    delay = _routine_delay() if urgency == 'ROUTINE' else None
+    enqueue('emergency.process_request', {'request_id': request_id}, priority=priority, delay=delay)
+    if delay:
+        wake_local_timer()
+    else:
+        wake_local_runner(min_priority=priority if urgency == 'CRITICAL' else None)
+    return True
@@ -0,0 +1,70 @@
+"""
+Tests for the stakeholder analytics API and its cached snapshots
+"""
+
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from .models import EmergencyBloodStock, EmergencyHospital, EmergencyRequest
+from .snapshot_cache import cached_snapshot
+
+
+class SnapshotCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fresh_snapshot_is_not_recomputed(self):
+        compute = mock.Mock(return_value={'total': 1})
+        self.assertEqual(cached_snapshot('snap', compute, 30), {'total': 1})
+        self.assertEqual(cached_snapshot('snap', compute, 30), {'total': 1})
+        self.assertEqual(compute.call_count, 1)
+
+    def test_stale_snapshot_is_served_while_another_caller_recomputes(self):
+        cache.set('snap', (0, 'old'))  # Past its freshness, still within the grace period
+        cache.add('snap:lock', 1)  # Another caller is rebuilding
+        compute = mock.Mock(return_value='new')
+        self.assertEqual(cached_snapshot('snap', compute, 30), 'old')
+        compute.assert_not_called()
+
+        cache.delete('snap:lock')
+        self.assertEqual(cached_snapshot('snap', compute, 30), 'new')
+        self.assertEqual(cached_snapshot('snap', compute, 30), 'new')
+        self.assertEqual(compute.call_count, 1)
+        self.assertIsNone(cache.get('snap:lock'))
+
+
+class StakeholderAnalyticsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        for name, city, active, units in [('A', 'Mumbai', True, 10), ('B', 'Mumbai', True, 5), ('C', 'Pune', False, 99)]:
+            hospital = EmergencyHospital.objects.create(
+                name=name, address=city, city=city, phone='1', emergency_phone='2', is_active=active,
+                email=f'{name}@hospital.gov.in', latitude=Decimal('19.0'), longitude=Decimal('72.8'),
+            )
+            EmergencyBloodStock.objects.create(hospital=hospital, blood_group='O+', units_available=units)
+            EmergencyBloodStock.objects.create(hospital=hospital, blood_group='A+', units_available=1)
+        EmergencyRequest.objects.create(blood_group='O+', quantity_needed=1, status='COMPLETED')
+        EmergencyRequest.objects.create(blood_group='O+', quantity_needed=1)
+        EmergencyRequest.objects.create(blood_group='B-', quantity_needed=1)
+        self.url = reverse('emergency:stakeholder_analytics_api')
+
+    def test_analytics_are_aggregated_and_cached(self):
+        with self.assertNumQueries(8):
+            data = self.client.get(self.url).json()['data']
+
+        overview = data['system_overview']
+        self.assertEqual(overview['total_hospitals'], 2)
+        self.assertEqual(overview['total_inventory'], 17)
+        self.assertEqual(overview['total_requests'], 3)
+        self.assertEqual(overview['success_rate'], 33.3)
+        self.assertEqual(data['blood_demand_analysis']['O+'], {'demand': 2, 'available': 15, 'ratio': 7.5})
+        self.assertEqual(data['blood_demand_analysis']['AB-'], {'demand': 0, 'available': 0, 'ratio': 0.0})
+        self.assertEqual(data['city_distribution'], [{'city': 'Mumbai', 'hospital_count': 2, 'total_inventory': 17}])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).json()['data'], data)
+        # Each window has its own snapshot
+        with self.assertNumQueries(8):
+            self.client.get(self.url, {'days': 7})
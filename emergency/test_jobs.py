@@ -0,0 +1,226 @@
+"""
+Tests for the database-backed job queue
+"""
+
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from .followups import FollowUpScheduler, TimerWheel
+from .intake import create_request_once
+from .jobs import (
+    register_task, enqueue, claim_jobs, queue_metrics, run_job, run_pending_jobs, requeue_stale_jobs, timer_tick, TASKS
+)
+from .models import BackgroundJob, BackgroundJobLock, FollowUpTimer
+from .tasks import enqueue_emergency_request
+
+CALLS = []
+
+
+@register_task('tests.record')
+def record_task(value):
+    CALLS.append(value)
+
+
+@register_task('tests.explode', max_attempts=2)
+def explode_task():
+    raise RuntimeError('boom')
+
+
+class JobQueueTestCase(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_enqueue_rejects_unknown_task(self):
+        with self.assertRaises(ValueError):
+            enqueue('tests.missing')
+
+    def test_jobs_run_in_priority_order(self):
+        enqueue('tests.record', {'value': 'low'}, priority=0)
+        enqueue('tests.record', {'value': 'high'}, priority=10)
+
+        self.assertEqual(run_pending_jobs(), 2)
+        self.assertEqual(CALLS, ['high', 'low'])
+        self.assertEqual(BackgroundJob.objects.filter(status='SUCCEEDED').count(), 2)
+        self.assertFalse(BackgroundJobLock.objects.exists())
+
+    def test_claimed_job_is_not_claimed_twice(self):
+        enqueue('tests.record', {'value': 1})
+
+        first = claim_jobs('worker-a')
+        second = claim_jobs('worker-b')
+
+        self.assertEqual(len(first), 1)
+        self.assertEqual(second, [])
+        self.assertEqual(first[0].status, 'RUNNING')
+        self.assertEqual(first[0].attempts, 1)
+
+    def test_delayed_job_waits_for_run_at(self):
+        enqueue('tests.record', {'value': 1}, delay=60)
+        self.assertEqual(claim_jobs('worker-a'), [])
+
+    @override_settings(JOB_QUEUE_TIMER_MAX_SLEEP=30)
+    def test_local_timer_sleeps_until_the_next_job_falls_due(self):
+        with mock.patch('emergency.jobs._get_local_executor') as executor:
+            self.assertEqual(timer_tick(), 30)  # Empty queue
+
+            enqueue('tests.record', {'value': 'later'}, delay=5)
+            self.assertAlmostEqual(timer_tick(), 5, delta=1)
+            executor.assert_not_called()
+
+            enqueue('tests.record', {'value': 'now'})
+            self.assertAlmostEqual(timer_tick(), 5, delta=1)
+            executor.return_value.submit.assert_called_once()
+
+    @override_settings(JOB_QUEUE_RETRY_BASE_SECONDS=10)
+    def test_failure_retries_with_backoff_then_dead_letters(self):
+        job = enqueue('tests.explode')
+
+        run_job(claim_jobs('worker-a')[0])
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'QUEUED')
+        self.assertGreaterEqual(job.run_at, timezone.now() + timedelta(seconds=9))
+        self.assertIn('boom', job.last_error)
+
+        # Make the retry due and fail it again
+        BackgroundJob.objects.filter(id=job.id).update(run_at=timezone.now())
+        run_job(claim_jobs('worker-a')[0])
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'DEAD')
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNotNone(job.finished_at)
+
+    @override_settings(JOB_QUEUE_STALE_AFTER_SECONDS=60)
+    def test_stale_running_job_is_requeued(self):
+        enqueue('tests.record', {'value': 1})
+        job = claim_jobs('worker-a')[0]
+        BackgroundJob.objects.filter(id=job.id).update(locked_at=timezone.now() - timedelta(minutes=5))
+
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(run_pending_jobs(), 1)
+        self.assertEqual(CALLS, [1])
+
+    def test_emergency_tasks_are_registered(self):
+        self.assertIn('emergency.process_request', TASKS)
+
+    def test_ordering_key_runs_one_job_per_key_in_order(self):
+        first = enqueue('tests.record', {'value': 'a1'}, ordering_key='sender-a')
+        enqueue('tests.record', {'value': 'a2'}, ordering_key='sender-a', priority=10)
+        enqueue('tests.record', {'value': 'b1'}, ordering_key='sender-b')
+
+        claimed = claim_jobs('worker-1', limit=10)
+        self.assertEqual(sorted(job.payload['value'] for job in claimed), ['a1', 'b1'])
+
+        # a2 stays blocked until a1 has finished, despite its higher priority
+        self.assertEqual(claim_jobs('worker-2', limit=10), [])
+        for job in claimed:
+            run_job(job)
+        self.assertEqual([job.payload['value'] for job in claim_jobs('worker-2', limit=10)], ['a2'])
+        self.assertEqual(BackgroundJob.objects.get(id=first.id).status, 'SUCCEEDED')
+
+
+@override_settings(JOB_PRIORITY_AGING_SECONDS=30, EMERGENCY_URGENCY_PRIORITIES={'CRITICAL': 20, 'URGENT': 10, 'ROUTINE': 0})
+class PrioritySchedulingTestCase(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_waiting_jobs_age_past_newer_higher_priority(self):
+        enqueue('tests.record', {'value': 'routine-5min'}, priority=0, delay=-300)
+        enqueue('tests.record', {'value': 'routine-15min'}, priority=0, delay=-900)
+        enqueue('tests.record', {'value': 'critical'}, priority=20)
+
+        run_pending_jobs()
+        self.assertEqual(CALLS, ['routine-15min', 'critical', 'routine-5min'])
+
+    def test_min_priority_claims_only_urgent_jobs(self):
+        enqueue('tests.record', {'value': 'routine'}, priority=0, delay=-3600)
+        enqueue('tests.record', {'value': 'critical'}, priority=20)
+
+        claimed = claim_jobs('priority-lane', limit=5, min_priority=20)
+        self.assertEqual([job.payload['value'] for job in claimed], ['critical'])
+
+    @override_settings(EMERGENCY_ROUTINE_DEFER_DEPTH=1, EMERGENCY_ROUTINE_DEFER_SECONDS=60)
+    def test_routine_requests_are_deferred_under_load(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            enqueue_emergency_request(1, 'CRITICAL')
+            enqueue_emergency_request(2, 'ROUTINE')
+
+        critical, routine = BackgroundJob.objects.order_by('id')
+        self.assertEqual((critical.priority, routine.priority), (20, 0))
+        self.assertGreater(routine.run_at, timezone.now() + timedelta(seconds=50))
+
+    def test_queue_metrics_per_priority(self):
+        enqueue('tests.record', {'value': 1}, priority=20, delay=-60)
+        enqueue('tests.record', {'value': 2}, priority=0)
+        enqueue('tests.record', {'value': 3}, priority=0, delay=600)
+        run_job(claim_jobs('worker-a', min_priority=20)[0])
+
+        critical, routine = queue_metrics()
+        self.assertEqual(critical['label'], 'CRITICAL')
+        self.assertEqual((critical['depth'], critical['started']), (0, 1))
+        self.assertGreaterEqual(critical['avg_wait_seconds'], 59)
+        self.assertEqual(routine['label'], 'ROUTINE')
+        self.assertEqual((routine['depth'], routine['ready']), (2, 1))
+
+
+@override_settings(EMERGENCY_FOLLOW_UPS=[(15, 'update'), (30, 'reminder')])
+class FollowUpSchedulerTestCase(TestCase):
+    def setUp(self):
+        self.emergency_request, _ = create_request_once(
+            blood_group='O+', quantity_needed=1, contact_phone='+919876543210'
+        )
+
+    def test_timer_wheel_fires_on_due_tick(self):
+        wheel = TimerWheel(slots=8, tick=1.0, now=1000)
+        wheel.add('soon', 1002.5)
+        wheel.add('next-turn', 1011)  # Past one turn of the wheel, shares a slot with 1003
+        wheel.add('overdue', 900)
+
+        self.assertEqual(wheel.advance(1001), ['overdue'])
+        self.assertEqual(wheel.advance(1003), ['soon'])
+        self.assertEqual(wheel.advance(1010), [])
+        self.assertEqual(wheel.advance(1011), ['next-turn'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_request_timers_fire_once_when_due(self):
+        timers = self.emergency_request.follow_up_timers.order_by('due_at')
+        self.assertEqual([(t.message_type, t.offset_minutes) for t in timers], [('update', 15), ('reminder', 30)])
+
+        scheduler = FollowUpScheduler(tick=1.0, slots=1200, refill_interval=30)  # 20 minute horizon
+        created = self.emergency_request.created_at.timestamp()
+
+        scheduler.run_once(now=created)
+        self.assertEqual(len(scheduler.wheel), 1)  # The 30 minute reminder is beyond the horizon
+        self.assertEqual(scheduler.run_once(now=created + 14 * 60), 0)
+        self.assertEqual(scheduler.run_once(now=created + 15 * 60), 1)
+        self.assertEqual(scheduler.fire([timers[0].id]), 0)  # Already fired
+
+        self.assertEqual(run_pending_jobs(), 2)  # The follow-up, then the outbox dispatch it staged
+        notification = self.emergency_request.notifications.get()
+        self.assertIn('15min Update', notification.message)
+        self.assertEqual((notification.channel, notification.status), ('follow_up', 'SENT'))
+        self.assertEqual(FollowUpTimer.objects.get(id=timers[0].id).status, 'FIRED')
+
+    def test_timers_overdue_after_downtime_are_skipped(self):
+        timers = self.emergency_request.follow_up_timers.order_by('due_at')
+        FollowUpTimer.objects.filter(id=timers[0].id).update(due_at=timezone.now() - timedelta(hours=2))
+
+        scheduler = FollowUpScheduler(tick=1.0, slots=1200, refill_interval=30)
+        self.assertEqual(scheduler.run_once(), 0)
+        self.assertEqual(FollowUpTimer.objects.get(id=timers[0].id).status, 'SKIPPED')
+        self.assertFalse(BackgroundJob.objects.exists())
+
+    def test_failed_request_gets_no_follow_up(self):
+        timer = self.emergency_request.follow_up_timers.order_by('due_at').first()
+        FollowUpTimer.objects.filter(id=timer.id).update(due_at=timezone.now())
+        self.emergency_request.transition_to('FAILED')
+
+        scheduler = FollowUpScheduler(tick=1.0, slots=1200, refill_interval=30)
+        self.assertEqual(scheduler.run_once(now=timezone.now().timestamp() + 1), 1)
+        self.assertEqual(run_pending_jobs(), 1)
+        self.assertFalse(self.emergency_request.notifications.exists())
+        self.assertEqual(FollowUpTimer.objects.get(id=timer.id).status, 'SKIPPED')
+
+    def test_completed_request_cancels_pending_timers(self):
+        self.emergency_request.mark_completed()
+        self.assertFalse(self.emergency_request.follow_up_timers.filter(status='PENDING').exists())
@@ -0,0 +1,388 @@
+"""
+Tests for the emergency notification plumbing (SMS clients, providers, email)
+"""
+
+import logging
+import smtplib
+import socket
+from datetime import timedelta
+from unittest import mock, skipUnless
+from django.core import mail
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from .circuit_breaker import CircuitBreaker
+from .delivery_status import flush_status_updates
+from .jobs import run_pending_jobs
+from .models import BackgroundJob, DeliveryStatusUpdate, EmergencyNotification, EmergencyRequest
+from .outbox import SENDERS, dispatch_batch, dispatch_outbox, stage_notification
+from .mail_pool import get_mail_pool, reset_mail_pool, send_pooled_mail
+from .sms_providers import SMSDeliveryError, SMSRouter, Fast2SMSProvider, MSG91Provider
+from .sms_stub import StubSMSServer
+from .twilio_client import get_twilio_client, reset_twilio_client
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+@override_settings(TWILIO_ACCOUNT_SID='ACtest', TWILIO_AUTH_TOKEN='token', TWILIO_CONNECT_TIMEOUT=2, TWILIO_READ_TIMEOUT=7)
+class TwilioClientTestCase(SimpleTestCase):
+    def setUp(self):
+        reset_twilio_client()
+
+    def tearDown(self):
+        reset_twilio_client()
+
+    def test_client_is_shared(self):
+        self.assertIs(get_twilio_client(), get_twilio_client())
+
+    def test_client_uses_pooled_session_with_timeouts(self):
+        http_client = get_twilio_client().http_client
+        self.assertIsNotNone(http_client.session)
+        self.assertEqual(http_client.timeout, (2, 7))
+
+    def test_credential_change_rebuilds_client(self):
+        client = get_twilio_client()
+        with self.settings(TWILIO_AUTH_TOKEN='rotated'):
+            self.assertIsNot(get_twilio_client(), client)
+
+    @override_settings(TWILIO_ACCOUNT_SID='')
+    def test_unconfigured_returns_none(self):
+        self.assertIsNone(get_twilio_client())
+
+
+class SMSRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.stub = StubSMSServer().start()
+        self.fast2sms = Fast2SMSProvider(api_url=self.stub.url('fast2sms'), api_key='test')
+        self.msg91 = MSG91Provider(api_url=self.stub.url('msg91'), api_key='test')
+        self.router = SMSRouter([self.fast2sms, self.msg91])
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_sends_via_first_healthy_provider(self):
+        result = self.router.send('+91 98765-43210', 'Blood available')
+        self.assertTrue(result['success'])
+        self.assertEqual(result['provider'], 'fast2sms')
+        self.assertEqual(self.stub.sent_via('fast2sms')[0]['numbers'], '9876543210')
+        self.assertEqual(self.stub.sent_via('msg91'), [])
+
+    def test_fails_over_when_provider_errors(self):
+        self.stub.failing.add('fast2sms')
+        result = self.router.send('+919876543210', 'Blood available')
+        self.assertTrue(result['success'])
+        self.assertEqual(result['provider'], 'msg91')
+        self.assertEqual(len(result['errors']), 1)
+        self.assertEqual(self.stub.sent_via('msg91')[0]['mobiles'], '919876543210')
+
+    def test_unhealthy_provider_is_ranked_last(self):
+        self.stub.failing.add('fast2sms')
+        self.router.send('+919876543210', 'first')
+        self.stub.failing.clear()
+
+        self.assertEqual([p.name for p in self.router.ranked_providers()], ['msg91', 'fast2sms'])
+        self.assertEqual(self.router.send('+919876543210', 'second')['provider'], 'msg91')
+
+    def test_all_providers_failing(self):
+        self.stub.failing.update({'fast2sms', 'msg91'})
+        result = self.router.send('+919876543210', 'Blood available')
+        self.assertFalse(result['success'])
+        self.assertEqual(len(result['errors']), 2)
+
+    def test_unconfigured_providers_are_skipped(self):
+        router = SMSRouter([Fast2SMSProvider(api_url=self.stub.url('fast2sms'), api_key=''), self.msg91])
+        self.assertEqual(router.send('+919876543210', 'Blood available')['provider'], 'msg91')
+        self.assertFalse(SMSRouter([]).is_configured())
+
+
+class CircuitBreakerTestCase(SimpleTestCase):
+    def test_opens_after_threshold_and_probes_after_timeout(self):
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+
+        breaker._opened_at -= 61
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())  # Only one probe at a time
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=60)
+        breaker.record_failure()
+        breaker._opened_at -= 61
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    @override_settings(SMS_CIRCUIT_FAILURE_THRESHOLD=1)
+    def test_router_skips_open_circuit_without_queries(self):
+        with StubSMSServer() as stub:
+            stub.failing.add('fast2sms')
+            router = SMSRouter([Fast2SMSProvider(api_url=stub.url('fast2sms'), api_key='test')])
+            self.assertFalse(router.send('+919876543210', 'first')['success'])
+            self.assertFalse(router.is_available())
+
+            stub.failing.clear()
+            result = router.send('+919876543210', 'second')
+            self.assertEqual(result['errors'], ['fast2sms: circuit open'])
+            self.assertEqual(len(stub.sent_via('fast2sms')), 1)
+
+
+class _RecordingHandler:
+    def __init__(self):
+        self.messages = []
+        self.peers = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        self.peers.add(session.peer)
+        return '250 Message accepted for delivery'
+
+
+@skipUnless(Controller, "aiosmtpd is not installed")
+class PooledMailTestCase(SimpleTestCase):
+    def setUp(self):
+        logging.getLogger('mail.log').setLevel(logging.WARNING)
+        self.handler = _RecordingHandler()
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        self.smtpd = Controller(self.handler, hostname='127.0.0.1', port=port)
+        self.smtpd.start()
+        self.mail_settings = self.settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=port,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+        )
+        self.mail_settings.enable()
+        reset_mail_pool()
+
+    def tearDown(self):
+        reset_mail_pool()
+        self.mail_settings.disable()
+        self.smtpd.stop()
+
+    def test_sends_reuse_one_connection(self):
+        for i in range(3):
+            send_pooled_mail(f"Subject {i}", 'Body', 'from@example.com', [f"to{i}@example.com"])
+        self.assertEqual(len(self.handler.messages), 3)
+        self.assertEqual(len(self.handler.peers), 1)
+
+    def test_reconnects_after_dropped_connection(self):
+        send_pooled_mail('First', 'Body', 'from@example.com', ['to@example.com'])
+        # Simulate the server dropping the idle session
+        get_mail_pool()._idle.queue[0].backend.connection.sock.shutdown(socket.SHUT_RDWR)
+
+        self.assertEqual(send_pooled_mail('Second', 'Body', 'from@example.com', ['to@example.com']), 1)
+        self.assertEqual(len(self.handler.messages), 2)
+        self.assertEqual(len(self.handler.peers), 2)
+
+
+@override_settings(SMS_STATUS_BATCH_LINGER=60)
+class DeliveryStatusTestCase(TestCase):
+    def setUp(self):
+        emergency_request = EmergencyRequest.objects.create(
+            blood_group='O+', quantity_needed=1, contact_phone='+919876543210'
+        )
+        self.notifications = [
+            EmergencyNotification.objects.create(
+                request=emergency_request, notification_type='SMS', recipient='+919876543210',
+                message='test', status='SENT', provider_response=f'SM{i}', provider_message_id=f'SM{i}'
+            )
+            for i in range(3)
+        ]
+
+    def _callback(self, sid, status):
+        response = self.client.post(reverse('emergency:sms_status'), {'MessageSid': sid, 'MessageStatus': status})
+        self.assertEqual(response.status_code, 200)
+
+    @mock.patch.dict('emergency.delivery_status._window', {'due': 0.0, 'count': 0})
+    def test_callbacks_are_stored_then_applied_in_bulk(self):
+        self._callback('SM0', 'delivered')
+        self._callback('SM1', 'undelivered')
+        self._callback('SM2', 'delivered')
+        self._callback('SM2', 'sent')  # Late 'sent' must not undo the delivery
+        self._callback('SM9', 'delivered')  # Unknown message
+
+        # Stored before the 200, applied later by one job
+        self.assertEqual(DeliveryStatusUpdate.objects.count(), 5)
+        self.assertFalse(EmergencyNotification.objects.filter(status='DELIVERED').exists())
+        self.assertEqual(BackgroundJob.objects.get().task, 'emergency.apply_delivery_statuses')
+        DeliveryStatusUpdate.objects.filter(provider_message_id='SM0').update(
+            received_at=timezone.now() - timedelta(minutes=5)
+        )
+
+        with self.assertNumQueries(4):
+            self.assertEqual(flush_status_updates(), 3)
+
+        statuses = dict(EmergencyNotification.objects.values_list('provider_message_id', 'status'))
+        self.assertEqual(statuses, {'SM0': 'DELIVERED', 'SM1': 'FAILED', 'SM2': 'DELIVERED'})
+        delivered_at = dict(EmergencyNotification.objects.values_list('provider_message_id', 'delivered_at'))
+        self.assertLess(delivered_at['SM0'], delivered_at['SM2'] - timedelta(minutes=4))
+        self.assertFalse(DeliveryStatusUpdate.objects.exists())
+        self.assertEqual(flush_status_updates(), 0)
+
+
+    @mock.patch.dict('emergency.delivery_status._window', {'due': 0.0, 'count': 0})
+    @mock.patch.dict('emergency.jobs._local_timer', {'thread': mock.Mock()})
+    @mock.patch('emergency.jobs._local_timer_wake')
+    def test_a_partial_batch_wakes_the_job_timer(self, timer_wake):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._callback('SM0', 'delivered')
+        timer_wake.set.assert_called_once()
+        self.assertGreater(BackgroundJob.objects.get().run_at, timezone.now())
+
+
+@override_settings(NOTIFICATION_FANOUT_CONCURRENT=False, OUTBOX_MAX_ATTEMPTS=2)
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        self.emergency_request = EmergencyRequest.objects.create(
+            blood_group='O+', quantity_needed=1, contact_phone='+919876543210'
+        )
+
+    def _stage(self):
+        with transaction.atomic():
+            return stage_notification(self.emergency_request, 'sms', 'SMS', '+919876543210', 'test')
+
+    def test_staged_notification_rolls_back_with_its_transaction(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                stage_notification(self.emergency_request, 'sms', 'SMS', '+919876543210', 'test')
+                raise RuntimeError('state change failed')
+
+        self.assertFalse(EmergencyNotification.objects.exists())
+        self.assertFalse(BackgroundJob.objects.exists())
+
+    def test_dispatch_job_sends_and_records_outcome(self):
+        notification = self._stage()
+        run_pending_jobs()
+
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, 'SENT')
+        self.assertEqual(notification.attempts, 1)
+        self.assertEqual(notification.claimed_by, '')
+        self.emergency_request.refresh_from_db()
+        self.assertTrue(self.emergency_request.sms_sent)
+        self.assertEqual(self.emergency_request.notification_results['sms']['outcome'], 'sent')
+
+    def test_failed_send_is_retried_then_failed(self):
+        notification = self._stage()
+        failing = mock.Mock(side_effect=SMSDeliveryError('provider down'))
+        with mock.patch.dict(SENDERS, {'SMS': failing}):
+            self.assertEqual(dispatch_outbox(), 1)
+            notification.refresh_from_db()
+            self.assertEqual((notification.status, notification.attempts), ('PENDING', 1))
+            self.assertIn('provider down', notification.error_message)
+
+            # Not ready again until the backoff has passed
+            self.assertEqual(dispatch_outbox(), 0)
+            EmergencyNotification.objects.filter(id=notification.id).update(next_attempt_at=notification.created_at)
+            self.assertEqual(dispatch_outbox(), 1)
+
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.attempts), ('FAILED', 2))
+        self.assertEqual(failing.call_count, 2)
+        self.emergency_request.refresh_from_db()
+        self.assertFalse(self.emergency_request.sms_sent)
+        self.assertEqual(self.emergency_request.notification_results['sms']['attempts'], 2)
+
+    @override_settings(OUTBOX_BATCH_SIZE=50, NOTIFICATION_FANOUT_WORKERS=2)
+    def test_batch_is_capped_at_the_pool_size(self):
+        for _ in range(3):
+            self._stage()
+        self.assertEqual(dispatch_batch(), 2)
+        self.assertEqual(dispatch_batch(), 1)
+
+    def test_one_dispatch_job_per_transaction(self):
+        critical = EmergencyRequest.objects.create(
+            blood_group='O-', quantity_needed=1, contact_phone='+919876543211', urgency='CRITICAL'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                stage_notification(self.emergency_request, 'sms', 'SMS', '+919876543210', 'test')
+                stage_notification(self.emergency_request, 'admin_sms', 'SMS', '+919000000000', 'test')
+                stage_notification(critical, 'sms', 'SMS', '+919876543211', 'test')
+
+        job = BackgroundJob.objects.get()
+        self.assertEqual(job.priority, 20)  # Raised to the most urgent request staged
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._stage()
+        self.assertEqual(BackgroundJob.objects.count(), 2)
+
+    def test_dispatch_job_rolled_back_with_a_savepoint_is_replaced(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        stage_notification(self.emergency_request, 'sms', 'SMS', '+919876543210', 'test')
+                        raise RuntimeError('state change failed')
+                except RuntimeError:
+                    pass
+                stage_notification(self.emergency_request, 'admin_sms', 'SMS', '+919000000000', 'test')
+
+        self.assertEqual(BackgroundJob.objects.filter(task='emergency.dispatch_outbox').count(), 1)
+        self.assertEqual(EmergencyNotification.objects.count(), 1)
+
+    def test_send_that_never_started_is_not_an_attempt(self):
+        notification = self._stage()
+        results = {str(notification.id): {'outcome': 'not_started', 'latency_ms': 0.0}}
+        with mock.patch('emergency.outbox.dispatch_channels', return_value=results):
+            self.assertEqual(dispatch_outbox(max_batches=1), 1)
+
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.attempts, notification.claimed_by), ('PENDING', 0, ''))
+        self.assertLessEqual(notification.next_attempt_at, timezone.now())
+
+    def test_notification_without_request_is_sent(self):
+        reset_mail_pool()
+        self.addCleanup(reset_mail_pool)
+        stage_notification(None, 'email', 'EMAIL', 'donor@example.com', 'Body', subject='Blood Available', html_message='<p>Body</p>')
+        self.assertEqual(dispatch_outbox(), 1)
+
+        self.assertEqual(EmergencyNotification.objects.get().status, 'SENT')
+        self.assertEqual(mail.outbox[0].to, ['donor@example.com'])
+        self.assertEqual(mail.outbox[0].alternatives, [('<p>Body</p>', 'text/html')])
+
+    def test_emails_are_sent_together_on_one_connection(self):
+        for i in range(3):
+            stage_notification(None, 'email', 'EMAIL', f"donor{i}@example.com", 'Body', subject='Blood Available')
+        self._stage()
+
+        pool = mock.Mock()
+        pool.send_batch.return_value = [None, smtplib.SMTPRecipientsRefused({}), None]
+        with mock.patch('emergency.outbox.get_mail_pool', return_value=pool):
+            self.assertEqual(dispatch_batch(), 4)
+
+        pool.send_batch.assert_called_once()
+        self.assertEqual([m.to for m in pool.send_batch.call_args.args[0]], [[f"donor{i}@example.com"] for i in range(3)])
+        statuses = list(EmergencyNotification.objects.filter(notification_type='EMAIL').order_by('id').values_list('status', 'attempts'))
+        self.assertEqual(statuses, [('SENT', 1), ('PENDING', 1), ('SENT', 1)])
+        self.assertEqual(EmergencyNotification.objects.get(notification_type='SMS').status, 'SENT')
+
+    def test_abandoned_claim_is_sent_again(self):
+        notification = self._stage()
+        EmergencyNotification.objects.filter(id=notification.id).update(
+            claimed_by='dead-worker', claimed_at=notification.created_at
+        )
+        self.assertEqual(dispatch_outbox(), 0)
+
+        EmergencyNotification.objects.filter(id=notification.id).update(
+            claimed_at=notification.created_at - timedelta(minutes=10)
+        )
+        self.assertEqual(dispatch_outbox(), 1)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, 'SENT')
@@ -0,0 +1,99 @@
+"""
+Tests for WebSocket push of request status and inventory changes
+"""
+
+from decimal import Decimal
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.routing import URLRouter
+from channels.testing.websocket import WebsocketCommunicator
+from django.test import TransactionTestCase, override_settings
+from .models import EmergencyHospital, EmergencyBloodStock, EmergencyRequest
+from .routing import websocket_urlpatterns
+
+IN_MEMORY_LAYER = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER)
+class RealtimePushTestCase(TransactionTestCase):
+    def setUp(self):
+        self.application = URLRouter(websocket_urlpatterns)
+        self.hospital = EmergencyHospital.objects.create(
+            name='Test Hospital',
+            address='Parel, Mumbai',
+            city='Mumbai',
+            phone='+912224136051',
+            emergency_phone='+912224136000',
+            email='test@hospital.gov.in',
+            latitude=Decimal('19.03300000'),
+            longitude=Decimal('72.84270000'),
+        )
+
+    def test_request_status_is_pushed(self):
+        emergency_request = EmergencyRequest.objects.create(
+            blood_group='O+',
+            quantity_needed=1,
+            contact_phone='+919876543210'
+        )
+        async_to_sync(self._watch_request)(emergency_request)
+
+    async def _watch_request(self, emergency_request):
+        communicator = WebsocketCommunicator(
+            self.application, f"/ws/emergency/status/{emergency_request.request_id}/"
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        # Current status is sent on connect
+        current = await communicator.receive_json_from()
+        self.assertEqual(current['status'], 'PENDING')
+        self.assertTrue(current['in_progress'])
+
+        emergency_request.status = 'NOTIFIED'
+        await sync_to_async(emergency_request.save)()
+
+        pushed = await communicator.receive_json_from()
+        self.assertEqual(pushed['status'], 'NOTIFIED')
+        self.assertFalse(pushed['in_progress'])
+        await communicator.disconnect()
+
+    def test_stock_changes_reach_city_subscribers_only(self):
+        async_to_sync(self._watch_inventory)()
+
+    async def _watch_inventory(self):
+        mumbai = WebsocketCommunicator(self.application, '/ws/emergency/inventory/?city=Mumbai')
+        pune = WebsocketCommunicator(self.application, '/ws/emergency/inventory/?city=Pune')
+        self.assertTrue((await mumbai.connect())[0])
+        self.assertTrue((await pune.connect())[0])
+
+        await sync_to_async(EmergencyBloodStock.objects.create)(
+            hospital=self.hospital, blood_group='A+', units_available=4
+        )
+
+        delta = await mumbai.receive_json_from()
+        self.assertEqual(delta['type'], 'inventory.delta')
+        self.assertEqual((delta['blood_group'], delta['units_available']), ('A+', 4))
+        self.assertTrue(await pune.receive_nothing())
+
+        await mumbai.disconnect()
+        await pune.disconnect()
+
+    def test_city_filter_matches_like_the_rest_api(self):
+        EmergencyHospital.objects.create(
+            name='Vashi Hospital', address='Vashi', city='Navi Mumbai', phone='1', emergency_phone='2',
+            email='vashi@hospital.gov.in', latitude=Decimal('19.07'), longitude=Decimal('73.0'),
+        )
+        async_to_sync(self._watch_partial_city)()
+
+    async def _watch_partial_city(self):
+        communicator = WebsocketCommunicator(self.application, '/ws/emergency/inventory/?city=mumbai')
+        self.assertTrue((await communicator.connect())[0])
+
+        navi = await sync_to_async(EmergencyHospital.objects.get)(city='Navi Mumbai')
+        for hospital in (self.hospital, navi):
+            await sync_to_async(EmergencyBloodStock.objects.create)(
+                hospital=hospital, blood_group='B+', units_available=2
+            )
+
+        cities = {(await communicator.receive_json_from())['city'] for _ in range(2)}
+        self.assertEqual(cities, {'Mumbai', 'Navi Mumbai'})
+        await communicator.disconnect()
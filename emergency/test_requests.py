@@ -0,0 +1,664 @@
+"""
+Tests for emergency request intake and background processing
+"""
+
+import gzip
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock, skipUnless
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from .compression import brotli
+from .fanout import dispatch_channels
+from .jobs import run_pending_jobs
+from .outbox import dispatch_outbox
+from .ratelimit import DatabaseBuckets, reset_buckets
+from .sms_handler import process_inbound_sms
+from .versions import INVENTORY, city_key, get_versions, request_key
+from .views import search_hospitals_and_notify
+from .models import (
+    BackgroundJob, EmergencyHospital, EmergencyBloodStock, EmergencyNotification, EmergencyRequest, InboundSMS,
+    InvalidTransition, RateLimitBucket,
+)
+
+
+class EmergencyRequestIntakeTestCase(TestCase):
+    def setUp(self):
+        reset_buckets()
+        self.hospital = EmergencyHospital.objects.create(
+            name='Test Hospital',
+            address='Parel, Mumbai',
+            phone='+912224136051',
+            emergency_phone='+912224136000',
+            email='test@hospital.gov.in',
+            latitude=Decimal('19.03300000'),
+            longitude=Decimal('72.84270000'),
+        )
+        EmergencyBloodStock.objects.create(
+            hospital=self.hospital,
+            blood_group='O+',
+            units_available=10
+        )
+        self.payload = {
+            'blood_group': 'O+',
+            'quantity': 2,
+            'latitude': '19.0400',
+            'longitude': '72.8500',
+            'phone': '9876543210',
+        }
+
+    def _post_request(self, **headers):
+        return self.client.post(
+            reverse('emergency:create_request'),
+            data=json.dumps(self.payload),
+            content_type='application/json',
+            headers=headers
+        )
+
+    def test_create_request_returns_before_processing(self):
+        """The response carries the request ID while the search is still queued"""
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self._post_request()
+
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertTrue(data['queued'])
+        self.assertEqual(BackgroundJob.objects.count(), 1)
+
+        emergency_request = EmergencyRequest.objects.get(request_id=data['request_id'])
+        self.assertEqual(emergency_request.status, 'PENDING')
+
+        status = self.client.get(
+            reverse('emergency:check_status', args=[data['request_id']])
+        ).json()
+        self.assertTrue(status['in_progress'])
+
+    @override_settings(
+        EMERGENCY_PROCESS_INLINE=True, NOTIFICATION_FANOUT_CONCURRENT=False,
+        EMERGENCY_NOTIFICATION_PHONE='+919800000000'
+    )
+    def test_status_reflects_processing_result(self):
+        """Once processed, status polling reports the hospitals found"""
+        data = self._post_request().json()
+        emergency_request = EmergencyRequest.objects.get(request_id=data['request_id'])
+        self.assertEqual(emergency_request.notification_results['sms']['outcome'], 'queued')
+        run_pending_jobs()
+
+        status = self.client.get(
+            reverse('emergency:check_status', args=[data['request_id']])
+        ).json()
+        self.assertEqual(status['status'], 'NOTIFIED')
+        self.assertFalse(status['in_progress'])
+        self.assertEqual(len(status['hospitals']), 1)
+
+        emergency_request = EmergencyRequest.objects.get(request_id=data['request_id'])
+        self.assertTrue(emergency_request.sms_sent)
+        self.assertEqual(emergency_request.notification_results['sms']['outcome'], 'sent')
+        self.assertIn('latency_ms', emergency_request.notification_results['admin_sms'])
+
+    @override_settings(NOTIFICATION_FANOUT_CONCURRENT=False)
+    def test_processing_records_each_stage(self):
+        emergency_request = EmergencyRequest.objects.create(
+            blood_group='O+', quantity_needed=2, contact_phone='+919876543210',
+            user_latitude=Decimal('19.0400'), user_longitude=Decimal('72.8500'),
+        )
+
+        self.assertTrue(search_hospitals_and_notify(emergency_request.id))
+
+        # Notified only once the requester's SMS has actually been sent
+        emergency_request.refresh_from_db()
+        self.assertEqual((emergency_request.status, emergency_request.notified_at), ('FOUND', None))
+        # A repeated job run is a no-op rather than a second notification
+        self.assertTrue(search_hospitals_and_notify(emergency_request.id))
+        self.assertEqual(EmergencyNotification.objects.filter(request=emergency_request, channel='sms').count(), 1)
+
+        dispatch_outbox()
+        emergency_request.refresh_from_db()
+        self.assertEqual(emergency_request.status, 'NOTIFIED')
+        self.assertTrue(
+            emergency_request.created_at <= emergency_request.searching_at
+            <= emergency_request.found_at <= emergency_request.notified_at
+        )
+        self.assertEqual(list(emergency_request.stage_latencies()), ['SEARCHING', 'FOUND', 'NOTIFIED'])
+        self.client.force_login(User.objects.create_superuser('admin', password='pw'))
+        response = self.client.get(reverse('admin:emergency_emergencyrequest_change', args=[emergency_request.pk]))
+        self.assertContains(response, 'SEARCHING +')
+        self.assertEqual(EmergencyBloodStock.objects.get(hospital=self.hospital).units_available, 8)
+
+        with self.assertRaises(InvalidTransition):
+            emergency_request.transition_to('SEARCHING')
+        emergency_request.mark_completed()
+        self.assertIsNotNone(EmergencyRequest.objects.get(id=emergency_request.id).completed_at)
+
+    def test_idempotency_key_replays_existing_request(self):
+        """A retried submission with the same key is not processed again"""
+        with self.captureOnCommitCallbacks(execute=False):
+            first = self._post_request(**{'Idempotency-Key': 'retry-1'}).json()
+            self.payload['blood_group'] = 'A+'  # Key wins even if the body changed
+            second = self._post_request(**{'Idempotency-Key': 'retry-1'}).json()
+
+        self.assertEqual(second['request_id'], first['request_id'])
+        self.assertTrue(second['duplicate'])
+        self.assertEqual(EmergencyRequest.objects.count(), 1)
+        self.assertEqual(BackgroundJob.objects.count(), 1)
+
+    def test_repeat_submission_attaches_to_open_request(self):
+        """Same phone and blood group within the window coalesces into one request"""
+        with self.captureOnCommitCallbacks(execute=False):
+            first = self._post_request().json()
+            self.payload['phone'] = '+91 98765 43210'
+            second = self._post_request().json()
+
+        self.assertEqual(second['request_id'], first['request_id'])
+        self.assertEqual(BackgroundJob.objects.count(), 1)
+        self.assertEqual(EmergencyRequest.objects.get().duplicate_count, 1)
+
+        self.payload['blood_group'] = 'A+'
+        self.assertNotIn('duplicate', self._post_request().json())
+        self.assertEqual(EmergencyRequest.objects.count(), 2)
+
+    @override_settings(EMERGENCY_COALESCE_WINDOW_SECONDS=0)
+    def test_coalescing_can_be_disabled(self):
+        self._post_request()
+        self._post_request()
+        self.assertEqual(EmergencyRequest.objects.count(), 2)
+
+
+class NotificationFanoutTestCase(SimpleTestCase):
+    @override_settings(NOTIFICATION_CHANNEL_TIMEOUTS={'sms': 1, 'email': 0.1})
+    def test_slow_channel_does_not_delay_others(self):
+        def slow_email():
+            time.sleep(0.5)
+            return True
+
+        started = time.monotonic()
+        results = dispatch_channels([('sms', lambda: True), ('email', slow_email)])
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(results['sms']['outcome'], 'sent')
+        self.assertEqual(results['email']['outcome'], 'timeout')
+        self.assertLess(elapsed, 0.4)
+
+    def test_channel_errors_are_recorded(self):
+        def broken():
+            raise RuntimeError('smtp down')
+
+        results = dispatch_channels([('email', broken), ('admin_sms', lambda: False)])
+
+        self.assertEqual(results['email']['outcome'], 'error')
+        self.assertIn('smtp down', results['email']['error'])
+        self.assertEqual(results['admin_sms']['outcome'], 'failed')
+
+    @override_settings(NOTIFICATION_CHANNEL_TIMEOUTS={'a': 0.2, 'b': 0.2})
+    def test_deadline_starts_when_a_queued_send_begins(self):
+        def first():
+            time.sleep(0.15)
+            return True
+
+        def second():
+            time.sleep(0.1)  # Finishes 0.25s after the batch started, inside its own 0.2s
+            return True
+
+        with mock.patch('emergency.fanout._executor', ThreadPoolExecutor(max_workers=1)):
+            results = dispatch_channels([('a', first), ('b', second)])
+
+        self.assertEqual(results['a']['outcome'], 'sent')
+        self.assertEqual(results['b']['outcome'], 'sent')
+
+    @override_settings(NOTIFICATION_CHANNEL_TIMEOUTS={'a': 0.1, 'b': 0.1})
+    def test_unstarted_sends_are_cancelled_and_late_results_reported(self):
+        late = []
+        finished = threading.Event()
+
+        def slow():
+            time.sleep(0.3)
+            return True
+
+        def on_late(name, result):
+            late.append((name, result['outcome']))
+            finished.set()
+
+        never_run = mock.Mock(return_value=True)
+        with mock.patch('emergency.fanout._executor', ThreadPoolExecutor(max_workers=1)):
+            results = dispatch_channels([('a', slow), ('b', never_run)], on_late=on_late)
+            self.assertTrue(finished.wait(1))
+
+        self.assertEqual(results['a']['outcome'], 'timeout')
+        self.assertEqual(results['b']['outcome'], 'not_started')
+        never_run.assert_not_called()
+        self.assertEqual(late, [('a', 'sent')])
+
+
+@override_settings(CONDITIONAL_GET_ENABLED=True)
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hospital = EmergencyHospital.objects.create(
+            name='Test Hospital',
+            address='Parel, Mumbai',
+            city='Mumbai',
+            phone='+912224136051',
+            emergency_phone='+912224136000',
+            email='test@hospital.gov.in',
+            latitude=Decimal('19.03300000'),
+            longitude=Decimal('72.84270000'),
+        )
+        self.stock = EmergencyBloodStock.objects.create(hospital=self.hospital, blood_group='O+', units_available=10)
+        self.url = reverse('emergency:api_live_inventory')
+
+    def test_unchanged_poll_is_304_without_queries(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_stock_change_invalidates_etag(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stock.units_available = 3
+            self.stock.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['total_inventory']['O+'], 3)
+
+    def test_city_etag_ignores_other_cities(self):
+        mumbai_etag = self.client.get(self.url, {'city': 'Mumbai'})['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pune = EmergencyHospital.objects.create(
+                name='Pune Hospital', address='Pune', city='Pune', phone='1', emergency_phone='2',
+                email='pune@hospital.gov.in', latitude=Decimal('18.5'), longitude=Decimal('73.8'),
+            )
+            EmergencyBloodStock.objects.create(hospital=pune, blood_group='O+', units_available=5)
+
+        response = self.client.get(self.url, {'city': 'Mumbai'}, HTTP_IF_NONE_MATCH=mumbai_etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=mumbai_etag).status_code, 200)
+
+    def test_city_filter_matches_partial_names_and_follows_moves(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            navi = EmergencyHospital.objects.create(
+                name='Vashi Hospital', address='Vashi', city='Navi Mumbai', phone='1', emergency_phone='2',
+                email='vashi@hospital.gov.in', latitude=Decimal('19.07'), longitude=Decimal('73.0'),
+            )
+            EmergencyBloodStock.objects.create(hospital=navi, blood_group='O+', units_available=5)
+
+        data = self.client.get(self.url, {'city': 'mumbai'}).json()['data']
+        self.assertEqual(data['total_inventory']['O+'], 15)
+        pune_etag = self.client.get(self.url, {'city': 'Pune'})['ETag']
+
+        # Moving a hospital changes both its old and its new city
+        navi_version, = get_versions(city_key('Navi Mumbai'))
+        with self.captureOnCommitCallbacks(execute=True):
+            navi.city = 'Pune'
+            navi.save()
+        self.assertNotEqual(get_versions(city_key('Navi Mumbai')), [navi_version])
+        self.assertEqual(self.client.get(self.url, {'city': 'mumbai'}).json()['data']['total_inventory']['O+'], 10)
+        response = self.client.get(self.url, {'city': 'Pune'}, HTTP_IF_NONE_MATCH=pune_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['total_inventory']['O+'], 5)
+
+    def test_inventory_snapshot_is_cached_until_stock_changes(self):
+        thane = EmergencyHospital.objects.create(
+            name='Thane Hospital', address='Thane', city='Mumbai', phone='1', emergency_phone='2',
+            email='thane@hospital.gov.in', latitude=Decimal('19.2'), longitude=Decimal('72.97'),
+        )
+        EmergencyBloodStock.objects.create(hospital=thane, blood_group='A+', units_available=4)
+        self.client.get(self.url)
+
+        # Only the per-user distance ordering is computed on a cache hit
+        with self.assertNumQueries(0):
+            data = self.client.get(self.url, {'latitude': '19.21', 'longitude': '72.98'}).json()['data']
+        self.assertEqual([h['name'] for h in data['hospitals']], ['Thane Hospital', 'Test Hospital'])
+        self.assertEqual(data['cities']['Mumbai']['hospital_count'], 2)
+        self.assertEqual(data['cities']['Mumbai']['inventory']['A+'], 4)
+        self.assertEqual(data['total_units_available'], 14)
+        self.assertEqual(data['hospitals'][0]['inventory'], {
+            'A+': 4, 'A-': 0, 'B+': 0, 'B-': 0, 'AB+': 0, 'AB-': 0, 'O+': 0, 'O-': 0
+        })
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stock.units_available = 1
+            self.stock.save()
+
+        data = self.client.get(self.url, {'city': 'mumbai'}).json()['data']
+        self.assertEqual(data['total_inventory']['O+'], 1)
+        self.assertEqual(data['cities']['Mumbai']['total_units'], 5)
+
+    def test_inventory_hospitals_are_paginated_by_distance(self):
+        for i in range(4):
+            EmergencyHospital.objects.create(
+                name=f'Hospital {i}', address='Mumbai', city='Mumbai', phone='1', emergency_phone='2',
+                email=f'h{i}@hospital.gov.in', latitude=Decimal('19.1') + i, longitude=Decimal('72.9'),
+            )
+        params = {'latitude': '19.1', 'longitude': '72.9', 'limit': 2}
+
+        names = []
+        cursor = ''
+        while True:
+            data = self.client.get(self.url, {**params, 'cursor': cursor}).json()['data']
+            self.assertEqual(data['total_hospitals'], 5)
+            self.assertLessEqual(len(data['hospitals']), 2)
+            names += [hospital['name'] for hospital in data['hospitals']]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(names, ['Hospital 0', 'Test Hospital', 'Hospital 1', 'Hospital 2', 'Hospital 3'])
+
+    def test_inventory_page_query_count_is_constant(self):
+        for i in range(3):
+            hospital = EmergencyHospital.objects.create(
+                name=f'Hospital {i}', address='Mumbai', city='Mumbai', phone='1', emergency_phone='2',
+                email=f'h{i}@hospital.gov.in', latitude=Decimal('19.1'), longitude=Decimal('72.9'),
+            )
+            EmergencyBloodStock.objects.create(hospital=hospital, blood_group='O-', units_available=i + 3)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('emergency:hospital_inventory'))
+        cards = {card['name']: card for card in response.context['hospitals']}
+        self.assertEqual(cards['Hospital 0']['inventory_display']['O-'], 'less')
+        self.assertEqual(cards['Test Hospital']['inventory_status']['O+'], 'low')
+        self.assertEqual(cards['Test Hospital']['inventory_status']['A+'], 'empty')
+        self.assertIsNotNone(cards['Test Hospital']['last_updated'])
+        self.assertEqual(response.context['total_units_available'], 22)
+        # The page shows when the stock last changed, as a relative time the browser keeps current
+        self.assertEqual(response.context['last_updated'], EmergencyBloodStock.objects.latest('last_updated').last_updated)
+        self.assertContains(response, '<time class="relative-time" datetime=')
+
+        # Cached cards are re-rendered once their stock changes
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stock.units_available = 30
+            self.stock.save()
+        response = self.client.get(reverse('emergency:hospital_inventory'))
+        self.assertContains(response, 'data-stock="30"')
+
+    @override_settings(REQUEST_VERSION_TTL_SECONDS=60)
+    def test_only_request_counters_expire(self):
+        cache.clear()
+        with mock.patch.object(cache, 'add', wraps=cache.add) as add:
+            get_versions(INVENTORY, request_key(uuid.uuid4()))
+        self.assertEqual([call.kwargs['timeout'] for call in add.call_args_list], [None, 60])
+
+    def test_request_status_etag_follows_status(self):
+        emergency_request = EmergencyRequest.objects.create(blood_group='O+', quantity_needed=1)
+        url = reverse('emergency:check_status', args=[emergency_request.request_id])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            emergency_request.status = 'FAILED'
+            emergency_request.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'FAILED')
+
+
+class JsonApiTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hospital = EmergencyHospital.objects.create(
+            name='Test Hospital', address='Parel, Mumbai', city='Mumbai', phone='+912224136051',
+            emergency_phone='+912224136000', email='test@hospital.gov.in',
+            latitude=Decimal('19.03300000'), longitude=Decimal('72.84270000'),
+        )
+        EmergencyBloodStock.objects.create(hospital=self.hospital, blood_group='O+', units_available=10)
+
+    def test_find_nearby_hospitals_returns_numeric_rows(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('emergency:api_find_hospitals'), {
+                'latitude': '19.04', 'longitude': '72.85', 'blood_group': 'O+'
+            })
+        self.assertEqual(response.status_code, 200)
+        hospital, = response.json()['hospitals']
+        self.assertEqual(hospital['name'], 'Test Hospital')
+        self.assertIsInstance(hospital['distance'], float)
+        self.assertAlmostEqual(hospital['distance'], 1.1, places=1)
+
+        response = self.client.get(reverse('emergency:api_find_hospitals'), {
+            'latitude': '19.04', 'longitude': '72.85', 'blood_group': 'AB-'
+        })
+        self.assertEqual(response.json()['hospitals'], [])
+
+    def test_status_distance_is_numeric_or_null(self):
+        emergency_request = EmergencyRequest.objects.create(blood_group='O+', quantity_needed=1)
+        emergency_request.hospitals_found.add(self.hospital)
+        data = self.client.get(reverse('emergency:check_status', args=[emergency_request.request_id])).json()
+        self.assertIsNone(data['hospitals'][0]['distance'])
+
+    def test_json_responses_are_gzipped_when_accepted(self):
+        url = reverse('emergency:api_live_inventory')
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.content))['data']['total_hospitals'], 1)
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_json_responses_prefer_brotli(self):
+        response = self.client.get(reverse('emergency:api_live_inventory'), HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(brotli.decompress(response.content))['data']['total_hospitals'], 1)
+
+
+class PageCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hospital = EmergencyHospital.objects.create(
+            name='Test Hospital', address='Parel, Mumbai', city='Mumbai', phone='+912224136051',
+            emergency_phone='+912224136000', email='test@hospital.gov.in',
+            latitude=Decimal('19.03300000'), longitude=Decimal('72.84270000'),
+        )
+        self.stock = EmergencyBloodStock.objects.create(hospital=self.hospital, blood_group='O+', units_available=10)
+
+    def test_anonymous_pages_are_served_from_cache_until_inventory_changes(self):
+        url = reverse('emergency:hospital_inventory')
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertContains(response, 'data-stock="10"')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stock.units_available = 30
+            self.stock.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'data-stock="30"')
+
+    def test_transparency_page_follows_emergency_requests(self):
+        url = reverse('emergency:transparency_dashboard')
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            emergency_request = EmergencyRequest.objects.create(blood_group='O+', quantity_needed=1)
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            emergency_request.status = 'COMPLETED'
+            emergency_request.save(update_fields=['status'])
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertEqual(response.context['successful_requests'], 1)
+
+    def test_signed_in_users_and_query_strings_bypass_the_cache(self):
+        url = reverse('emergency:transparency_dashboard')
+        self.client.get(url)
+        self.assertNotIn('X-Page-Cache', self.client.get(url, {'ref': 'sms'}))
+
+        staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        self.assertNotIn('X-Page-Cache', self.client.get(url))
+
+    def test_cache_metrics_report_hit_rates(self):
+        for _ in range(4):
+            self.client.get(reverse('emergency:home'))
+        self.client.force_login(User.objects.create_user('staff', password='pw', is_staff=True))
+
+        caches = self.client.get(reverse('emergency:cache_metrics')).json()['caches']
+        self.assertEqual(caches['page:emergency_home'], {'hits': 3, 'misses': 1, 'hit_rate': 75.0})
+        self.assertIsNone(caches['page:transparency']['hit_rate'])
+
+
+class SMSWebhookTestCase(TestCase):
+    def setUp(self):
+        reset_buckets()
+
+    def _post(self, body, sid='SM1'):
+        return self.client.post(reverse('emergency:sms_webhook'), {
+            'Body': body,
+            'From': '+919876543210',
+            'To': '+15005550006',
+            'MessageSid': sid,
+        })
+
+    def test_webhook_acknowledges_and_queues_once(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self._post('HELP')
+            self._post('HELP')  # Twilio retry with the same MessageSid
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b'<Message>', response.content)
+        self.assertEqual(InboundSMS.objects.count(), 1)
+        job = BackgroundJob.objects.get()
+        self.assertEqual(job.ordering_key, 'sms:+919876543210')
+
+    def test_background_processing_replies_and_creates_request(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            self._post('HELP', sid='SM1')
+            self._post('O+ 2 bags', sid='SM2')
+
+        # Both messages, then the outbox dispatch staged by the new request
+        self.assertEqual(run_pending_jobs(), 3)
+        self.assertEqual(
+            list(BackgroundJob.objects.order_by('id').values_list('task', flat=True)),
+            ['emergency.process_inbound_sms', 'emergency.process_inbound_sms', 'emergency.dispatch_outbox']
+        )
+
+        help_sms, request_sms = InboundSMS.objects.order_by('id')
+        self.assertIn('Help', help_sms.reply)
+        self.assertIsNone(help_sms.emergency_request)
+        self.assertEqual(request_sms.status, 'PROCESSED')
+        self.assertTrue(request_sms.reply_sent)
+        self.assertEqual(request_sms.emergency_request.blood_group, 'O+')
+        self.assertEqual(request_sms.emergency_request.idempotency_key, 'sms:SM2')
+
+    def test_failed_search_is_retried_without_a_second_reply(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            self._post('O+ 2 bags', sid='SM3')
+        inbound = InboundSMS.objects.get()
+
+        with mock.patch('emergency.views.search_hospitals_and_notify', return_value=False) as search:
+            with self.assertRaises(RuntimeError):
+                process_inbound_sms(inbound.id)
+        search.assert_called_once()
+
+        with mock.patch('emergency.views.search_hospitals_and_notify', return_value=True) as search:
+            process_inbound_sms(inbound.id)
+        inbound.refresh_from_db()
+        search.assert_called_once_with(inbound.emergency_request_id)
+        self.assertEqual(inbound.status, 'PROCESSED')
+        self.assertEqual(inbound.emergency_request.notifications.filter(channel='sms_reply').count(), 1)
+
+
+@override_settings(RATE_LIMITS={
+    'emergency_request': {'ip': '3/m', 'phone': '2/m'},
+    'quick_request': {'phone': '1/m'},
+    'sms_webhook': {'phone': '1/m'},
+})
+class RateLimitTestCase(TestCase):
+    def setUp(self):
+        reset_buckets()
+        self.addCleanup(reset_buckets)
+
+    def _post(self, phone, urgency='URGENT', ip='10.0.0.1', route='emergency:create_request', **extra):
+        # Invalid payload: admission happens before validation, so nothing is stored
+        return self.client.post(
+            reverse(route),
+            data=json.dumps({'phone': phone, 'urgency': urgency, **extra.pop('data', {})}),
+            content_type='application/json',
+            REMOTE_ADDR=ip,
+            **extra,
+        )
+
+    def test_buckets_per_phone_and_ip(self):
+        self.assertEqual(self._post('9876543210').status_code, 400)
+        self.assertEqual(self._post('+91 98765 43210').status_code, 400)
+
+        limited = self._post('9876543210')
+        self.assertEqual(limited.status_code, 429)
+        self.assertEqual(limited['Retry-After'], '30')
+
+        # Other phones still pass until the IP bucket runs dry
+        self.assertEqual(self._post('9123456780').status_code, 400)
+        self.assertEqual(self._post('9123456781').status_code, 429)
+        self.assertEqual(self._post('9123456781', ip='10.0.0.2').status_code, 400)
+
+    def test_urgency_is_decided_by_the_route(self):
+        self._post('9876543210')
+        self._post('9876543210')
+        # Claiming CRITICAL doesn't unlock a bigger budget on the web form
+        self.assertEqual(self._post('9876543210', urgency='CRITICAL').status_code, 429)
+
+        # Quick requests have a budget of their own
+        self.assertEqual(self._post('9876543210', route='emergency:quick_emergency_request').status_code, 400)
+        self.assertEqual(self._post('9876543210', route='emergency:quick_emergency_request').status_code, 429)
+
+    def test_client_cannot_choose_its_buckets(self):
+        for n in range(3):
+            self._post(f'912345678{n}', HTTP_X_FORWARDED_FOR=f'203.0.113.{n}', data={'session_id': str(n)})
+        # Neither a forged X-Forwarded-For nor a fresh session_id gets a new IP bucket
+        self.assertEqual(
+            self._post('9123456789', HTTP_X_FORWARDED_FOR='203.0.113.9', data={'session_id': '9'}).status_code, 429
+        )
+
+    @override_settings(RATE_LIMIT_TRUSTED_PROXIES=1)
+    def test_trusted_proxy_hop_is_the_client(self):
+        # The proxy appends the address it saw; anything before that is the client's say-so
+        for n in range(3):
+            self._post(f'912345678{n}', HTTP_X_FORWARDED_FOR=f'198.51.100.{n}, 203.0.113.1')
+        self.assertEqual(self._post('9123456789', HTTP_X_FORWARDED_FOR='198.51.100.9, 203.0.113.1').status_code, 429)
+        self.assertEqual(self._post('9123456789', HTTP_X_FORWARDED_FOR='203.0.113.1, 203.0.113.2').status_code, 400)
+
+    def test_limited_sms_webhook_still_answers_twilio(self):
+        def post(body, sid):
+            return self.client.post(reverse('emergency:sms_webhook'), {
+                'Body': body, 'From': '+919876543210', 'To': '+15005550006', 'MessageSid': sid,
+            })
+
+        with self.captureOnCommitCallbacks(execute=False):
+            post('HELP', 'SM1')
+            # The body can't unlock a bigger budget either
+            limited = post('CRITICAL blood needed', 'SM2')
+
+        self.assertEqual(limited.status_code, 200)
+        self.assertEqual(limited['Content-Type'], 'text/xml')
+        self.assertIn('<Response></Response>', limited.content.decode())
+        self.assertEqual(InboundSMS.objects.count(), 1)
+
+    def test_token_bucket_refills(self):
+        buckets = DatabaseBuckets()
+        limits = [('key', 2, 1.0)]
+        self.assertEqual(buckets.consume(limits, now=100), 0)
+        self.assertEqual(buckets.consume(limits, now=100), 0)
+        self.assertAlmostEqual(buckets.consume(limits, now=100.25), 0.75)
+        self.assertEqual(buckets.consume(limits, now=101), 0)
+
+    def test_rejection_draws_from_no_bucket(self):
+        buckets = DatabaseBuckets()
+        limits = [('phone', 5, 1.0), ('ip', 1, 1.0)]
+        self.assertEqual(buckets.consume(limits, now=100), 0)
+        self.assertAlmostEqual(buckets.consume(limits, now=100), 1.0)
+        self.assertEqual(RateLimitBucket.objects.get(key='phone').tokens, 4)
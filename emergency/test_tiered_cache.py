@@ -0,0 +1,120 @@
+"""
+Tests for the two-tier lookup cache
+"""
+
+import threading
+import time
+from unittest import mock
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase, override_settings
+from .location_utils import LocationService
+from .tiered_cache import _locals
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared-test'},
+    'lookups': {
+        'BACKEND': 'emergency.tiered_cache.TieredCache',
+        'LOCATION': 'lookups-test',
+        'OPTIONS': {'SHARED': 'shared', 'MAX_ENTRIES': 2, 'TIMEOUTS': {'geocode': 86400}},
+    },
+}
+
+
+def restart_worker():
+    """Drop this process's local tier, as a restarted or different worker would start"""
+    _locals['lookups-test'].clear()
+
+
+@override_settings(CACHES=TEST_CACHES, GOOGLE_MAPS_API_KEY='test-key')
+class TieredCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.cache = caches['lookups']
+        self.cache.clear()
+        self.cache._stats.clear()
+
+    def test_values_are_shared_between_workers(self):
+        self.cache.set('geocode:a', (19.0, 72.8))
+        restart_worker()
+
+        self.assertEqual(self.cache.get('geocode:a'), (19.0, 72.8))  # From the shared tier
+        self.assertEqual(self.cache.get('geocode:a'), (19.0, 72.8))  # From process memory
+        self.assertIsNone(self.cache.get('geocode:b'))
+        self.assertEqual(self.cache.stats()['geocode'], {
+            'local_hits': 1, 'shared_hits': 1, 'misses': 1, 'hit_rate': 66.7,
+        })
+
+    def test_local_tier_is_bounded(self):
+        for key in ('geocode:a', 'geocode:b', 'geocode:c'):
+            self.cache.set(key, key)
+        self.assertEqual(len(_locals['lookups-test']._data), 2)
+        self.assertEqual(self.cache.get('geocode:a'), 'geocode:a')  # Evicted locally, still shared
+
+    def test_namespace_timeouts(self):
+        with mock.patch.object(LocMemCache, 'set', autospec=True) as shared_set:
+            self.cache.set('geocode:a', 1)
+            self.cache.set('other:a', 1)
+        self.assertEqual(shared_set.call_args_list[0].args[3], 86400)
+        self.assertEqual(shared_set.call_args_list[1].args[3], 300)
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def slow_lookup():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'Parel, Mumbai'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(caches['lookups'].get_or_set('reverse-geocode:x', slow_lookup)))
+            for _ in range(6)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['Parel, Mumbai'] * 6)
+        self.assertIsNone(caches['shared'].get('reverse-geocode:x:lock'))
+
+    @mock.patch('emergency.location_utils.requests.get')
+    def test_geocoding_is_reused_across_workers_but_failures_are_retried(self, get):
+        get.return_value.status_code = 200
+        get.return_value.json.return_value = {'status': 'ZERO_RESULTS', 'results': []}
+        self.assertEqual(LocationService().geocode_address('Parel, Mumbai'), (None, None))
+        self.assertEqual(LocationService().geocode_address('Parel, Mumbai'), (None, None))
+        self.assertEqual(get.call_count, 2)
+
+        get.return_value.json.return_value = {
+            'status': 'OK', 'results': [{'geometry': {'location': {'lat': 19.0, 'lng': 72.84}}}],
+        }
+        self.assertEqual(LocationService().geocode_address('Parel, Mumbai'), (19.0, 72.84))
+        restart_worker()
+        self.assertEqual(LocationService().geocode_address(' parel, mumbai'), (19.0, 72.84))
+        self.assertEqual(get.call_count, 3)
+
+    def test_add_and_touch_survive_a_shared_outage(self):
+        with mock.patch.object(LocMemCache, 'add', side_effect=ConnectionError), \
+                mock.patch.object(LocMemCache, 'touch', side_effect=ConnectionError):
+            self.assertTrue(self.cache.add('geocode:a', 1))
+            self.assertFalse(self.cache.add('geocode:a', 2))  # Still held locally
+            self.assertEqual(self.cache.get('geocode:a'), 1)
+            self.assertFalse(self.cache.touch('geocode:a'))
+
+    def test_waiting_on_another_process_does_not_hold_the_stripe(self):
+        caches['shared'].add('reverse-geocode:x:lock', 1)  # Held by another process
+        stripe = self.cache._locks[hash(self.cache.make_and_validate_key('reverse-geocode:x')) % len(self.cache._locks)]
+        waiter = threading.Thread(target=lambda: self.cache.get_or_set('reverse-geocode:x', lambda: 'computed'))
+        with mock.patch.object(self.cache, '_lock_wait', 0.5):
+            waiter.start()
+            time.sleep(0.2)
+            acquired = stripe.acquire(timeout=0.1)
+            if acquired:
+                stripe.release()
+            caches['shared'].set('reverse-geocode:x', 'Parel, Mumbai')
+            waiter.join()
+        self.assertTrue(acquired)
+        self.assertEqual(self.cache.get('reverse-geocode:x'), 'Parel, Mumbai')
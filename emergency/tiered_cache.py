@@ -0,0 +1,250 @@
+"""
+Two-tier cache backend
+A small in-process LRU sits in front of a shared cache (Redis, or a file-based
+cache on a single host). Reads hit process memory first and fall back to the
+shared tier, so a value computed by one worker is reused by the others and
+survives restarts, while hot keys cost no network round trip. Local copies are
+kept for at most LOCAL_TIMEOUT seconds, which bounds how long a worker can see
+a value another worker has deleted or replaced.
+
+Keys are namespaced as "<namespace>:<rest>" and take their timeout from the
+TIMEOUTS option when none is given. get_or_set() is single-flight: concurrent
+misses for a key - threads in a process, or processes sharing the tier -
+compute it once. Hits and misses are counted per namespace in each process.
+
+Processes coordinate through the shared tier's add(), which is atomic on
+Redis but not on FileBasedCache: two processes can both take the lock there
+and compute the same value once each. That only repeats a lookup, so the
+file-based tier is kept for single-host deploys without Redis.
+
+    CACHES['lookups'] = {
+        'BACKEND': 'emergency.tiered_cache.TieredCache',
+        'LOCATION': 'lookups',
+        'OPTIONS': {'SHARED': 'shared', 'MAX_ENTRIES': 1000, 'LOCAL_TIMEOUT': 300,
+                    'TIMEOUTS': {'geocode': 86400}},
+    }
+"""
+
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LocalLRU:
+    """Thread-safe bounded LRU of pickled values with per-entry expiry"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, pickled = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def set(self, key, value, seconds):
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._data[key] = (time.monotonic() + seconds, pickled)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Django builds a backend instance per thread; the LRU, stats and key locks are
+# per process, keyed by LOCATION like LocMemCache's stores
+_locals = {}
+_stats = {}
+_key_locks = {}
+_setup_lock = threading.Lock()
+
+LOCK_STRIPES = 64
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._name = location or 'tiered'
+        self._shared_alias = options.get('SHARED', 'default')
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 300)
+        self._timeouts = options.get('TIMEOUTS', {})
+        self._lock_timeout = options.get('LOCK_TIMEOUT', 30)
+        self._lock_wait = options.get('LOCK_WAIT', 10)
+        with _setup_lock:
+            self._local = _locals.setdefault(self._name, LocalLRU(options.get('MAX_ENTRIES', 1000)))
+            self._stats = _stats.setdefault(self._name, {})
+            self._locks = _key_locks.setdefault(self._name, [threading.Lock() for _ in range(LOCK_STRIPES)])
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    @staticmethod
+    def namespace(key):
+        return str(key).split(':', 1)[0]
+
+    def _count(self, key, outcome):
+        counts = self._stats.setdefault(self.namespace(key), {'local_hits': 0, 'shared_hits': 0, 'misses': 0})
+        counts[outcome] += 1  # Approximate under threads, which is fine for monitoring
+
+    def _timeout(self, key, timeout):
+        # The namespace's configured TTL stands in for the default
+        if timeout is DEFAULT_TIMEOUT:
+            return self._timeouts.get(self.namespace(key), self.default_timeout)
+        return timeout
+
+    def _local_seconds(self, timeout):
+        return self._local_timeout if timeout is None else min(timeout, self._local_timeout)
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self._local.get(local_key)
+        if value is not _MISSING:
+            self._count(key, 'local_hits')
+            return value
+
+        try:
+            value = self.shared.get(key, _MISSING, version=version)
+        except Exception as e:
+            logger.warning(f"Shared cache unavailable reading {self.namespace(key)}: {e}")
+            value = _MISSING
+        if value is _MISSING:
+            self._count(key, 'misses')
+            return default
+        self._count(key, 'shared_hits')
+        self._local.set(local_key, value, self._local_timeout)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        timeout = self._timeout(key, timeout)
+        if timeout is not None and timeout <= 0:
+            self.delete(key, version=version)
+            return
+        try:
+            self.shared.set(key, value, timeout, version=version)
+        except Exception as e:
+            logger.warning(f"Shared cache unavailable writing {self.namespace(key)}, keeping it local: {e}")
+        self._local.set(local_key, value, self._local_seconds(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        timeout = self._timeout(key, timeout)
+        try:
+            added = self.shared.add(key, value, timeout, version=version)
+        except Exception as e:
+            logger.warning(f"Shared cache unavailable adding {self.namespace(key)}, keeping it local: {e}")
+            added = self._local.get(local_key) is _MISSING
+        if not added:
+            return False
+        if timeout is None or timeout > 0:
+            self._local.set(local_key, value, self._local_seconds(timeout))
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local.delete(self.make_and_validate_key(key, version=version))
+        try:
+            return self.shared.touch(key, self._timeout(key, timeout), version=version)
+        except Exception as e:
+            logger.warning(f"Shared cache unavailable touching {self.namespace(key)}: {e}")
+            return False
+
+    def delete(self, key, version=None):
+        deleted = self._local.delete(self.make_and_validate_key(key, version=version))
+        try:
+            return self.shared.delete(key, version=version) or deleted
+        except Exception as e:
+            logger.warning(f"Shared cache unavailable deleting {self.namespace(key)}: {e}")
+            return deleted
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def clear(self):
+        self._local.clear()
+        self.shared.clear()
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Cached value for key, or default() computed by a single caller and cached
+        Callers in this process wait on a key lock; other processes poll for the
+        one holding the shared tier's lock, without holding the key lock, so keys
+        sharing its stripe aren't held up. None results are not cached, so a
+        failed lookup is tried again next time
+        """
+        value = self.get(key, _MISSING, version=version)
+        if value is not _MISSING:
+            return value
+        if not callable(default):
+            self.add(key, default, timeout, version=version)
+            return self.get(key, default, version=version)
+
+        stripe = self._locks[hash(self.make_and_validate_key(key, version=version)) % LOCK_STRIPES]
+        with stripe:
+            value = self._local.get(self.make_and_validate_key(key, version=version))
+            if value is not _MISSING:
+                return value  # Computed by another thread while we waited
+
+            lock_key = f"{key}:lock"
+            try:
+                locked = self.shared.add(lock_key, 1, self._lock_timeout, version=version)
+            except Exception as e:
+                logger.warning(f"Shared cache unavailable locking {self.namespace(key)}: {e}")
+                locked = True  # Compute here; there is no tier to coordinate through
+            if locked:
+                try:
+                    return self._compute(key, default, timeout, version)
+                finally:
+                    try:
+                        self.shared.delete(lock_key, version=version)
+                    except Exception:
+                        pass
+
+        deadline = time.monotonic() + self._lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = self.get(key, _MISSING, version=version)
+            if value is not _MISSING:
+                return value
+        logger.warning(f"Timed out waiting for {self.namespace(key)} to be computed elsewhere, computing it here")
+        return self._compute(key, default, timeout, version)
+
+    def _compute(self, key, default, timeout, version):
+        value = default()
+        if value is not None:
+            self.set(key, value, timeout, version=version)
+        return value
+
+    def stats(self):
+        """{namespace: {'local_hits', 'shared_hits', 'misses', 'hit_rate'}} for this process"""
+        report = {}
+        for namespace, counts in list(self._stats.items()):
+            hits = counts['local_hits'] + counts['shared_hits']
+            total = hits + counts['misses']
+            report[namespace] = {**counts, 'hit_rate': round(hits / total * 100, 1) if total else None}
+        return report
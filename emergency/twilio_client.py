@@ -0,0 +1,106 @@
+"""
+Shared Twilio client for the Emergency Blood Bank System
+One process-wide client over a pooled keep-alive HTTPS session, so sends
+reuse warm connections instead of paying a TLS handshake per message
+"""
+
+import logging
+import threading
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TWILIO_API_URL = 'https://api.twilio.com'
+
+_client = None
+_client_credentials = None
+_client_lock = threading.Lock()
+
+
+def twilio_configured():
+    """Check whether Twilio credentials are present in settings"""
+    return bool(
+        getattr(settings, 'TWILIO_ACCOUNT_SID', '') and
+        getattr(settings, 'TWILIO_AUTH_TOKEN', '')
+    )
+
+
+def _build_http_client():
+    """Create a Twilio HTTP client backed by a pooled requests session"""
+    from requests.adapters import HTTPAdapter
+    from twilio.http.http_client import TwilioHttpClient
+
+    http_client = TwilioHttpClient(pool_connections=True)
+
+    adapter = HTTPAdapter(
+        pool_connections=1,  # Only ever talks to api.twilio.com
+        pool_maxsize=getattr(settings, 'TWILIO_HTTP_POOL_SIZE', 10),
+        max_retries=getattr(settings, 'TWILIO_HTTP_MAX_RETRIES', 1),
+    )
+    http_client.session.mount('https://', adapter)
+
+    # requests takes a (connect, read) tuple; set after construction since
+    # TwilioHttpClient only validates scalar timeouts
+    http_client.timeout = (
+        getattr(settings, 'TWILIO_CONNECT_TIMEOUT', 3.05),
+        getattr(settings, 'TWILIO_READ_TIMEOUT', 10),
+    )
+    return http_client
+
+
+def get_twilio_client():
+    """
+    Get the process-wide Twilio client
+    Returns None if Twilio is not configured or the library is missing
+    """
+    global _client, _client_credentials
+
+    if not twilio_configured():
+        return None
+
+    credentials = (settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+    if _client is not None and _client_credentials == credentials:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_credentials != credentials:
+            try:
+                from twilio.rest import Client
+            except ImportError:
+                logger.warning("Twilio library not installed")
+                return None
+
+            _client = Client(*credentials, http_client=_build_http_client())
+            _client_credentials = credentials
+    return _client
+
+
+def warm_twilio_client():
+    """Open the pooled connection to Twilio ahead of the first send"""
+    client = get_twilio_client()
+    if client is None:
+        return False
+
+    try:
+        http_client = client.http_client
+        http_client.session.head(TWILIO_API_URL, timeout=http_client.timeout)
+        logger.info("Twilio connection pool warmed")
+        return True
+    except Exception as e:
+        logger.warning(f"Could not warm Twilio connection: {e}")
+        return False
+
+
+def warm_twilio_client_async():
+    """Warm the client on a daemon thread so worker start-up is not delayed"""
+    if not getattr(settings, 'TWILIO_WARM_ON_START', True) or not twilio_configured():
+        return
+    threading.Thread(target=warm_twilio_client, name='twilio-warmup', daemon=True).start()
+
+
+def reset_twilio_client():
+    """Drop the cached client (e.g. after rotating credentials)"""
+    global _client, _client_credentials
+    with _client_lock:
+        _client = None
+        _client_credentials = None
@@ -26,6 +26,8 @@ urlpatterns = [
     
     # Analytics and Reports
     path('analytics/', views.emergency_analytics, name='analytics'),
+    path('api/queue-metrics/', views.job_queue_metrics, name='queue_metrics'),
+    path('api/cache-metrics/', views.cache_metrics, name='cache_metrics'),
     
     # Stakeholder Features
     path('stakeholder-dashboard/', stakeholder_views.hospital_dashboard, name='stakeholder_dashboard'),
@@ -0,0 +1,100 @@
+"""
+Version counters for cheap conditional GETs
+Writers bump a counter whenever the data behind an endpoint changes, and the
+endpoint derives its ETag from the counters - so an unchanged poll costs one
+cache read and never touches the ORM
+"""
+
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.text import slugify
+
+logger = logging.getLogger(__name__)
+
+INVENTORY = 'inventory'
+HOSPITALS = 'hospitals'
+EMERGENCY_REQUESTS = 'emergency-requests'  # any emergency request created, changed or deleted
+BLOOD_BANK = 'blood-bank'  # blood bank stock, requests, donations and dashboard counts
+
+
+def city_key(city):
+    return f"inventory:city:{slugify(city)}"
+
+
+def request_key(request_id):
+    return f"request:{str(request_id).replace('-', '')}"
+
+
+def _cache_key(name):
+    return f"version:{name}"
+
+
+def _timeout(name):
+    # One counter per emergency request would pile up forever without a TTL; one
+    # that expires is re-seeded above its old value, so stale ETags still miss
+    if name.startswith('request:'):
+        return getattr(settings, 'REQUEST_VERSION_TTL_SECONDS', 86400)
+    return None
+
+
+def _seed():
+    # Millisecond clock: a counter recreated after eviction or a cache restart
+    # starts above any value handed out before, so old ETags never match again
+    return int(time.time() * 1000)
+
+
+def get_versions(*names):
+    """Current versions for the given counters, creating any that are missing"""
+    keys = [_cache_key(name) for name in names]
+    found = cache.get_many(keys)
+    versions = []
+    for name, key in zip(names, keys):
+        if key not in found:
+            cache.add(key, _seed(), timeout=_timeout(name))
+            found[key] = cache.get(key)
+        versions.append(found[key])
+    return versions
+
+
+def _bump_now(names):
+    for name in names:
+        key = _cache_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _seed(), timeout=_timeout(name))
+        except Exception as e:
+            logger.error(f"Could not bump version counter {name}: {e}")
+
+
+def bump_version(*names):
+    """
+    Advance counters once the surrounding transaction commits
+    Bumping earlier would let a concurrent poll cache pre-commit data under the new ETag
+    """
+    transaction.on_commit(lambda: _bump_now(names))
+
+
+def bump_inventory(*cities):
+    """Record an inventory change - globally and for the cities it touched"""
+    names = [INVENTORY]
+    names += [city_key(city) for city in dict.fromkeys(cities) if city]
+    bump_version(*names)
+
+
+def make_etag(prefix, *names):
+    """
+    ETag built from version counters, or None when conditional GETs are off
+    (counters in a per-process cache can't see writes made by other workers)
+    """
+    if not getattr(settings, 'CONDITIONAL_GET_ENABLED', False):
+        return None
+    try:
+        versions = get_versions(*names)
+    except Exception as e:
+        logger.warning(f"Version counters unavailable, serving without ETag: {e}")
+        return None
+    return f"{prefix}-" + '-'.join(str(version) for version in versions)
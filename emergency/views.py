@@ -1,17 +1,46 @@
 from django.shortcuts import render
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
+from django.views.decorators.cache import cache_control
 from django.utils import timezone
 from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max, Prefetch
 import json
 import logging
 from .models import EmergencyRequest, EmergencyHospital, EmergencyBloodStock, EmergencyNotification
 from .services import NotificationService, LocationService
-from .admin_notifier import send_admin_notification
+from .admin_notifier import queue_admin_notification
+from .tasks import enqueue_emergency_request
+from .jobs import queue_metrics
+from .cache_stats import hit_rates
+from .inventory import (
+    BLOOD_TYPES, get_inventory_snapshot, hospitals_by_distance, inventory_versions, page_hospitals, stock_level
+)
+from .intake import (
+    create_request_once, duplicate_request_response, find_duplicate_request,
+    get_request_idempotency_key, normalize_phone
+)
+from .ratelimit import rate_limit
+from .outbox import stage_notification
+from .page_cache import cache_anonymous_page
+from .location_utils import DistanceCalculator
+from .serialization import HOSPITAL_ROW_FIELDS, FastJsonResponse, HospitalRow, km
+from .versions import HOSPITALS, INVENTORY, get_versions, make_etag, request_key
 
 logger = logging.getLogger(__name__)
 
+# Urgency of requests from the web form; clients don't get to choose it
+WEB_REQUEST_URGENCY = 'URGENT'
+
+
+def _web_request_urgency(request, data):
+    return WEB_REQUEST_URGENCY
+
+
+@cache_anonymous_page('emergency_home')
 def emergency_home(request):
     """Emergency homepage with simple request interface"""
     blood_groups = EmergencyRequest.BLOOD_GROUPS
@@ -25,6 +54,7 @@ def emergency_home(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('emergency_request', urgency=_web_request_urgency)
 def create_emergency_request(request):
     """Create emergency request - simple version"""
     try:
@@ -73,15 +103,13 @@ def create_emergency_request(request):
             }, status=400)
         
         # Clean up phone number format
-        import re
-        phone_clean = re.sub(r'[^0-9+]', '', contact_phone)
-        if not phone_clean.startswith('+'):
-            if phone_clean.startswith('91') and len(phone_clean) == 12:
-                phone_clean = '+' + phone_clean
-            elif len(phone_clean) == 10:
-                phone_clean = '+91' + phone_clean
+        contact_phone = normalize_phone(contact_phone)
         
-        contact_phone = phone_clean
+        # Retries and repeat submissions attach to the request already in progress
+        idempotency_key = get_request_idempotency_key(request)
+        existing_request = find_duplicate_request(contact_phone, blood_group, idempotency_key)
+        if existing_request:
+            return duplicate_request_response(existing_request)
         
         # Get client info for tracking
         ip_address = get_client_ip(request)
@@ -89,7 +117,8 @@ def create_emergency_request(request):
         session_key = request.session.session_key or ''
         
         # Create emergency request
-        emergency_request = EmergencyRequest.objects.create(
+        emergency_request, created = create_request_once(
+            idempotency_key=idempotency_key,
             blood_group=blood_group,
             quantity_needed=quantity,
             user_latitude=user_lat,
@@ -98,10 +127,13 @@ def create_emergency_request(request):
             contact_phone=contact_phone,
             contact_email=contact_email,
             contact_name=contact_name,
+            urgency=WEB_REQUEST_URGENCY,
             ip_address=ip_address,
             user_agent=user_agent,
             session_id=session_key,
         )
+        if not created:
+            return duplicate_request_response(emergency_request)
         
         # Immediate response for user
         response_data = {
@@ -111,14 +143,14 @@ def create_emergency_request(request):
             'status': 'searching'
         }
         
-        # Search for hospitals immediately
+        # Search for hospitals in the background; progress is polled via check_request_status
         try:
-            search_hospitals_and_notify(emergency_request.id)
-            response_data['hospitals_searched'] = True
+            enqueue_emergency_request(emergency_request.id, emergency_request.urgency)
+            response_data['queued'] = True
         except Exception as e:
-            logger.error(f"Error searching hospitals: {e}")
-            response_data['hospitals_searched'] = False
-            response_data['error'] = 'Could not search hospitals immediately'
+            logger.error(f"Error queueing hospital search: {e}")
+            response_data['queued'] = False
+            response_data['error'] = 'Could not start hospital search immediately'
         
         return JsonResponse(response_data)
         
@@ -138,73 +170,51 @@ def search_hospitals_and_notify(request_id):
     """Search hospitals and send notifications - simple version"""
     try:
         emergency_request = EmergencyRequest.objects.get(id=request_id)
-        emergency_request.status = 'SEARCHING'
-        emergency_request.save()
+        # FOUND means the notifications are already staged and on their way
+        if emergency_request.status in ('FOUND', 'NOTIFIED', 'COMPLETED'):
+            logger.info(f"Emergency request {emergency_request.request_id} already {emergency_request.status}, skipping")
+            return True
+        emergency_request.transition_to('SEARCHING')
         
         # Find nearby hospitals
         hospitals = emergency_request.get_nearby_hospitals()
         
-        if hospitals:
-            # Update status and associate hospitals
-            emergency_request.status = 'FOUND'
-            emergency_request.hospitals_found.set(hospitals)
-            emergency_request.save()
-            
-            # Send notifications
-            notification_service = NotificationService()
-            
-            # Send admin notification FIRST (to +919076316961)
-            admin_notified = send_admin_notification(emergency_request, hospitals)
-            
-            # Send SMS if phone provided
-            if emergency_request.contact_phone:
-                sms_sent = notification_service.send_emergency_sms(emergency_request, hospitals)
-                emergency_request.sms_sent = sms_sent
-            
-            # Send Email if email provided
-            if emergency_request.contact_email:
-                email_sent = notification_service.send_emergency_email(emergency_request, hospitals)
-                emergency_request.email_sent = email_sent
-            
-            emergency_request.notification_sent = True
-            emergency_request.status = 'NOTIFIED'
-            emergency_request.save()
-            
-            # Reserve stock from first hospital
-            try:
-                stock = EmergencyBloodStock.objects.get(
-                    hospital=hospitals[0], 
-                    blood_group=emergency_request.blood_group
-                )
-                if stock.units_available >= emergency_request.quantity_needed:
-                    stock.units_available -= emergency_request.quantity_needed
-                    stock.save()
-                    logger.info(f"Reserved {emergency_request.quantity_needed} bags from {hospitals[0].name}")
-            except EmergencyBloodStock.DoesNotExist:
-                logger.warning(f"Stock not found for {emergency_request.blood_group} at {hospitals[0].name}")
+        notification_service = NotificationService()
         
-        else:
-            # No hospitals found
-            emergency_request.status = 'FAILED'
-            emergency_request.save()
-            
-            # Send admin notification even when no hospitals found
-            admin_notified = send_admin_notification(emergency_request, [])
+        # Outcome, stock reservation and the outgoing notifications commit together;
+        # the outbox dispatcher sends the notifications once this is durable, and
+        # moves the request on to NOTIFIED when the requester's message goes out
+        with transaction.atomic():
+            staged = []
+            if hospitals:
+                emergency_request.hospitals_found.set(hospitals)
+                fields = emergency_request.transition_to('FOUND', save=False)
+                
+                # Patient SMS is staged first so it is sent ahead of the other channels
+                if emergency_request.contact_phone:
+                    staged.append(notification_service.queue_emergency_sms(emergency_request, hospitals))
+                staged.append(queue_admin_notification(emergency_request, hospitals))
+                if emergency_request.contact_email:
+                    staged.append(notification_service.queue_emergency_email(emergency_request, hospitals))
+                
+                _reserve_stock(emergency_request, hospitals[0])
+            else:
+                # No hospitals found
+                fields = emergency_request.transition_to('FAILED', save=False)
+                
+                # Send "no hospitals" notification
+                if emergency_request.contact_phone:
+                    message = f"No hospitals found with {emergency_request.blood_group} blood. Please contact nearby hospitals directly. Request ID: {emergency_request.request_id}"
+                    staged.append(stage_notification(emergency_request, 'sms', 'SMS', emergency_request.contact_phone, message))
+                
+                # Send admin notification even when no hospitals found
+                staged.append(queue_admin_notification(emergency_request, []))
             
-            # Send "no hospitals" notification
-            notification_service = NotificationService()
-            if emergency_request.contact_phone:
-                message = f"No hospitals found with {emergency_request.blood_group} blood. Please contact nearby hospitals directly. Request ID: {emergency_request.request_id}"
-                try:
-                    from twilio.rest import Client
-                    client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-                    client.messages.create(
-                        body=message,
-                        from_=settings.TWILIO_PHONE_NUMBER,
-                        to=emergency_request.contact_phone
-                    )
-                except:
-                    pass
+            emergency_request.notification_sent = bool(hospitals)
+            emergency_request.notification_results = {
+                notification.channel: {'outcome': 'queued'} for notification in staged if notification
+            }
+            emergency_request.save(update_fields=list(dict.fromkeys(fields + ['notification_sent', 'notification_results'])))
         
         return True
         
@@ -212,32 +222,62 @@ def search_hospitals_and_notify(request_id):
         logger.error(f"Error in search_hospitals_and_notify: {e}")
         return False
 
+def _reserve_stock(emergency_request, hospital):
+    """Reserve stock from the nearest hospital; call inside a transaction"""
+    stock = EmergencyBloodStock.objects.select_for_update().filter(
+        hospital=hospital,
+        blood_group=emergency_request.blood_group
+    ).first()
+    if stock is None:
+        logger.warning(f"Stock not found for {emergency_request.blood_group} at {hospital.name}")
+        return
+    
+    if stock.units_available >= emergency_request.quantity_needed:
+        stock.units_available -= emergency_request.quantity_needed
+        stock.save(update_fields=['units_available', 'last_updated'])
+        logger.info(f"Reserved {emergency_request.quantity_needed} bags from {hospital.name}")
+
+def request_status_etag(request, request_id):
+    return make_etag('request', request_key(request_id), HOSPITALS)
+
+def inventory_page_etag(request):
+    # Update times are rendered relative in the browser, so the page only changes with the data
+    return make_etag('inventory-page', INVENTORY, HOSPITALS)
+
+def inventory_etag(request):
+    city_filter = request.GET.get('city', '').strip()
+    try:
+        names = inventory_versions(city_filter)
+    except Exception as e:
+        logger.warning(f"Version counters unavailable, serving inventory without ETag: {e}")
+        return None
+    return make_etag('inventory', *names)
+
+# Pollers revalidate every time and get a 304 until the version counters move
+@cache_control(no_cache=True)
+@condition(etag_func=request_status_etag)
 def check_request_status(request, request_id):
     """Check the status of an emergency request"""
     try:
         emergency_request = EmergencyRequest.objects.get(request_id=request_id)
         
         hospitals_data = []
-        for hospital in emergency_request.hospitals_found.all():
+        for *values, latitude, longitude in emergency_request.hospitals_found.values_list(
+            *HOSPITAL_ROW_FIELDS, 'latitude', 'longitude'
+        ):
             # Calculate distance if coordinates available
-            distance = 0
+            distance = None
             if emergency_request.user_latitude and emergency_request.user_longitude:
-                distance = hospital.calculate_distance(
-                    float(emergency_request.user_latitude),
-                    float(emergency_request.user_longitude)
+                distance = DistanceCalculator.haversine_distance(
+                    float(latitude), float(longitude),
+                    float(emergency_request.user_latitude), float(emergency_request.user_longitude)
                 )
-            
-            hospitals_data.append({
-                'name': hospital.name,
-                'address': hospital.address,
-                'phone': hospital.phone,
-                'emergency_phone': hospital.emergency_phone,
-                'distance': f"{distance:.1f}" if distance else "N/A"
-            })
+            hospitals_data.append(HospitalRow(*values, distance=km(distance)))
         
-        return JsonResponse({
+        return FastJsonResponse({
             'success': True,
             'status': emergency_request.status,
+            'in_progress': emergency_request.status in ('PENDING', 'SEARCHING', 'FOUND'),
             'hospitals': hospitals_data,
             'blood_group': emergency_request.blood_group,
             'quantity': emergency_request.quantity_needed,
@@ -256,60 +296,33 @@ def check_request_status(request, request_id):
             'error': 'Request not found or error occurred'
         }, status=404)
 
+@cache_control(no_cache=True)
+@condition(etag_func=inventory_page_etag)
+@cache_anonymous_page('hospital_inventory', versions=(INVENTORY, HOSPITALS))
 def public_hospital_inventory(request):
     """Public hospital inventory dashboard"""
-    hospitals = EmergencyHospital.objects.filter(is_active=True).prefetch_related('hospital_blood_stock')
+    # Two queries whatever the number of hospitals: the hospitals with their
+    # latest stock update annotated, and their stock rows
+    hospitals = EmergencyHospital.objects.filter(is_active=True).annotate(
+        stock_updated=Max('hospital_blood_stock__last_updated')
+    ).prefetch_related(
+        Prefetch('hospital_blood_stock', queryset=EmergencyBloodStock.objects.only('hospital_id', 'blood_group', 'units_available'))
+    )
     
     hospitals_data = []
-    total_inventory = {'A+': 0, 'A-': 0, 'B+': 0, 'B-': 0, 'AB+': 0, 'AB-': 0, 'O+': 0, 'O-': 0}
+    total_inventory = dict.fromkeys(BLOOD_TYPES, 0)
     
     for hospital in hospitals:
-        hospital_inventory = {}
-        hospital_inventory_display = {}  # For display purposes
-        hospital_inventory_status = {}   # For status classes
-        
-        # Initialize all blood types
-        for blood_type in total_inventory.keys():
-            hospital_inventory[blood_type] = 0
-            hospital_inventory_display[blood_type] = '0'
-            hospital_inventory_status[blood_type] = 'empty'
-        
+        hospital_inventory = dict.fromkeys(BLOOD_TYPES, 0)
         for stock in hospital.hospital_blood_stock.all():
-            units = stock.units_available
-            hospital_inventory[stock.blood_group] = units
-            total_inventory[stock.blood_group] += units
-            
-            # Special handling for O- blood type
-            if stock.blood_group == 'O-' and units > 0 and units < 10:
-                hospital_inventory_display[stock.blood_group] = 'less'
-                hospital_inventory_status[stock.blood_group] = 'low'
-            else:
-                hospital_inventory_display[stock.blood_group] = str(units)
-                
-                # Determine status based on units
-                if units == 0:
-                    hospital_inventory_status[stock.blood_group] = 'empty'
-                elif units <= 5:
-                    hospital_inventory_status[stock.blood_group] = 'critical'
-                elif units <= 15:
-                    hospital_inventory_status[stock.blood_group] = 'low'
-                else:
-                    hospital_inventory_status[stock.blood_group] = 'available'
-        
-        # Get last updated time from any stock record
-        last_updated = None
-        if hospital.hospital_blood_stock.exists():
-            last_updated = hospital.hospital_blood_stock.latest('last_updated').last_updated
-        
-        # Create template-friendly blood type list
+            hospital_inventory[stock.blood_group] = stock.units_available
+            total_inventory[stock.blood_group] += stock.units_available
+        
+        # Template-friendly blood type list
         blood_types_data = []
-        for blood_type in ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']:
-            blood_types_data.append({
-                'type': blood_type,
-                'count': hospital_inventory.get(blood_type, 0),
-                'display': hospital_inventory_display.get(blood_type, '0'),
-                'status': hospital_inventory_status.get(blood_type, 'empty')
-            })
+        for blood_type, units in hospital_inventory.items():
+            display, status = stock_level(blood_type, units)
+            blood_types_data.append({'type': blood_type, 'count': units, 'display': display, 'status': status})
         
         hospitals_data.append({
             'id': hospital.id,
@@ -320,21 +333,28 @@ def public_hospital_inventory(request):
             'emergency_phone': hospital.emergency_phone,
             'operates_24x7': hospital.operates_24x7,
             'inventory': hospital_inventory,
-            'inventory_display': hospital_inventory_display,
-            'inventory_status': hospital_inventory_status,
+            'inventory_display': {data['type']: data['display'] for data in blood_types_data},
+            'inventory_status': {data['type']: data['status'] for data in blood_types_data},
             'blood_types': blood_types_data,
             'total_units': sum(hospital_inventory.values()),
-            'last_updated': last_updated,
+            'last_updated': hospital.stock_updated,
+            'updated_at': hospital.updated_at,
         })
     
     # Create template-friendly total inventory list
     total_inventory_list = []
-    for blood_type in ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']:
+    for blood_type in BLOOD_TYPES:
         total_inventory_list.append({
             'type': blood_type,
             'total': total_inventory.get(blood_type, 0)
         })
     
+    try:
+        inventory_version, = get_versions(INVENTORY)
+    except Exception as e:
+        logger.warning(f"Version counters unavailable, hospital cards rendered uncached: {e}")
+        inventory_version = None
+    
     context = {
         'hospitals': hospitals_data,
         'total_inventory': total_inventory,
@@ -344,7 +364,10 @@ def public_hospital_inventory(request):
         'a_positive_count': total_inventory.get('A+', 0),
         'o_positive_count': total_inventory.get('O+', 0),
         'page_title': 'Hospital Blood Inventory',
-        'last_updated': timezone.now(),
+        'last_updated': max((data['last_updated'] for data in hospitals_data if data['last_updated']), default=None),
+        # Hospital cards are cached per inventory version (0 disables it)
+        'inventory_version': inventory_version,
+        'card_cache_seconds': getattr(settings, 'INVENTORY_CACHE_SECONDS', 300) if inventory_version else 0,
     }
     
     return render(request, 'emergency/hospital_inventory.html', context)
@@ -377,6 +400,24 @@ def emergency_analytics(request):
         }
     })
 
+@staff_member_required
+def job_queue_metrics(request):
+    """Queue depth and wait time per priority for monitoring"""
+    return JsonResponse({
+        'success': True,
+        'priorities': queue_metrics(),
+    })
+
+@staff_member_required
+def cache_metrics(request):
+    """Hit rates of the page, snapshot and lookup caches for monitoring"""
+    return JsonResponse({
+        'success': True,
+        'caches': hit_rates(),
+        # Counted in each process, so this is the worker that served the request
+        'lookups': caches['lookups'].stats(),
+    })
+
 @staff_member_required
 def emergency_admin_dashboard(request):
     """Admin dashboard for emergency module"""
@@ -419,7 +460,7 @@ def api_find_nearby_hospitals(request):
             latitude, longitude, blood_group
         )
 
-        return JsonResponse({
+        return FastJsonResponse({
             'success': True,
             'hospitals': nearby_hospitals_data
         })
@@ -438,6 +479,8 @@ def api_find_nearby_hospitals(request):
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@cache_control(no_cache=True)
+@condition(etag_func=inventory_etag)
 def api_live_inventory(request):
     """Enhanced API endpoint for location-based and hospital-wise blood inventory"""
     try:
@@ -447,76 +490,30 @@ def api_live_inventory(request):
         user_lng = request.GET.get('longitude')
         show_hospitals = request.GET.get('show_hospitals', 'true').lower() == 'true'
         
-        # Get all active hospitals with their blood stock
-        hospitals_query = EmergencyHospital.objects.filter(is_active=True).prefetch_related('hospital_blood_stock')
-        
-        # Apply city filter if specified
-        if city_filter:
-            hospitals_query = hospitals_query.filter(city__icontains=city_filter)
-        
-        hospitals = hospitals_query.all()
-        
-        # Group hospitals by city
-        cities_data = {}
-        total_inventory = {'A+': 0, 'A-': 0, 'B+': 0, 'B-': 0, 'AB+': 0, 'AB-': 0, 'O+': 0, 'O-': 0}
-        all_hospitals_data = []
-        
-        for hospital in hospitals:
-            city_name = hospital.city
-            if city_name not in cities_data:
-                cities_data[city_name] = {
-                    'inventory': {'A+': 0, 'A-': 0, 'B+': 0, 'B-': 0, 'AB+': 0, 'AB-': 0, 'O+': 0, 'O-': 0},
-                    'hospitals': [],
-                    'total_units': 0,
-                    'hospital_count': 0
-                }
-            
-            # Calculate hospital inventory
-            hospital_inventory = {}
-            hospital_total = 0
-            
-            for stock in hospital.hospital_blood_stock.all():
-                hospital_inventory[stock.blood_group] = stock.units_available
-                cities_data[city_name]['inventory'][stock.blood_group] += stock.units_available
-                total_inventory[stock.blood_group] += stock.units_available
-                hospital_total += stock.units_available
-            
-            # Fill missing blood groups with 0
-            for blood_type in total_inventory.keys():
-                if blood_type not in hospital_inventory:
-                    hospital_inventory[blood_type] = 0
-            
-            # Calculate distance if user location provided
-            distance = None
-            if user_lat and user_lng:
-                try:
-                    distance = hospital.calculate_distance(float(user_lat), float(user_lng))
-                except (ValueError, TypeError):
-                    distance = None
-            
-            hospital_data = {
-                'id': hospital.id,
-                'name': hospital.name,
-                'city': hospital.city,
-                'address': hospital.address,
-                'phone': hospital.phone,
-                'emergency_phone': hospital.emergency_phone,
-                'inventory': hospital_inventory,
-                'total_units': hospital_total,
-                'operates_24x7': hospital.operates_24x7,
-                'distance': f"{distance:.1f}" if distance else None
-            }
-            
-            cities_data[city_name]['hospitals'].append(hospital_data)
-            cities_data[city_name]['total_units'] += hospital_total
-            cities_data[city_name]['hospital_count'] += 1
-            all_hospitals_data.append(hospital_data)
-        
-        # Sort hospitals by distance if location provided
+        location = None
         if user_lat and user_lng:
-            all_hospitals_data.sort(key=lambda x: float(x['distance']) if x['distance'] else float('inf'))
-            for city in cities_data.values():
-                city['hospitals'].sort(key=lambda x: float(x['distance']) if x['distance'] else float('inf'))
+            try:
+                location = (float(user_lat), float(user_lng))
+            except (ValueError, TypeError):
+                location = None
+        
+        # Totals and the hospital list are cached until inventory changes; only
+        # the distance ordering is computed per request
+        snapshot = get_inventory_snapshot(city_filter)
+        total_inventory = snapshot['total_inventory']
+        
+        # Hospitals come a page at a time (nearest first), with a cursor for the next page
+        try:
+            limit = min(max(int(request.GET.get('limit', 0)), 0), getattr(settings, 'INVENTORY_MAX_PAGE_SIZE', 500))
+        except ValueError:
+            limit = 0
+        ranked = hospitals_by_distance(snapshot, *(location or (None, None)))
+        page_hospitals_data, next_cursor = page_hospitals(ranked, request.GET.get('cursor'), limit or None)
+        
+        # Totals cover every hospital; the per-city lists hold this page's hospitals
+        cities_data = {city: {**data, 'hospitals': []} for city, data in snapshot['cities'].items()}
+        for row in page_hospitals_data:
+            cities_data[row.city]['hospitals'].append(row)
         
         # Calculate statistics
         total_units = sum(total_inventory.values())
@@ -533,7 +530,7 @@ def api_live_inventory(request):
             'data': {
                 'total_inventory': total_inventory,
                 'total_units_available': total_units,
-                'total_hospitals': len(all_hospitals_data),
+                'total_hospitals': len(ranked),
                 'critical_blood_types': critical_blood_types,
                 'available_blood_types': available_blood_types,
                 'primary_city': primary_city,
@@ -549,9 +546,10 @@ def api_live_inventory(request):
         
         # Include detailed hospital list if requested
         if show_hospitals:
-            response_data['data']['hospitals'] = all_hospitals_data
+            response_data['data']['hospitals'] = page_hospitals_data
+            response_data['data']['next_cursor'] = next_cursor
         
-        return JsonResponse(response_data)
+        return FastJsonResponse(response_data)
         
     except Exception as e:
         logger.error(f"Error in api_live_inventory: {e}")
@@ -0,0 +1,10 @@
+"""
+Gunicorn server hooks
+Loaded automatically by gunicorn from the working directory
+"""
+
+
+def post_worker_init(worker):
+    # Open the pooled Twilio connection before the first emergency SMS needs it
+    from emergency.twilio_client import warm_twilio_client_async
+    warm_twilio_client_async()
@@ -10,6 +10,7 @@ from django.core.mail import send_mail
 from django.contrib.auth.models import User
 from blood import forms as bforms
 from blood import models as bmodels
+from blood.pagination import paginate_request
 from blood.services import BloodRequestService
 from django.contrib.auth import authenticate, login
 from django.contrib import messages
@@ -113,5 +114,5 @@ def make_request_view(request):
 
 def my_request_view(request):
     patient= models.Patient.objects.get(user_id=request.user.id)
-    blood_request=bmodels.BloodRequest.objects.all().filter(request_by_patient=patient)
+    blood_request=paginate_request(request,bmodels.BloodRequest.objects.filter(request_by_patient=patient),('-id',))
     return render(request,'patient/my_request.html',{'blood_request':blood_request})
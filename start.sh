@@ -70,5 +70,8 @@ echo "Collecting static files..."
 python manage.py collectstatic --noinput
 
 # Start the server
-echo "Starting Gunicorn server..."
-exec gunicorn bloodbankmanagement.wsgi:application --bind 0.0.0.0:$PORT --workers 3
\ No newline at end of file
+# ASGI workers serve HTTP and WebSockets; views run one at a time per worker, so
+# keep several. Set REDIS_URL so live updates reach clients on every worker
+export WEB_CONCURRENCY=${WEB_CONCURRENCY:-3}
+echo "Starting Gunicorn with $WEB_CONCURRENCY Uvicorn workers..."
+exec gunicorn bloodbankmanagement.asgi:application -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:$PORT
\ No newline at end of file
@@ -13,7 +13,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bloodbankmanagement.settings')
 django.setup()
 
 from emergency.services import NotificationService
-from emergency.models import EmergencyRequest
+from emergency.outbox import dispatch_outbox, stage_notification
 from django.utils import timezone
 
 def test_sms():
@@ -61,16 +61,20 @@ def test_sms():
     print(f"🏥 Hospitals Found: {len(hospitals)}")
     print()
     
-    # Send SMS
+    # Send SMS through the notification outbox
     try:
-        success = notification_service.send_emergency_sms(mock_request, hospitals)
+        message = notification_service._create_simple_sms_message(mock_request, hospitals)
+        notification = stage_notification(None, 'sms', 'SMS', mock_request.contact_phone, message)
+        dispatch_outbox()
+        notification.refresh_from_db()
+        success = notification.status == 'SENT'
         
         if success:
             print("🎉 SMS SENT SUCCESSFULLY!")
             print("📱 Check your phone for the emergency blood SMS!")
         else:
             print("❌ SMS FAILED")
-            print("Check the logs above for error details")
+            print(f"Status: {notification.status} - {notification.error_message or 'check the logs above'}")
     except Exception as e:
         print(f"❌ ERROR: {e}")
 